@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Compare the gevent client (doozer.client), the asyncio client
+(doozer.aio) and the threaded client (doozer.threaded).
+
+All run in this process against the same fake doozerd cluster, which
+is started in a separate process (python -m doozer.fakeserver) so its
+cost isn't charged to either client. Reports ops/sec and p50/p99/p999
+latency for GET and SET at several concurrency levels, as JSON records
+like benchmarks/client.py.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+sys.path.append(os.path.dirname(__file__) + "/..")
+
+import gevent
+
+from doozer import aio, threaded
+from doozer.client import Client
+from doozer.protocol import parse_uri
+
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def summarize(name, latencies, elapsed, **params):
+    latencies.sort()
+    record = {
+        'name': name,
+        'ops': len(latencies),
+        'ops_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'p999_ms': percentile(latencies, 0.999) * 1000,
+    }
+    record.update(params)
+    return record
+
+
+def bench_gevent(addrs, concurrencies, ops, value):
+    client = Client(list(addrs))
+    results = []
+    for concurrency in concurrencies:
+        prefix = '/backends/gevent/%d' % concurrency
+        for name, op in (('set', lambda i: client.set('%s/%d' % (prefix, i), value, 0)),
+                         ('get', lambda i: client.get('%s/%d' % (prefix, i)))):
+            latencies = []
+
+            def worker(start):
+                for i in range(start, ops, concurrency):
+                    began = time.time()
+                    op(i)
+                    latencies.append(time.time() - began)
+
+            began = time.time()
+            gevent.joinall([gevent.spawn(worker, i) for i in range(concurrency)],
+                           raise_error=True)
+            results.append(summarize(name, latencies, time.time() - began,
+                                     backend='gevent', concurrency=concurrency))
+    client.disconnect()
+    return results
+
+
+async def bench_asyncio(addrs, concurrencies, ops, value):
+    client = aio.Client(list(addrs))
+    await client.connect()
+    results = []
+    for concurrency in concurrencies:
+        prefix = '/backends/asyncio/%d' % concurrency
+        for name, op in (('set', lambda i: client.set('%s/%d' % (prefix, i), value, 0)),
+                         ('get', lambda i: client.get('%s/%d' % (prefix, i)))):
+            latencies = []
+
+            async def worker(start):
+                for i in range(start, ops, concurrency):
+                    began = time.time()
+                    await op(i)
+                    latencies.append(time.time() - began)
+
+            began = time.time()
+            await asyncio.gather(*[worker(i) for i in range(concurrency)])
+            results.append(summarize(name, latencies, time.time() - began,
+                                     backend='asyncio', concurrency=concurrency))
+    client.disconnect()
+    return results
+
+
+def bench_threaded(addrs, concurrencies, ops, value):
+    client = threaded.Client(list(addrs))
+    results = []
+    for concurrency in concurrencies:
+        prefix = '/backends/threaded/%d' % concurrency
+        for name, op in (('set', lambda i: client.set('%s/%d' % (prefix, i), value, 0)),
+                         ('get', lambda i: client.get('%s/%d' % (prefix, i)))):
+            latencies = []
+
+            def worker(start):
+                for i in range(start, ops, concurrency):
+                    began = time.time()
+                    op(i)
+                    latencies.append(time.time() - began)
+
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+            began = time.time()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            results.append(summarize(name, latencies, time.time() - began,
+                                     backend='threaded', concurrency=concurrency))
+    client.disconnect()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--concurrency', default='1,16,128')
+    parser.add_argument('--ops', type=int, default=5000)
+    parser.add_argument('--value-size', type=int, default=64)
+    parser.add_argument('--uri', help='benchmark against this cluster instead')
+    parser.add_argument('--output', help='write results here instead of stdout')
+    args = parser.parse_args()
+
+    server = None
+    uri = args.uri
+    if not uri:
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'doozer.fakeserver'], stdout=subprocess.PIPE,
+            cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+        uri = server.stdout.readline().decode().strip()
+
+    addrs = parse_uri(uri)
+    concurrencies = [int(c) for c in args.concurrency.split(',')]
+    value = b'x' * args.value_size
+    try:
+        results = bench_gevent(addrs, concurrencies, args.ops, value)
+        results += asyncio.run(bench_asyncio(addrs, concurrencies, args.ops, value))
+        results += bench_threaded(addrs, concurrencies, args.ops, value)
+    finally:
+        if server:
+            server.terminate()
+
+    output = json.dumps({'results': results}, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
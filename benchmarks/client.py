@@ -0,0 +1,168 @@
+#!/usr/bin/python
+"""
+Client throughput and latency benchmarks against an in-process fake
+doozerd cluster (doozer.fakeserver).
+
+Reports ops/sec and p50/p99/p999 latency per verb across concurrency
+levels, value sizes and tree sizes, plus the time to recover from a
+dropped connection and from a node going down. Results are written as
+JSON, one record per measurement, so runs can be diffed between
+releases. The server runs in the same process, so absolute numbers
+include its cost too; compare runs on the same machine.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(__file__) + "/..")
+
+import gevent
+
+from doozer import fakeserver
+from doozer.client import Client
+
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def summarize(name, latencies, elapsed, **params):
+    latencies.sort()
+    record = {
+        'name': name,
+        'ops': len(latencies),
+        'ops_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'p999_ms': percentile(latencies, 0.999) * 1000,
+    }
+    record.update(params)
+    return record
+
+
+def run(concurrency, ops, op):
+    """Run op(i) `ops` times spread over `concurrency` greenlets"""
+    latencies = []
+
+    def worker(start):
+        for i in range(start, ops, concurrency):
+            began = time.time()
+            op(i)
+            latencies.append(time.time() - began)
+
+    began = time.time()
+    gevent.joinall([gevent.spawn(worker, i) for i in range(concurrency)], raise_error=True)
+    return latencies, time.time() - began
+
+
+def bench_verbs(client, concurrencies, value_sizes, ops):
+    results = []
+    for size in value_sizes:
+        value = 'x' * size
+        for concurrency in concurrencies:
+            prefix = '/bench/%d/%d' % (size, concurrency)
+            revs = {}
+
+            def set_op(i):
+                revs[i] = client.set('%s/%d' % (prefix, i), value, 0).rev
+
+            def get_op(i):
+                client.get('%s/%d' % (prefix, i))
+
+            def stat_op(i):
+                client.stat('%s/%d' % (prefix, i), None)
+
+            for name, op in (('set', set_op), ('get', get_op), ('stat', stat_op)):
+                latencies, elapsed = run(concurrency, ops, op)
+                results.append(summarize(name, latencies, elapsed,
+                                         concurrency=concurrency, value_size=size))
+    return results
+
+
+def bench_wait(client, ops):
+    """Latency from a SET to the WAIT that observes it"""
+    latencies = []
+    rev = client.rev().rev
+    began = time.time()
+    for i in range(ops):
+        future = client.wait_async('/bench/wait', rev + 1)
+        start = time.time()
+        rev = client.set('/bench/wait', str(i), -1).rev
+        future.get()
+        latencies.append(time.time() - start)
+    return [summarize('wait', latencies, time.time() - began, concurrency=1)]
+
+
+def bench_walk(client, tree_sizes, repeat):
+    results = []
+    for size in tree_sizes:
+        prefix = '/tree/%d' % size
+        for i in range(size):
+            client.set_async('%s/%d/%d' % (prefix, i % 100, i), 'v', 0)
+        client.rev()
+
+        for name, op in (('walk', lambda i: client.walk(prefix + '/**')),
+                         ('getdir', lambda i: client.getdir(prefix))):
+            latencies, elapsed = run(1, repeat, op)
+            results.append(summarize(name, latencies, elapsed, tree_size=size))
+    return results
+
+
+def bench_recover(cluster, client, concurrency, repeat):
+    """Time from losing the connection until requests complete again"""
+    results = []
+    for name in ('drop', 'failover'):
+        latencies = []
+        for i in range(repeat):
+            node = cluster.nodes[cluster.addrs.index(client.connection.address)]
+            workers = [gevent.spawn(client.get, '/bench/recover') for j in range(concurrency)]
+            began = time.time()
+            if name == 'drop':
+                node.drop_connections()
+            else:
+                node.stop()
+            gevent.joinall(workers, raise_error=True)
+            latencies.append(time.time() - began)
+            if name == 'failover':
+                node.start()
+        results.append(summarize('recover_' + name, latencies, sum(latencies),
+                                 concurrency=concurrency))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--concurrency', default='1,16,128')
+    parser.add_argument('--value-sizes', default='16,1024,65536')
+    parser.add_argument('--tree-sizes', default='100,1000,10000')
+    parser.add_argument('--ops', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='latency added by the fake server (seconds)')
+    parser.add_argument('--output', help='write results here instead of stdout')
+    args = parser.parse_args()
+
+    cluster = fakeserver.Cluster(3, latency=args.latency)
+    client = Client(cluster.addrs)
+
+    results = []
+    results += bench_verbs(client, [int(c) for c in args.concurrency.split(',')],
+                           [int(s) for s in args.value_sizes.split(',')], args.ops)
+    results += bench_wait(client, args.ops)
+    results += bench_walk(client, [int(s) for s in args.tree_sizes.split(',')], args.repeat)
+    results += bench_recover(cluster, client, 16, args.repeat)
+
+    client.disconnect()
+    cluster.stop()
+
+    output = json.dumps({'results': results}, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
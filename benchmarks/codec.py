@@ -0,0 +1,59 @@
+#!/usr/bin/python
+"""
+Compare the hand-written codec (doozer.codec) with the protobuf library
+classes (doozer.msg_pb2) on the work a Connection does per message:
+building and serializing a Request, and parsing a Response and checking
+it for an error code.
+
+Run with PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=python to compare
+against the pure-Python protobuf backend.
+"""
+import os
+import sys
+import timeit
+sys.path.append(os.path.dirname(__file__) + "/..")
+
+from google.protobuf.internal import api_implementation
+
+from doozer import codec
+from doozer import msg_pb2
+
+
+def encode(module):
+    def run():
+        request = module.Request(path='/config/service/key', verb=module.Request.GET)
+        request.tag = 1234
+        request.rev = 56789
+        return request.SerializeToString()
+    return run
+
+
+def decode(module, data):
+    def run():
+        response = module.Response()
+        response.ParseFromString(data)
+        return response.HasField('err_code')
+    return run
+
+
+def wait_response(size):
+    return msg_pb2.Response(tag=1234, flags=4, rev=56789, path=u'/config/service/key',
+                            value=b'x' * size).SerializeToString()
+
+
+def bench(function, number=100000):
+    return min(timeit.repeat(function, number=number, repeat=3)) / number * 1e6
+
+
+if __name__ == '__main__':
+    print("protobuf implementation: %s" % api_implementation.Type())
+    cases = [('encode GET', lambda module: encode(module))]
+    for size in (0, 100, 10000):
+        data = wait_response(size)
+        cases.append(('decode %d byte value' % size,
+                      lambda module, data=data: decode(module, data)))
+    for name, case in cases:
+        fast = bench(case(codec))
+        protobuf = bench(case(msg_pb2))
+        print("%-24s codec %6.2f us   protobuf %6.2f us   (%.1fx)" % (
+            name, fast, protobuf, protobuf / fast))
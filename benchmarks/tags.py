@@ -0,0 +1,43 @@
+#!/usr/bin/python
+"""
+Measure the cost of Connection.send_async() as the number of requests
+already in flight grows. Nothing is sent over the network; packets go
+to a socket that discards them, so only tag allocation, serialization
+and pending-table bookkeeping are timed.
+"""
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(__file__) + "/..")
+
+from doozer.client import Connection, Request
+
+
+class NullSocket(object):
+    def send(self, data):
+        return len(data)
+
+    def sendall(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+def bench(in_flight, samples=2000):
+    connection = Connection()
+    connection.sock = NullSocket()
+    connection.ready.set()
+    for i in range(in_flight):
+        connection.send_async(Request(path="/fill", verb=Request.GET))
+
+    start = time.time()
+    for i in range(samples):
+        future = connection.send_async(Request(path="/bench", verb=Request.GET))
+        connection.discard(future)
+    return (time.time() - start) / samples
+
+
+if __name__ == '__main__':
+    for in_flight in (1, 10, 100, 1000, 10000):
+        print("%6d in flight: %6.2f us/send" % (in_flight, bench(in_flight) * 1e6))
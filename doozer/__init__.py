@@ -1,3 +1,7 @@
-from client import connect
+try:
+    from .client import connect
+except ImportError:
+    # No gevent; the asyncio client (doozer.aio) doesn't need it
+    pass
 
 __version__ = '0.2.2'
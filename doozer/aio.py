@@ -0,0 +1,509 @@
+"""
+asyncio client for doozerd (Python 3).
+
+It speaks the same protocol as the gevent client in doozer.client and
+shares its messages, errors and Entity results (doozer.protocol), but
+runs on an asyncio event loop:
+
+    client = await doozer.aio.connect(uri)
+    entity = await client.get('/path')
+
+Every verb returns an awaitable future as soon as the request is
+queued, so any number of requests can be in flight at once, e.g. with
+asyncio.gather(). Awaiting a verb under asyncio.wait_for() or
+cancelling it drops the request; doozerd still carries it out.
+"""
+import asyncio
+import collections
+import logging
+import os
+import struct
+import time
+
+from .protocol import (
+    DEFAULT_RETRY_WAIT, DEFAULT_URI, ENTITY_VERBS, HEALTH_TIMEOUT, LIST_WINDOW,
+    REQUEST_TIMEOUT, BaseClient, BaseConnection, BaseWatch, ConnectError,
+    ConnectionLost, DecodeError, Entity, Response, ResponseError, Return, Sleep,
+    Subscription, TooLate, flatten_steps, pack_request, parse_uri,
+    response_exception, retry_wait, split_addr)
+
+
+async def connect(uri=None, timeout=None, **kwargs):
+    """
+    Start a Doozer client connection
+
+    @param uri: str|None, Doozer URI
+    @param timeout: float|None, connection timeout in seconds (per address)
+    @param kwargs: further options for the Connection
+    """
+    uri = uri or os.environ.get("DOOZER_URI", DEFAULT_URI)
+    addrs = parse_uri(uri)
+    if not addrs:
+        raise ValueError("there were no addrs supplied in the uri (%s)" % uri)
+    client = Client(addrs, timeout, **kwargs)
+    await client.connect()
+    return client
+
+
+class PendingRequest(asyncio.Future):
+    """
+    The asyncio counterpart of doozer.client.PendingRequest.
+
+    Awaiting it returns the Response (an Entity for ENTITY_VERBS), or
+    raises the ResponseError matching its err_code.
+    """
+
+    def __init__(self, connection, request, packet, retry=True, timeout=None):
+        asyncio.Future.__init__(self, loop=connection.loop)
+        self.connection = connection
+        self.request = request
+        self.packet = packet
+        self.retry = retry
+        """Whether to resend the request if the connection is replaced"""
+        self.timeout = timeout
+        self.timer = None
+
+    def resolve(self, response):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.done():
+            return
+        exception = response_exception(response)
+        if exception:
+            self.set_exception(exception(response, self.request))
+        elif self.request.verb in ENTITY_VERBS:
+            self.set_result(Entity.from_response(response, self.request))
+        else:
+            self.set_result(response)
+
+    def discard(self):
+        """Stop waiting for the response; a late one is ignored"""
+        self.connection.discard(self)
+        if self.done() and not self.cancelled():
+            # Nobody will look at an error it came back with
+            self.exception()
+
+    def cancel(self, *args):
+        self.discard()
+        return asyncio.Future.cancel(self, *args)
+
+
+class _Protocol(asyncio.Protocol):
+    """Frames responses off one transport for its Connection"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.transport = None
+        self.chunks = []
+        """Data of an incomplete frame"""
+        self.buffered = 0
+        self.needed = 4
+        """Bytes needed before the buffered frame is complete"""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.connection._lost(self, exc)
+
+    def data_received(self, data):
+        self.connection.received = time.time()
+        if self.chunks:
+            # Only join the pieces of a frame once all of it is here
+            self.chunks.append(data)
+            self.buffered += len(data)
+            if self.buffered < self.needed:
+                return
+            data = b''.join(self.chunks)
+            self.chunks = []
+
+        view = memoryview(data)
+        start = 0
+        end = len(data)
+        dispatch = self.connection._dispatch
+        try:
+            while True:
+                if end - start < 4:
+                    self.needed = 4
+                    break
+                length = struct.unpack_from(">I", data, start)[0]
+                frame_end = start + 4 + length
+                if frame_end > end:
+                    self.needed = 4 + length
+                    break
+                response = Response()
+                response.ParseFromString(view[start + 4:frame_end])
+                start = frame_end
+                dispatch(response)
+        except DecodeError as e:
+            self.connection._logger.warning('Bad response (%s)', e)
+            self.transport.close()
+            return
+
+        if start < end:
+            self.chunks = [data[start:]]
+            self.buffered = end - start
+
+
+class Connection(BaseConnection):
+    def __init__(self, addrs=None, timeout=None, metrics=None, shuffle=True,
+                 health_timeout=HEALTH_TIMEOUT):
+        """
+        @param timeout: float|None, connection timeout in seconds (per address)
+        @param metrics: doozer.metrics.Metrics|None, where to record
+            retransmits, lost requests and update() retries
+        @param shuffle: bool, randomize the order addrs are tried in
+        @param health_timeout: float|None, as for doozer.client.Connection
+        """
+        self._logger = logging.getLogger('pydoozer.aio.Connection')
+        BaseConnection.__init__(self, addrs, timeout, metrics, shuffle, health_timeout)
+
+        self.loop = None
+        self.flushing = False
+        self.protocol = None
+        self.reconnecting = None
+        """Task of the reconnect in progress, if any"""
+        self.checker = None
+        """Timer handle of the next health check"""
+
+    async def connect(self):
+        self.loop = asyncio.get_running_loop()
+        await self.reconnect()
+
+    def reconnect(self):
+        """
+        Reconnect to the cluster. Returns the reconnect task, which
+        everyone that notices the same failure shares.
+        """
+        if self.reconnecting is None:
+            self.reconnecting = self.loop.create_task(self._reconnect())
+            self.reconnecting.add_done_callback(self._reconnected)
+        return self.reconnecting
+
+    def _reconnected(self, task):
+        self.reconnecting = None
+        if not task.cancelled() and task.exception() is not None:
+            self._logger.error('Could not reconnect (%s)', task.exception())
+
+    async def _reconnect(self):
+        failed = self.address
+        self.disconnect()
+
+        try:
+            for wait, addr in self._attempts(failed):
+                if wait:
+                    await asyncio.sleep(wait)
+                host, port = split_addr(addr)
+                try:
+                    transport, protocol = await asyncio.wait_for(
+                        self.loop.create_connection(lambda: _Protocol(self), host, port),
+                        self.timeout)
+                except (OSError, asyncio.TimeoutError) as e:
+                    self._logger.info('Failed to connect to %s:%s (%s)', host, port, e)
+                    continue
+                self.address = "%s:%s" % (host, port)
+                self.protocol = protocol
+                self.received = time.time()
+                if self.health_timeout:
+                    self.checker = self.loop.call_later(self.health_timeout / 2.0,
+                                                        self._health_check)
+                for future in self._retransmit_pending():
+                    future.set_exception(ConnectionLost(future.request))
+                if self.outgoing and not self.flushing:
+                    self.flushing = True
+                    self.loop.call_soon(self._flush)
+                return
+        except ConnectError as e:
+            # Nothing in flight will be answered now
+            pending, self.pending = self.pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            raise
+
+    def disconnect(self):
+        if self.checker is not None:
+            self.checker.cancel()
+            self.checker = None
+        protocol, self.protocol = self.protocol, None
+        if protocol is not None and protocol.transport is not None:
+            protocol.transport.close()
+        self.address = None
+
+    def _health_check(self):
+        self.checker = self.loop.call_later(self.health_timeout / 2.0, self._health_check)
+        if not self._check_health(time.time()):
+            self._logger.warning('%s stopped responding, reconnecting', self.address)
+            self.reconnect()
+
+    def _lost(self, protocol, exc):
+        if protocol is not self.protocol:
+            # Closed on purpose
+            return
+        self._logger.warning('Lost connection? (%s)', exc)
+        self.reconnect()
+
+    async def send(self, request, retry=True, timeout=REQUEST_TIMEOUT):
+        """
+        Send a request and wait for its response.
+
+        @param request: Request, request to send
+        @param retry: bool, resend the request if the connection is
+            replaced before it's answered
+        @param timeout: float|None, seconds to wait for the response
+        """
+        return await self.send_async(request, retry, timeout)
+
+    def send_async(self, request, retry=True, timeout=None):
+        """
+        Send a request without waiting for its response.
+
+        Returns a PendingRequest. If no response has arrived after
+        `timeout` seconds it fails with asyncio.TimeoutError, leaving the
+        connection alone; see doozer.client.Connection.send_async().
+
+        @param request: Request, request to send
+        @param retry: bool, resend the request if the connection is
+            replaced before it's answered
+        @param timeout: float|None, seconds to wait for the response
+            (default: no limit)
+        """
+        request.tag = self._allocate_tag()
+        packet = pack_request(request)
+        future = self.pending[request.tag] = PendingRequest(self, request, packet,
+                                                            retry, timeout)
+        if timeout is not None:
+            future.timer = self.loop.call_later(timeout, self._expire, future)
+        self._send_pack(packet)
+        return future
+
+    def _expire(self, future):
+        future.timer = None
+        if self.pending.get(future.request.tag) is future:
+            del self.pending[future.request.tag]
+            future.set_exception(asyncio.TimeoutError())
+
+    def discard(self, future):
+        """
+        As doozer.client.Connection.discard().
+
+        @param future: PendingRequest, as returned by send_async()
+        """
+        if self.pending.get(future.request.tag) is future:
+            del self.pending[future.request.tag]
+        if future.timer is not None:
+            future.timer.cancel()
+            future.timer = None
+
+    def _send_pack(self, packet):
+        # Everything queued in one pass of the event loop goes out in
+        # a single write
+        self.outgoing.append(packet)
+        if not self.flushing:
+            self.flushing = True
+            self.loop.call_soon(self._flush)
+
+    def _flush(self):
+        self.flushing = False
+        if self.protocol is None:
+            # The new connection resends what's pending. If the last
+            # reconnect gave up (or we were disconnected), this request
+            # tries again.
+            if self.reconnecting is None:
+                self.reconnect()
+            return
+        packets, self.outgoing = self.outgoing, []
+        self.protocol.transport.write(b''.join(packets))
+
+    def _dispatch(self, response):
+        future = self.pending.pop(response.tag, None)
+        if future is not None:
+            future.resolve(response)
+
+
+class Watch(BaseWatch):
+    """
+    A WAIT chain on one glob, fanned out to its subscribers by a task
+    of its own; see doozer.client.Watch.
+    """
+
+    def __init__(self, client, glob, rev):
+        self._logger = logging.getLogger('pydoozer.aio.Watch')
+        BaseWatch.__init__(self, client, glob, rev)
+        self.task = client.connection.loop.create_task(self._loop())
+
+    def stop(self):
+        self._unregister()
+        if self.task and self.task is not asyncio.current_task():
+            self.task.cancel()
+        self.task = None
+        if self.future:
+            self.future.cancel()
+            self.future = None
+
+    async def _loop(self):
+        wait = None
+        try:
+            while self.subscribers:
+                try:
+                    change = await self._next()
+                except Exception as e:
+                    # Sent again from the same rev, as in doozer.client.Watch
+                    base = self.client.connection.timeout or DEFAULT_RETRY_WAIT
+                    wait = retry_wait(base, wait or base)
+                    self._logger.warning('Error watching %s (%s), retrying in %.1fs',
+                                         self.glob, e, wait)
+                    await asyncio.sleep(wait)
+                    continue
+                wait = None
+                if change is not None:
+                    self._deliver(change)
+        finally:
+            self.stop()
+
+    async def _next(self):
+        """As doozer.client.Watch._next()"""
+        self.future = self.client.wait(self.glob, self.rev)
+        try:
+            return await self.future
+        except TooLate as e:
+            self._skipped(e, (await self.client.rev()).rev)
+            return None
+
+
+class Client(BaseClient):
+    """
+    The verbs of doozer.client.Client, each returning an awaitable.
+
+    Every verb takes a timeout in seconds (None to wait indefinitely);
+    WAIT waits indefinitely by default.
+    """
+
+    def __init__(self, addrs=None, timeout=None, **kwargs):
+        """
+        @param timeout: float|None, connection timeout in seconds (per address)
+        @param kwargs: further options for the Connection
+        """
+        if addrs is None:
+            addrs = []
+        self.connection = Connection(addrs, timeout, **kwargs)
+        self.metrics = self.connection.metrics
+        self.watches = {}
+        """Shared WAIT chains: glob -> Watch"""
+
+    async def connect(self):
+        await self.connection.connect()
+
+    def disconnect(self):
+        """Close the connection; every watch stops"""
+        for watch in list(self.watches.values()):
+            watch.stop()
+        self.connection.disconnect()
+
+    async def watch(self, path, rev=None, callback=None, errback=None):
+        """
+        Subscribe to changes matching a glob, as doozer.client.Client.watch().
+
+        The callbacks are called from the Watch's own task, one change
+        at a time in revision order.
+
+        @return: Subscription, call cancel() on it to unsubscribe
+        """
+        if rev is None:
+            rev = (await self.rev()).rev + 1
+        watch = self.watches.get(path)
+        if watch is None:
+            watch = self.watches[path] = Watch(self, path, rev)
+        elif rev < watch.rev:
+            # Replays the backlog on a chain of its own
+            watch = Watch(self, path, rev)
+        subscription = Subscription(watch, rev, callback, errback)
+        watch.subscribers.append(subscription)
+        return subscription
+
+    def _send(self, request, retry=True, timeout=REQUEST_TIMEOUT):
+        return self.connection.send_async(request, retry, timeout)
+
+    # The futures BaseClient's *_async verbs return are awaitable
+    rev = BaseClient.rev_async
+    set = BaseClient.set_async
+    get = BaseClient.get_async
+    delete = BaseClient.delete_async
+    wait = BaseClient.wait_async
+    stat = BaseClient.stat_async
+    access = BaseClient.access_async
+    _getdir = BaseClient._getdir_async
+    _walk = BaseClient._walk_async
+
+    async def _run(self, steps):
+        """BaseClient._run(), awaiting each future instead of blocking on it"""
+        steps = flatten_steps(steps)
+        result = exception = None
+        while True:
+            try:
+                if exception is None:
+                    step = steps.send(result)
+                else:
+                    step = steps.throw(exception)
+            except Return as e:
+                return e.value
+            result = exception = None
+            try:
+                if isinstance(step, Sleep):
+                    await asyncio.sleep(step.seconds)
+                else:
+                    result = await step
+            except BaseException as e:
+                exception = e
+
+    async def _ilist(self, send, path, offset=None, rev=None, window=LIST_WINDOW,
+                     timeout=REQUEST_TIMEOUT):
+        offset = offset or 0
+        # Pinned to one revision, with a window growing from one
+        # request, as in BaseClient._ilist()
+        if not rev:
+            rev = (await self.rev(timeout)).rev
+
+        pending = collections.deque([send(path, offset, rev, timeout)])
+        offset += 1
+        size = 1
+        try:
+            while True:
+                future = pending.popleft()
+                try:
+                    response = await future
+                except ResponseError as e:
+                    if e.code == Response.RANGE:
+                        return
+                    raise
+                size = min(size + 1, window)
+                while len(pending) < size:
+                    pending.append(send(path, offset, rev, timeout))
+                    offset += 1
+                yield response
+        finally:
+            for future in pending:
+                future.discard()
+
+    def iwalk(self, path, offset=None, rev=None, window=LIST_WINDOW,
+              timeout=REQUEST_TIMEOUT):
+        """
+        Async iterator over walk()'s entries as they arrive, with at
+        most `window` requests read ahead.
+        """
+        return self._ilist(self._walk, path, offset, rev, window, timeout)
+
+    def igetdir(self, path, offset=None, rev=None, window=LIST_WINDOW,
+                timeout=REQUEST_TIMEOUT):
+        """
+        Async iterator over getdir()'s entries as they arrive, with at
+        most `window` requests read ahead.
+        """
+        return self._ilist(self._getdir, path, offset, rev, window, timeout)
+
+    async def walk(self, path, offset=None, rev=None, timeout=REQUEST_TIMEOUT):
+        return [entity async for entity in self.iwalk(path, offset, rev, timeout=timeout)]
+
+    async def getdir(self, path, offset=None, rev=None, timeout=REQUEST_TIMEOUT):
+        return [entity async for entity in self.igetdir(path, offset, rev, timeout=timeout)]
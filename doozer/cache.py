@@ -0,0 +1,152 @@
+import collections
+import logging
+
+import gevent
+
+from .client import DEFAULT_RETRY_WAIT, REQUEST_TIMEOUT, TooLate, retry_wait
+
+DEFAULT_CACHE_SIZE = 4096
+"""Default maximum number of cached reads"""
+
+
+class Cache(object):
+    """
+    Local read cache around a Client.
+
+    get(), stat() and getdir() for paths under the watched subtree are
+    served from memory. A WAIT chain on the subtree invalidates entries
+    as changes arrive, so every cached read reflects all changes up to
+    and including `rev`, the last revision the cache has observed.
+    Reads pinned to a rev, paths outside the subtree and every other
+    Client method go straight to the client, and so does every read
+    while the WAIT chain is failing.
+    """
+
+    def __init__(self, client, glob='/**', size=DEFAULT_CACHE_SIZE):
+        """
+        @param client: Client, client to read through
+        @param glob: str, subtree to cache, in the form '/path/**'
+        @param size: int, maximum number of cached reads (LRU evicted)
+        """
+        if not glob.endswith('/**'):
+            raise ValueError("cache glob must cover a subtree ('/path/**')")
+        self._logger = logging.getLogger('pydoozer.Cache')
+
+        self.client = client
+        self.glob = glob
+        self.prefix = glob[:-3]
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.rev = None
+        """Last revision observed by the watcher; None while it isn't watching"""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.watcher = None
+        self.future = None
+        """The watcher's pending WAIT"""
+        self.start()
+
+    def start(self):
+        self.stop()
+        self.rev = self.client.rev().rev
+        self.watcher = gevent.spawn(self._watch_loop)
+
+    def stop(self):
+        if self.watcher:
+            self.watcher.kill()
+            self.watcher = None
+        if self.future:
+            self.future.discard()
+            self.future = None
+        self._reset()
+
+    def get(self, path, rev=None, timeout=REQUEST_TIMEOUT):
+        if rev:
+            return self.client.get(path, rev, timeout)
+        return self._read('get', path, self.client.get, path, None, timeout)
+
+    def stat(self, path, rev=None, timeout=REQUEST_TIMEOUT):
+        if rev:
+            return self.client.stat(path, rev, timeout)
+        return self._read('stat', path, self.client.stat, path, None, timeout)
+
+    def getdir(self, path, offset=None, rev=None, timeout=REQUEST_TIMEOUT):
+        if offset or rev:
+            return self.client.getdir(path, offset, rev, timeout)
+        return self._read('getdir', path, self.client.getdir, path, None, None, timeout)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _covers(self, path):
+        return path == self.prefix or path.startswith(self.prefix + '/')
+
+    def _read(self, kind, path, method, *args):
+        if self.rev is None or not self._covers(path):
+            return method(*args)
+
+        key = (kind, path)
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            pass
+        else:
+            self.entries[key] = value
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        rev = self.rev
+        value = method(*args)
+        # If a change arrived while the read was in flight, the value
+        # may predate it; return it but don't cache it.
+        if self.rev == rev:
+            self.entries[key] = value
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def _invalidate(self, path):
+        self.entries.pop(('get', path), None)
+        self.entries.pop(('stat', path), None)
+        # A change can add or remove children all the way up
+        while path != self.prefix and '/' in path:
+            path = path.rsplit('/', 1)[0]
+            self.entries.pop(('stat', path or '/'), None)
+            self.entries.pop(('getdir', path or '/'), None)
+
+    def _watch_loop(self):
+        wait = None
+        try:
+            while True:
+                try:
+                    if self.rev is None:
+                        self.rev = self.client.rev().rev
+                    self.future = self.client.wait_async(self.glob, self.rev + 1)
+                    change = self.future.get()
+                except TooLate:
+                    # The changes since self.rev are gone; start over.
+                    self._logger.warning('Cache fell behind, clearing it')
+                    self._reset()
+                    continue
+                except Exception as e:
+                    # Nothing would invalidate the entries now, so read
+                    # through to the client until the watch is back.
+                    self._reset()
+                    base = self.client.connection.timeout or DEFAULT_RETRY_WAIT
+                    wait = retry_wait(base, wait or base)
+                    self._logger.warning('Error watching %s (%s), bypassing the cache '
+                                         'for %.1fs', self.glob, e, wait)
+                    gevent.sleep(wait)
+                    continue
+                wait = None
+                self._invalidate(change.path)
+                self.rev = change.rev
+        finally:
+            self._reset()
+
+    def _reset(self):
+        self.entries.clear()
+        self.rev = None
@@ -1,129 +1,149 @@
 import logging
 import os
-import random
 import struct
+import time
 
 import gevent
 import gevent.event
 import gevent.socket
 
-from msg_pb2 import Response
-from msg_pb2 import Request
+from .protocol import (
+    CODEC, DEFAULT_RETRY_WAIT, DEFAULT_URI, ENTITY_VERBS, FLAG_DEL, FLAG_SET,
+    HEALTH_TIMEOUT, LIST_WINDOW, RECV_BUFFER_SIZE, REQUEST_TIMEOUT,
+    RETRY_ROUNDS, VERB_NAMES, BadPath, Cancelled, BaseClient, BaseConnection,
+    BaseWatch, ConnectError, ConnectionLost, DecodeError, Entity, IsDirectory,
+    MissingArg, NoEntity, NotDirectory, Range, Readonly, Request,
+    RequestFailed, Response, ResponseBuffer, ResponseError, RevMismatch,
+    Subscription, TagInUse, TooLate, UnknownVerb, compile_glob, pack_request,
+    parse_uri, pb_dict, response_exception, retry_wait, split_addr)
 
-REQUEST_TIMEOUT = 2.0
+PROBE_TIMEOUT = 1.0
+"""Seconds before a node probe counts as failed"""
 
-DEFAULT_RETRY_WAIT = 2.0
-"""Default connection retry waiting time (seconds)"""
-
-DEFAULT_URI = "doozer:?%s" % "&".join([
-    "ca=127.0.0.1:8046",
-    "ca=127.0.0.1:8041",
-    "ca=127.0.0.1:8042",
-    "ca=127.0.0.1:8043",
-    ])
+PROBE_ALPHA = 0.3
+"""Weight of a new probe sample in a node's round-trip estimate"""
 
 _spawner = gevent.spawn
 
 
-class ConnectError(Exception): pass
-class ResponseError(Exception):
-    def __init__(self, response, request):
-        self.code = response.err_code
-        self.detail = response.err_detail
-        self.response = response
-        self.request = request
+def _recv_exactly(sock, length):
+    data = []
+    while length:
+        chunk = sock.recv(length)
+        if not chunk:
+            raise IOError('connection closed by server')
+        data.append(chunk)
+        length -= len(chunk)
+    return b''.join(data)
+
 
-    def __str__(self):
-        return str(pb_dict(self.request))
-
-class TagInUse(ResponseError): pass
-class UnknownVerb(ResponseError): pass
-class Readonly(ResponseError): pass
-class TooLate(ResponseError): pass
-class RevMismatch(ResponseError): pass
-class BadPath(ResponseError): pass
-class MissingArg(ResponseError): pass
-class Range(ResponseError): pass
-class NotDirectory(ResponseError): pass
-class IsDirectory(ResponseError): pass
-class NoEntity(ResponseError): pass
-
-
-def response_exception(response):
-    """Takes a response, returns proper exception if it has an error code"""
-    exceptions = {
-        Response.TAG_IN_USE: TagInUse, Response.UNKNOWN_VERB: UnknownVerb,
-        Response.READONLY: Readonly, Response.TOO_LATE: TooLate, 
-        Response.REV_MISMATCH: RevMismatch, Response.BAD_PATH: BadPath,
-        Response.MISSING_ARG: MissingArg, Response.RANGE: Range,
-        Response.NOTDIR: NotDirectory, Response.ISDIR: IsDirectory,
-        Response.NOENT: NoEntity, }
-    if 'err_code' in [field.name for field, value in response.ListFields()]:
-        return exceptions[response.err_code]
-    else:
-        return None
-
-
-def pb_dict(message):
-    """Create dict representation of a protobuf message"""
-    return dict([(field.name, value) for field, value in message.ListFields()])
-
-
-def parse_uri(uri):
-    """Parse the doozerd URI scheme to get node addresses"""
-    if uri.startswith("doozer:?"):
-        before, params = uri.split("?", 1)
-        addrs = []
-        for param in params.split("&"):
-            key, value = param.split("=", 1)
-            if key == "ca":
-                addrs.append(value)
-        return addrs
-    else:
-        raise ValueError("invalid doozerd uri")
-
-
-def connect(uri=None, timeout=None):
+def connect(uri=None, timeout=None, **kwargs):
     """
     Start a Doozer client connection
 
     @param uri: str|None, Doozer URI
     @param timeout: float|None, connection timeout in seconds (per address)
+    @param kwargs: further options for the Connection
     """
 
     uri = uri or os.environ.get("DOOZER_URI", DEFAULT_URI)
     addrs = parse_uri(uri)
     if not addrs:
         raise ValueError("there were no addrs supplied in the uri (%s)" % uri)
-    return Client(addrs, timeout)
+    return Client(addrs, timeout, **kwargs)
+
+
+class PendingRequest(gevent.event.AsyncResult):
+    """
+    Future for a request in flight on a Connection.
 
+    get() returns the Response (an Entity for ENTITY_VERBS), or raises
+    the ResponseError matching its err_code.
+    """
+
+    sent = None
+    """When the request was sent, if the connection keeps metrics"""
+
+    def __init__(self, connection, request, packet, retry=True, timeout=None):
+        gevent.event.AsyncResult.__init__(self)
+        self.connection = connection
+        self.request = request
+        self.packet = packet
+        self.retry = retry
+        """Whether to resend the request if the connection is replaced"""
+        self.timeout = timeout
 
-class Connection(object):
-    def __init__(self, addrs=None, timeout=None):
+    def resolve(self, response):
+        exception = response_exception(response)
+        if exception:
+            self.set_exception(exception(response, self.request))
+        elif self.request.verb in ENTITY_VERBS:
+            self.set(Entity.from_response(response, self.request))
+        else:
+            self.set(response)
+
+    def discard(self):
+        """Stop waiting for the response; a late one is ignored"""
+        self.connection.discard(self)
+
+    def cancel(self):
+        """
+        Stop waiting for the response and make get() raise Cancelled.
+
+        The node still carries out the request (doozerd has no way to
+        cancel one); only the response is dropped.
+        """
+        if not self.ready():
+            self.discard()
+            self.set_exception(Cancelled(self.request))
+
+
+class Connection(BaseConnection):
+    def __init__(self, addrs=None, timeout=None, write_delay=0, metrics=None,
+                 probe_interval=None, migrate_factor=None, shuffle=True,
+                 health_timeout=HEALTH_TIMEOUT):
         """
         @param timeout: float|None, connection timeout in seconds (per address)
+        @param write_delay: float, seconds the writer waits for more packets
+            to coalesce before writing a batch
+        @param metrics: doozer.metrics.Metrics|None, where to record metrics
+        @param probe_interval: float|None, seconds between round-trip probes
+            of every node; nodes are then picked fastest first
+        @param migrate_factor: float|None, move to another node when the
+            current one's round trip exceeds the fastest one's by this factor
+        @param shuffle: bool, randomize the order addrs are tried in
+        @param health_timeout: float|None, how long a connection may leave
+            requests unanswered before it's checked and, failing that,
+            replaced (see doozer.protocol.HEALTH_TIMEOUT)
         """
         self._logger = logging.getLogger('pydoozer.Connection')
         self._logger.debug('__init__(%s)', addrs)
+        BaseConnection.__init__(self, addrs, timeout, metrics, shuffle, health_timeout)
 
-        if addrs is None:
-            addrs = []
-        self.addrs = addrs
-        self.addrs_index = 0
-        """Next address to connect to in self.addrs"""
+        self.probe_interval = probe_interval
+        self.migrate_factor = migrate_factor
+        self.prober = None
 
-        self.pending = {}
         self.loop = None
+        self.writer = None
+        self.checker = None
+        """Greenlet running the health check"""
+        self.write_delay = write_delay
+        self.wakeup = gevent.event.Event()
         self.sock = None
-        self.address = None
-        self.timeout = timeout
         self.ready = gevent.event.Event()
-
-        # Shuffle the addresses so all clients don't connect to the
-        # same node in the cluster.
-        random.shuffle(addrs)
+        self.reconnecting = None
+        """AsyncResult of the reconnect in progress, if any"""
+        self.timer = None
+        """Hub timer for the earliest deadline"""
+        self.timer_at = None
+        if metrics is not None:
+            metrics.gauge('in_flight', lambda connection: len(connection.pending), self)
 
     def connect(self):
+        if self.probe_interval:
+            # Find the fastest node before picking one
+            gevent.joinall([_spawner(self._probe, addr) for addr in self.addrs])
         self.reconnect()
 
     def reconnect(self, kill_loop=True):
@@ -134,48 +154,133 @@ class Connection(object):
         """
 
         self._logger.debug('reconnect()')
+        if self.reconnecting is not None:
+            # The receive loop, the writer and the health check can
+            # all notice the same failure; reconnect once.
+            return self.reconnecting.get()
+        reconnecting = self.reconnecting = gevent.event.AsyncResult()
+        try:
+            self._reconnect(kill_loop)
+            reconnecting.set()
+        except ConnectError as e:
+            reconnecting.set_exception(e)
+            # Nothing in flight will be answered now, and a request
+            # without a timeout would otherwise wait forever.
+            pending, self.pending = self.pending, {}
+            for future in pending.values():
+                future.set_exception(e)
+            raise
+        finally:
+            self.reconnecting = None
+            if not reconnecting.ready():
+                reconnecting.set_exception(ConnectError("reconnect was interrupted"))
+
+    def _reconnect(self, kill_loop):
+        if self.metrics is not None:
+            self.metrics.incr('reconnects')
+        began = time.time()
 
+        failed = self.address
         self.disconnect(kill_loop)
 
         # Default to the socket timeout
-        retry_wait = self.timeout or gevent.socket.getdefaulttimeout() or DEFAULT_RETRY_WAIT
-        for retry in range(5):
-            addrs_left = len(self.addrs)
-            while addrs_left:
-                try:
-                    parts = self.addrs[self.addrs_index].split(':')
-                    self.addrs_index = (self.addrs_index + 1) % len(self.addrs)
-                    host = parts[0]
-                    port = parts[1] if len(parts) > 1 else 8046
-                    self.address = "%s:%s" % (host, port)
-                    self._logger.debug('Connecting to %s...', self.address)
-                    self.sock = gevent.socket.create_connection((host, int(port)),
-                                                                timeout=self.timeout)
-                    self._logger.debug('Connection successful')
-
-                    # Reset the timeout on the connection so it
-                    # doesn't make .recv() and .send() timeout.
-                    self.sock.settimeout(None)
-                    self.ready.set()
-
-                    # Any commands that were in transit when the
-                    # connection was lost is obviously not getting a
-                    # reply. Retransmit them.
-                    self._retransmit_pending()
-                    self.loop = _spawner(self._recv_loop)
-                    return
-
-                except IOError, e:
-                    self._logger.info('Failed to connect to %s (%s)', self.address, e)
-                    pass
-                addrs_left -= 1
-
-            self._logger.debug('Waiting %d seconds to reconnect', retry_wait)
-            gevent.sleep(retry_wait)
-            retry_wait *= 2
-
-        self._logger.error('Could not connect to any of the defined addresses')
-        raise ConnectError("Can't connect to any of the addresses: %s" % self.addrs)
+        for wait, addr in self._attempts(failed, gevent.socket.getdefaulttimeout()):
+            if wait:
+                gevent.sleep(wait)
+            try:
+                host, port = split_addr(addr)
+                self.address = "%s:%s" % (host, port)
+                self._logger.debug('Connecting to %s...', self.address)
+                self.sock = gevent.socket.create_connection((host, port),
+                                                            timeout=self.timeout)
+                self._logger.debug('Connection successful')
+
+                # Reset the timeout on the connection so it
+                # doesn't make .recv() and .send() timeout.
+                self.sock.settimeout(None)
+                # The writer already batches packets; don't let
+                # Nagle hold them back waiting for ACKs.
+                self.sock.setsockopt(gevent.socket.IPPROTO_TCP,
+                                     gevent.socket.TCP_NODELAY, 1)
+                self.ready.set()
+                self.received = time.time()
+
+                for future in self._retransmit_pending():
+                    future.set_exception(ConnectionLost(future.request))
+                if self.outgoing:
+                    self.wakeup.set()
+                self.loop = _spawner(self._recv_loop)
+                if not self.writer:
+                    self.writer = _spawner(self._write_loop)
+                if self.probe_interval and not self.prober:
+                    self.prober = _spawner(self._probe_loop)
+                if self.health_timeout and not self.checker:
+                    self.checker = _spawner(self._health_loop)
+                if self.metrics is not None:
+                    self.metrics.observe('recover', time.time() - began)
+                return
+
+            except IOError as e:
+                self._logger.info('Failed to connect to %s (%s)', self.address, e)
+                if self.metrics is not None:
+                    self.metrics.incr('connect_failures', node=self.address)
+                if self.probe_interval:
+                    self.rtt[self.address] = float('inf')
+
+    def _probe_loop(self):
+        """
+        Periodically measure the round trip to every node, and move to a
+        faster node if the current one has become much slower.
+        """
+        while True:
+            gevent.sleep(self.probe_interval)
+            gevent.joinall([_spawner(self._probe, addr) for addr in self.addrs])
+
+            healthy = [rtt for rtt in self.rtt.values() if rtt != float('inf')]
+            current = self.rtt.get(self.address)
+            if self.migrate_factor and healthy and current is not None and \
+                    current > min(healthy) * self.migrate_factor and \
+                    all(future.retry for future in self.pending.values()):
+                self._logger.info('%s is slow (%.1fms), moving to a faster node',
+                                  self.address, current * 1000)
+                self._recover()
+
+    def _health_loop(self):
+        while True:
+            gevent.sleep(self.health_timeout / 2.0)
+            if self.sock is not None and not self._check_health(time.time()):
+                self._logger.warning('%s stopped responding, reconnecting', self.address)
+                self._recover()
+
+    def _probe(self, addr):
+        """Time a REV on a fresh connection to addr and update its estimate"""
+        address = "%s:%s" % split_addr(addr)
+        sock = None
+        try:
+            with gevent.Timeout(self.timeout or PROBE_TIMEOUT):
+                sock = gevent.socket.create_connection(split_addr(addr))
+                sock.setsockopt(gevent.socket.IPPROTO_TCP, gevent.socket.TCP_NODELAY, 1)
+                packet = pack_request(Request(tag=0, verb=Request.REV))
+                start = time.time()
+                sock.sendall(packet)
+                head = _recv_exactly(sock, 4)
+                _recv_exactly(sock, struct.unpack(">I", head)[0])
+                sample = time.time() - start
+        except (IOError, gevent.Timeout) as e:
+            self._logger.debug('Probe of %s failed (%s)', address, e)
+            self.rtt[address] = float('inf')
+            return
+        finally:
+            if sock:
+                sock.close()
+
+        estimate = self.rtt.get(address, float('inf'))
+        if estimate == float('inf'):
+            self.rtt[address] = sample
+        else:
+            self.rtt[address] = estimate + PROBE_ALPHA * (sample - estimate)
+        if self.metrics is not None:
+            self.metrics.observe('probe_rtt', sample, node=address)
 
     def disconnect(self, kill_loop=True):
         """
@@ -189,6 +294,16 @@ class Connection(object):
             self._logger.debug('killing loop')
             self.loop.kill()
             self.loop = None
+        if self.writer and self.writer is not gevent.getcurrent():
+            self._logger.debug('killing writer')
+            self.writer.kill()
+            self.writer = None
+        if self.prober and self.prober is not gevent.getcurrent():
+            self.prober.kill()
+            self.prober = None
+        if self.checker and self.checker is not gevent.getcurrent():
+            self.checker.kill()
+            self.checker = None
         if self.sock:
             self._logger.debug('closing connection')
             self.sock.close()
@@ -198,187 +313,300 @@ class Connection(object):
         self.ready.clear()
         self.address = None
 
-    def send(self, request, retry=True):
-        request.tag = 0
-        while request.tag in self.pending:
-            request.tag += 1
-            request.tag %= 2**31
+    def send(self, request, retry=True, timeout=REQUEST_TIMEOUT):
+        """
+        Send a request and block until its response arrives.
+
+        @param request: Request, request to send
+        @param retry: bool, resend the request if the connection is
+            replaced before it's answered
+        @param timeout: float|None, seconds to wait for the response
+        """
+        return self.result(self.send_async(request, retry, timeout))
+
+    def send_async(self, request, retry=True, timeout=None):
+        """
+        Send a request without waiting for its response.
+
+        Returns a PendingRequest, which resolves to the response (or
+        the matching ResponseError) once the reply with its tag comes
+        back. Any number of requests can be in flight at once.
+
+        If no response has arrived after `timeout` seconds, the request
+        fails with gevent.Timeout; other requests on the connection are
+        unaffected. The connection is only replaced when it fails or
+        its health check does (see health_timeout); requests in flight
+        then are resent with retry, and fail with ConnectionLost
+        without.
+
+        @param request: Request, request to send
+        @param retry: bool, resend the request if the connection is
+            replaced before it's answered
+        @param timeout: float|None, seconds to wait for the response
+            (default: no limit)
+        """
+        request.tag = self._allocate_tag()
 
         # Create and send request
-        data = request.SerializeToString()
-        data_len = len(data)
-        head = struct.pack(">I", data_len)
-        packet = ''.join([head, data])
-        entry = self.pending[request.tag] = {
-            'event': gevent.event.AsyncResult(),
-            'packet': packet,
-        }
-        self._logger.debug('Sending packet, tag: %d, len: %d', request.tag, data_len)
-        try:
-            self._send_pack(packet, retry)
+        packet = pack_request(request)
+        future = self.pending[request.tag] = PendingRequest(self, request, packet,
+                                                            retry, timeout)
+        if self.metrics is not None:
+            future.sent = time.time()
+            self.metrics.incr('requests', verb=VERB_NAMES.get(request.verb),
+                              node=self.address)
+            self.metrics.incr('bytes_out', len(packet))
+        if timeout is not None:
+            self._add_deadline(future, time.time() + timeout)
+        self._send_pack(packet)
+        return future
+
+    def _add_deadline(self, future, deadline):
+        """Time a request out at deadline, with one hub timer for all of them"""
+        self._push_deadline(future, deadline)
+        if self.timer_at is None or deadline < self.timer_at:
+            self._arm_timer(deadline)
+
+    def _arm_timer(self, deadline):
+        if self.timer is not None:
+            self.timer.stop()
+        self.timer = gevent.get_hub().loop.timer(max(0, deadline - time.time()))
+        self.timer.start(self._expire)
+        self.timer_at = deadline
+
+    def _expire(self):
+        """Time out every request past its deadline; runs in the hub"""
+        self.timer = self.timer_at = None
+        for future in self._pop_expired(time.time()):
+            if self.metrics is not None:
+                self.metrics.incr('timeouts', verb=VERB_NAMES.get(future.request.verb),
+                                  node=self.address)
+            future.set_exception(gevent.Timeout(future.timeout))
+        if self.deadlines:
+            self._arm_timer(self.deadlines[0][0])
+
+    def result(self, future):
+        """
+        Wait for the response to a request sent with send_async().
 
-            # Wait for response
-            try:
-                response = entry['event'].get(timeout=REQUEST_TIMEOUT)
-            except gevent.timeout.Timeout:
-                if retry:
-                    # If we get a timeout (which is conservatively high),
-                    # something is probably wrong with the
-                    # connection/instance so reconnect to the
-                    # cluster. This will trigger a retransmit of the
-                    # packages in transit.
-                    logging.debug('Got timeout on receive, triggering reconnect()')
-                    self.reconnect()
-                    response = entry['event'].get(timeout=REQUEST_TIMEOUT)
-
-        except Exception:
-            raise
+        @param future: PendingRequest, as returned by send_async()
+        """
+        try:
+            # Timeouts are enforced by the connection's deadlines
+            return future.get()
         finally:
             # We want to ensure that we always clear the pending
             # request, since nothing is now waiting for the answer.
-            del self.pending[request.tag]
+            future.discard()
 
-        exception = response_exception(response)
-        if exception:
-            raise exception(response, request)
-        return response
+    def discard(self, future):
+        """
+        Stop tracking a request; a late response to it is ignored.
 
-    def _send_pack(self, packet, retry=True):
+        @param future: PendingRequest, as returned by send_async()
         """
-        Send the given packet to the currently connected node.
+        if self.pending.get(future.request.tag) is future:
+            del self.pending[future.request.tag]
+
+    def _send_pack(self, packet):
+        """
+        Queue the given packet for the writer.
 
         @param packet: struct, packet to send
-        @param retry: bool, retry the sending once
         """
+        self.outgoing.append(packet)
+        self.wakeup.set()
+        if self.sock is None and self.reconnecting is None:
+            # The last reconnect gave up (or we were disconnected);
+            # this request tries again, and goes out once it succeeds.
+            _spawner(self._recover)
+
+    def _recover(self, kill_loop=True):
+        """reconnect() from a greenlet of our own, which nobody waits on"""
         try:
-            self.ready.wait(timeout=2)
-            self.sock.send(packet)
-        except IOError, e:
-            self._logger.warning('Error sending packet (%s)', e)
-            self.reconnect()
-            if retry:
-                self._logger.debug('Retrying sending packet')
-                self.ready.wait()
-                self.sock.send(packet)
-            else:
-                self._logger.warning('Failed retrying to send packet')
-                raise e
+            self.reconnect(kill_loop)
+        except ConnectError:
+            # Everything pending has failed with it, and the next
+            # request tries again
+            pass
+
+    def _write_loop(self):
+        """
+        Write queued packets to the currently connected node.
+
+        Everything queued since the last write goes out in a single
+        sendall(), so a burst of requests from many greenlets costs one
+        syscall rather than one each.
+        """
+        while True:
+            self.wakeup.wait()
+            if self.write_delay:
+                gevent.sleep(self.write_delay)
+            self.ready.wait()
+            self.wakeup.clear()
+            packets, self.outgoing = self.outgoing, []
+            sock = self.sock
+            try:
+                sock.sendall(b''.join(packets))
+            except IOError as e:
+                self._logger.warning('Error sending packets (%s)', e)
+                # Reconnecting retransmits everything pending, which
+                # includes the packets lost here.
+                if sock is self.sock:
+                    self._recover()
 
     def _recv_loop(self):
         self._logger.debug('_recv_loop(%s)', self.address)
 
+        sock = self.sock
+        buffer = ResponseBuffer()
+
         while True:
             try:
-                head = self.sock.recv(4)
-                length = struct.unpack(">I", head)[0]
-                data = self.sock.recv(length)
-                response = Response()
-                response.ParseFromString(data)
-                self._logger.debug('Received packet, tag: %d, len: %d', response.tag, length)
-                if response.tag in self.pending:
-                    self.pending[response.tag]['event'].set(response)
-            except struct.error, e:
+                # Dispatch every complete frame that is buffered
+                for response, length in buffer.responses():
+                    future = self.pending.pop(response.tag, None)
+                    if future is not None:
+                        future.resolve(response)
+                    if self.metrics is not None:
+                        self._record_response(future, length)
+
+                buffer.recv_from(sock)
+                self.received = time.time()
+            except DecodeError as e:
                 self._logger.warning('Got invalid packet from server (%s)', e)
-                # If some extra bytes are sent, just reconnect. 
-                # This is related to this bug: 
+                # If some extra bytes are sent, just reconnect.
+                # This is related to this bug:
                 # https://github.com/ha/doozerd/issues/5
                 break
-            except IOError, e:
+            except IOError as e:
                 self._logger.warning('Lost connection? (%s)', e)
                 break
 
         # Note: .reconnect() will spawn a new loop
-        self.reconnect(kill_loop=False)
+        self._recover(kill_loop=False)
+
+    def _record_response(self, future, length):
+        metrics = self.metrics
+        metrics.incr('bytes_in', length)
+        if future is None:
+            return
+        verb = VERB_NAMES.get(future.request.verb)
+        metrics.observe('latency', time.time() - future.sent, verb=verb, node=self.address)
+        if future.exception is not None:
+            metrics.incr('errors', verb=verb, error=type(future.exception).__name__)
 
-    def _retransmit_pending(self):
+
+class Watch(BaseWatch):
+    """
+    A WAIT chain on one glob, fanned out to its subscribers.
+    """
+
+    def __init__(self, client, glob, rev):
+        self._logger = logging.getLogger('pydoozer.Watch')
+        BaseWatch.__init__(self, client, glob, rev)
+        self.loop = _spawner(self._loop)
+
+    def stop(self):
+        self._unregister()
+        if self.loop and self.loop is not gevent.getcurrent():
+            self.loop.kill()
+        self.loop = None
+        if self.future:
+            self.future.discard()
+            self.future = None
+
+    def _loop(self):
+        wait = None
+        try:
+            while self.subscribers:
+                try:
+                    change = self._next()
+                except Exception as e:
+                    # The WAIT is sent again from the same rev, so
+                    # nothing is missed unless the history runs out
+                    # meanwhile, which _next() reports.
+                    base = self.client.connection.timeout or DEFAULT_RETRY_WAIT
+                    wait = retry_wait(base, wait or base)
+                    self._logger.warning('Error watching %s (%s), retrying in %.1fs',
+                                         self.glob, e, wait)
+                    gevent.sleep(wait)
+                    continue
+                wait = None
+                if change is not None:
+                    self._deliver(change)
+        finally:
+            # Done or dead, nobody may subscribe to this chain any more
+            self.stop()
+
+    def _next(self):
         """
-        Retransmits all pending packets.
+        Wait for the next change. If the changes at self.rev are gone
+        from doozerd's history, skips ahead to the current revision,
+        tells the subscribers' errbacks, and returns None.
         """
-
-        for i in xrange(0, len(self.pending)):
-            self._logger.debug('Retransmitting packet')
-            try:
-                self._send_pack(self.pending[i]['packet'], retry=False)
-            except Exception:
-                # If we can't even retransmit the package, we give
-                # up. The consumer will timeout.
-                logging.warning('Got exception retransmitting package')
+        self.future = self.client.wait_async(self.glob, self.rev)
+        try:
+            return self.future.get()
+        except TooLate as e:
+            self._skipped(e, self.client.rev().rev)
+            return None
 
 
-class Client(object):
-    def __init__(self, addrs=None, timeout=None):
+class Client(BaseClient):
+    def __init__(self, addrs=None, timeout=None, **kwargs):
         """
         @param timeout: float|None, connection timeout in seconds (per address)
+        @param kwargs: further options for the Connection
         """
         if addrs is None:
             addrs = []
-        self.connection = Connection(addrs, timeout)
+        self.connection = Connection(addrs, timeout, **kwargs)
+        self.metrics = self.connection.metrics
+        self.watches = {}
+        """Shared WAIT chains: glob -> Watch"""
         self.connect()
 
-    def rev(self):
-        request = Request(verb=Request.REV)
-        return self.connection.send(request)
-
-    def set(self, path, value, rev):
-        request = Request(path=path, value=value, rev=rev, verb=Request.SET)
-        return self.connection.send(request, retry=False)
-
-    def get(self, path, rev=None):
-        request = Request(path=path, verb=Request.GET)
-        if rev:
-            request.rev = rev
-        return self.connection.send(request)
-
-    def delete(self, path, rev):
-        request = Request(path=path, rev=rev, verb=Request.DEL)
-        return self.connection.send(request, retry=False)
-
-    def wait(self, path, rev):
-        request = Request(path=path, rev=rev, verb=Request.WAIT)
-        return self.connection.send(request)
-
-    def stat(self, path, rev):
-        request = Request(path=path, rev=rev, verb=Request.STAT)
-        return self.connection.send(request)
-
-    def access(self, secret):
-        request = Request(value=secret, verb=Request.ACCESS)
-        return self.connection.send(request)
-
-    def _getdir(self, path, offset=0, rev=None):
-        request = Request(path=path, offset=offset, verb=Request.GETDIR)
-        if rev:
-            request.rev = rev
-        return self.connection.send(request)
-
-    def _walk(self, path, offset=0, rev=None):
-        request = Request(path=path, offset=offset, verb=Request.WALK)
-        if rev:
-            request.rev = rev
-        return self.connection.send(request)
-
-    def watch(self, path, rev):
-        raise NotImplementedError()
-
-    def _list(self, method, path, offset=None, rev=None):
-        offset = offset or 0
-        entities = []
-        try:
-            while True:
-                response = getattr(self, method)(path, offset, rev)
-                entities.append(response)
-                offset += 1
-        except ResponseError, e:
-            if e.code == Response.RANGE:
-                return entities
-            else:
-                raise e
-
-    def walk(self, path, offset=None, rev=None):
-        return self._list('_walk', path, offset, rev)
-
-    def getdir(self, path, offset=None, rev=None):
-        return self._list('_getdir', path, offset, rev)
+    def _send(self, request, retry=True, timeout=REQUEST_TIMEOUT):
+        """Send a request on the connection it should go to"""
+        return self.connection.send_async(request, retry, timeout)
+
+    def _result(self, future):
+        return future.connection.result(future)
+
+    def _sleep(self, seconds):
+        gevent.sleep(seconds)
+
+    def watch(self, path, rev=None, callback=None, errback=None):
+        """
+        Subscribe to changes matching a glob.
+
+        Subscribers to the same glob share one WAIT chain and have each
+        change delivered to callback(change) in revision order. Pending
+        WAITs are retransmitted on reconnect, and a WAIT that fails is
+        retried from the same revision, so no change is missed unless
+        doozerd no longer has it: the chain then skips ahead to the
+        current revision and calls errback(TooLate) first.
+
+        @param path: str, glob to watch
+        @param rev: int|None, first revision to deliver (default: the next one)
+        @param callback: callable, called with each change
+        @param errback: callable|None, called with the TooLate when
+            changes were skipped
+        @return: Subscription, call cancel() on it to unsubscribe
+        """
+        if rev is None:
+            rev = self.rev().rev + 1
+        watch = self.watches.get(path)
+        if watch is None:
+            watch = self.watches[path] = Watch(self, path, rev)
+        elif rev < watch.rev:
+            # The shared chain has already passed rev, so this
+            # subscriber replays the backlog on a chain of its own.
+            watch = Watch(self, path, rev)
+        subscription = Subscription(watch, rev, callback, errback)
+        watch.subscribers.append(subscription)
+        return subscription
 
     def disconnect(self):
         self.connection.disconnect()
@@ -0,0 +1,342 @@
+"""
+Hand-written codec for doozerd's Request and Response messages.
+
+The schema is small and fixed, so encoding and decoding it directly is
+much cheaper than going through the reflection-based protobuf classes
+in msg_pb2. Request and Response here are drop-in replacements for the
+msg_pb2 ones as far as this package uses them: same field names, enum
+constants, SerializeToString(), ParseFromString() and HasField().
+
+Both messages can be encoded and decoded, so the fake server can use
+them too; only the client's direction (encoding requests, decoding
+responses) is tuned for speed.
+"""
+import struct
+
+__all__ = ['DecodeError', 'Request', 'Response']
+
+
+class DecodeError(Exception):
+    pass
+
+
+if bytes is str:
+    _text_type = unicode
+
+    def _ints(data):
+        return bytearray(data)
+
+    def _text(data):
+        return data
+else:
+    _text_type = str
+
+    def _ints(data):
+        return data
+
+    def _text(data):
+        return data.decode('utf-8')
+
+
+def _bytes(value):
+    if isinstance(value, _text_type):
+        return value.encode('utf-8')
+    return value
+
+
+LAZY_VALUE_SIZE = 512
+"""Values at least this long (bytes) aren't copied out of the frame until
+read; below it, a view costs more memory than the copy"""
+
+
+_SMALL_VARINTS = [struct.pack('B', i) for i in range(0x80)]
+
+
+def _varint(value):
+    if 0 <= value < 0x80:
+        return _SMALL_VARINTS[value]
+    if value < 0:
+        # Negative int32/int64 values are sent as 64-bit two's complement
+        value += 1 << 64
+    parts = bytearray()
+    while value > 0x7f:
+        parts.append(value & 0x7f | 0x80)
+        value >>= 7
+    parts.append(value)
+    return bytes(parts)
+
+
+def _read_varint(ints, i):
+    value = 0
+    shift = 0
+    while True:
+        try:
+            byte = ints[i]
+        except IndexError:
+            raise DecodeError('truncated varint')
+        i += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, i
+        shift += 7
+        if shift >= 70:
+            raise DecodeError('varint too long')
+
+
+def _fields(data):
+    """Yield (field number, wire type, value) for each field in data"""
+    ints = _ints(data)
+    end = len(data)
+    i = 0
+    while i < end:
+        key, i = _read_varint(ints, i)
+        field = key >> 3
+        wire_type = key & 7
+        if wire_type == 0:
+            value, i = _read_varint(ints, i)
+            if value >= 1 << 63:
+                value -= 1 << 64
+        elif wire_type == 2:
+            length, i = _read_varint(ints, i)
+            value = data[i:i + length]
+            i += length
+        elif wire_type == 1:
+            value = None
+            i += 8
+        elif wire_type == 5:
+            value = None
+            i += 4
+        else:
+            raise DecodeError('unsupported wire type %d' % wire_type)
+        if i > end:
+            raise DecodeError('truncated message')
+        yield field, wire_type, value
+
+
+def _repr(message):
+    fields = ['%s=%r' % (name.lstrip('_'), getattr(message, name.lstrip('_')))
+              for name in message.__slots__
+              if name != '_present' and message.HasField(name.lstrip('_'))]
+    return '%s(%s)' % (type(message).__name__, ', '.join(fields))
+
+
+class Request(object):
+    """
+    A doozerd request. Fields left as None are not sent.
+    """
+
+    GET = 1
+    SET = 2
+    DEL = 3
+    REV = 5
+    WAIT = 6
+    NOP = 7
+    WALK = 9
+    GETDIR = 14
+    STAT = 16
+    ACCESS = 99
+
+    __slots__ = ('tag', 'verb', 'path', 'value', 'other_tag', 'offset', 'rev')
+
+    def __init__(self, tag=None, verb=None, path=None, value=None,
+                 other_tag=None, offset=None, rev=None):
+        self.tag = tag
+        self.verb = verb
+        self.path = path
+        self.value = value
+        self.other_tag = other_tag
+        self.offset = offset
+        self.rev = rev
+
+    def HasField(self, name):
+        return getattr(self, name) is not None
+
+    def __repr__(self):
+        return _repr(self)
+
+    def SerializeToString(self):
+        parts = []
+        if self.tag is not None:
+            parts += (b'\x08', _varint(self.tag))
+        if self.verb is not None:
+            parts += (b'\x10', _varint(self.verb))
+        if self.path is not None:
+            path = _bytes(self.path)
+            parts += (b'\x22', _varint(len(path)), path)
+        if self.value is not None:
+            value = _bytes(self.value)
+            parts += (b'\x2a', _varint(len(value)), value)
+        if self.other_tag is not None:
+            parts += (b'\x30', _varint(self.other_tag))
+        if self.offset is not None:
+            parts += (b'\x38', _varint(self.offset))
+        if self.rev is not None:
+            parts += (b'\x48', _varint(self.rev))
+        return b''.join(parts)
+
+    def ParseFromString(self, data):
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        for field, wire_type, value in _fields(data):
+            if field == 1:
+                self.tag = value
+            elif field == 2:
+                self.verb = value
+            elif field == 4:
+                self.path = _text(value)
+            elif field == 5:
+                self.value = value
+            elif field == 6:
+                self.other_tag = value
+            elif field == 7:
+                self.offset = value
+            elif field == 9:
+                self.rev = value
+
+
+class Response(object):
+    """
+    A doozerd response. Unset fields read as their protobuf defaults;
+    HasField() tells them apart from fields that were sent.
+    """
+
+    OTHER = 127
+    TAG_IN_USE = 1
+    UNKNOWN_VERB = 2
+    READONLY = 3
+    TOO_LATE = 4
+    REV_MISMATCH = 5
+    BAD_PATH = 6
+    MISSING_ARG = 7
+    RANGE = 8
+    NOTDIR = 20
+    ISDIR = 21
+    NOENT = 22
+
+    _FIELDS = {'tag': 1, 'flags': 2, 'rev': 3, 'path': 5, 'value': 6,
+               'len': 8, 'err_code': 100, 'err_detail': 101}
+
+    __slots__ = ('tag', 'flags', 'rev', 'path', '_value', 'len', 'err_code',
+                 'err_detail', '_present')
+
+    def __init__(self, tag=0, flags=0, rev=0, path=u'', value=b'', len=0,
+                 err_code=None, err_detail=u''):
+        self.tag = tag
+        self.flags = flags
+        self.rev = rev
+        self.path = path
+        self._value = value
+        self.len = len
+        self.err_code = err_code
+        self.err_detail = err_detail
+        self._present = 0
+
+    @property
+    def value(self):
+        value = self._value
+        if type(value) is memoryview:
+            value = self._value = value.tobytes()
+        return value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+
+    def HasField(self, name):
+        if name == 'err_code':
+            return self.err_code is not None
+        return bool(self._present >> self._FIELDS[name] & 1)
+
+    def __repr__(self):
+        return _repr(self)
+
+    def SerializeToString(self):
+        """
+        Encode the fields that differ from their defaults (fields set to
+        their default are indistinguishable from unset ones here).
+        """
+        parts = []
+        if self.tag:
+            parts += (b'\x08', _varint(self.tag))
+        if self.flags:
+            parts += (b'\x10', _varint(self.flags))
+        if self.rev:
+            parts += (b'\x18', _varint(self.rev))
+        if self.path:
+            path = _bytes(self.path)
+            parts += (b'\x2a', _varint(len(path)), path)
+        if self.value:
+            value = _bytes(self.value)
+            parts += (b'\x32', _varint(len(value)), value)
+        if self.len:
+            parts += (b'\x40', _varint(self.len))
+        if self.err_code is not None:
+            parts += (b'\xa0\x06', _varint(self.err_code))
+        if self.err_detail:
+            detail = _bytes(self.err_detail)
+            parts += (b'\xaa\x06', _varint(len(detail)), detail)
+        return b''.join(parts)
+
+    def ParseFromString(self, data):
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        elif not isinstance(data, bytes):
+            data = bytes(data)
+        ints = _ints(data)
+        end = len(data)
+        present = 0
+        i = 0
+        while i < end:
+            key = ints[i]
+            i += 1
+            if key >= 0x80:
+                key, i = _read_varint(ints, i - 1)
+            field = key >> 3
+            present |= 1 << field
+            wire_type = key & 7
+            if wire_type == 1:
+                i += 8
+                continue
+            elif wire_type == 5:
+                i += 4
+                continue
+            if i >= end:
+                raise DecodeError('truncated message')
+            value = ints[i]
+            i += 1
+            if value >= 0x80:
+                value, i = _read_varint(ints, i - 1)
+            if wire_type == 0:
+                if value >= 1 << 63:
+                    value -= 1 << 64
+                if field == 1:
+                    self.tag = value
+                elif field == 3:
+                    self.rev = value
+                elif field == 2:
+                    self.flags = value
+                elif field == 8:
+                    self.len = value
+                elif field == 100:
+                    self.err_code = value
+            elif wire_type == 2:
+                start = i
+                i += value
+                if i > end:
+                    raise DecodeError('truncated field')
+                if field == 6:
+                    if value < LAZY_VALUE_SIZE:
+                        self._value = data[start:i]
+                    else:
+                        # Left as a view of the bytes copy of the frame
+                        # until it's read
+                        self._value = memoryview(data)[start:i]
+                elif field == 5:
+                    self.path = _text(data[start:i])
+                elif field == 101:
+                    self.err_detail = _text(data[start:i])
+            else:
+                raise DecodeError('unsupported wire type %d' % wire_type)
+        if i != end:
+            raise DecodeError('truncated message')
+        self._present = present
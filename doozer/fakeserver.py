@@ -0,0 +1,435 @@
+"""
+In-process stand-in for a doozerd cluster, for tests and benchmarks.
+
+It speaks the same 4-byte-length-prefixed Request/Response protocol as
+doozerd and implements GET, SET, DEL, REV, WAIT, WALK, GETDIR, STAT,
+NOP and ACCESS with doozerd's revision semantics and error codes. All
+nodes of a Cluster share one Store, and each node can be given latency,
+made to drop connections, or stopped and started again.
+
+Run as `python -m doozer.fakeserver` to serve a cluster to clients in
+other processes; it prints the cluster's URI.
+"""
+import argparse
+import bisect
+import collections
+import logging
+import random
+import socket
+import struct
+import sys
+
+import gevent
+import gevent.event
+import gevent.lock
+import gevent.server
+
+from .protocol import FLAG_DEL, FLAG_SET, Request, Response, compile_glob
+
+MISSING = 0
+"""STAT/GET rev of a path that doesn't exist"""
+
+DIR = -2
+"""STAT rev of a directory"""
+
+CLOBBER = -1
+"""SET/DEL rev that overwrites whatever revision the file is at"""
+
+
+class StoreError(Exception):
+    def __init__(self, code, detail=''):
+        Exception.__init__(self, code, detail)
+        self.code = code
+        self.detail = detail
+
+
+class Store(object):
+    """
+    Versioned doozer tree shared by the nodes of a Cluster.
+    """
+
+    def __init__(self, history=None):
+        """
+        @param history: int|None, number of revisions WAIT can look back
+            before answering TOO_LATE (default: all of them)
+        """
+        self.rev = 0
+        self.files = {}
+        """path -> [(rev, value or None if deleted)], oldest first"""
+        self.log = []
+        """(rev, path, value, flags) for every change still in history"""
+        self.dirs = {'/': set()}
+        """path -> set of child names, for the tree at the current rev"""
+        self.history = history
+        self.trimmed = 0
+        """Newest revision no longer in the log"""
+        self.waiters = []
+        self.head = gevent.event.AsyncResult()
+        """Set (and replaced) whenever a change is applied"""
+        self._listings = collections.OrderedDict()
+
+    def get(self, path, rev=None):
+        rev = self._at(rev)
+        value = self._value(path, rev)
+        if value is None:
+            if self._children(path, rev):
+                raise StoreError(Response.ISDIR, path)
+            return MISSING, None
+        return self._file_rev(path, rev), value
+
+    def stat(self, path, rev=None):
+        rev = self._at(rev)
+        value = self._value(path, rev)
+        if value is not None:
+            return self._file_rev(path, rev), len(value)
+        children = self._children(path, rev)
+        if children:
+            return DIR, len(children)
+        return MISSING, 0
+
+    def getdir(self, path, offset, rev=None):
+        rev = self._at(rev)
+        if self._value(path, rev) is not None:
+            raise StoreError(Response.NOTDIR, path)
+        children = self._children(path, rev)
+        if not children:
+            raise StoreError(Response.NOENT, path)
+        if offset >= len(children):
+            raise StoreError(Response.RANGE)
+        return children[offset]
+
+    def walk(self, glob, offset, rev=None):
+        rev = self._at(rev)
+        key = ('walk', glob, rev)
+        paths = self._listings.get(key)
+        if paths is None:
+            match = compile_glob(glob).match
+            paths = sorted([path for path in self.files
+                            if match(path) and self._value(path, rev) is not None],
+                           key=lambda path: path.split('/'))
+            self._cache_listing(key, paths)
+        if offset >= len(paths):
+            raise StoreError(Response.RANGE)
+        path = paths[offset]
+        return path, self._file_rev(path, rev), self._value(path, rev)
+
+    def set(self, path, value, rev):
+        self._check_path(path)
+        if path in self.dirs:
+            raise StoreError(Response.ISDIR, path)
+        parent = path.rsplit('/', 1)[0]
+        while parent:
+            if self._value(parent, self.rev) is not None:
+                raise StoreError(Response.NOTDIR, parent)
+            parent = parent.rsplit('/', 1)[0]
+        self._check_rev(path, rev)
+        return self._apply(path, value, FLAG_SET)
+
+    def delete(self, path, rev):
+        self._check_path(path)
+        if self._value(path, self.rev) is None:
+            if path in self.dirs:
+                raise StoreError(Response.ISDIR, path)
+            raise StoreError(Response.NOENT, path)
+        self._check_rev(path, rev)
+        return self._apply(path, None, FLAG_DEL)
+
+    def wait(self, glob, rev):
+        """Block until the first change matching glob at or after rev"""
+        if rev <= self.trimmed:
+            raise StoreError(Response.TOO_LATE)
+        match = compile_glob(glob).match
+        start = bisect.bisect_left(self.log, (rev,))
+        for change in self.log[start:]:
+            if match(change[1]):
+                return change
+        waiter = (match, rev, gevent.event.AsyncResult())
+        self.waiters.append(waiter)
+        try:
+            return waiter[2].get()
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+
+    def _at(self, rev):
+        if not rev:
+            return self.rev
+        if rev < self.trimmed:
+            raise StoreError(Response.TOO_LATE)
+        while rev > self.rev:
+            self.head.get()
+        return rev
+
+    def _check_path(self, path):
+        if not path.startswith('/') or '//' in path or \
+                (path != '/' and path.endswith('/')):
+            raise StoreError(Response.BAD_PATH, path)
+
+    def _check_rev(self, path, rev):
+        if rev != CLOBBER and rev < self._file_rev(path, self.rev):
+            raise StoreError(Response.REV_MISMATCH, path)
+
+    def _apply(self, path, value, flags):
+        self.rev += 1
+        rev = self.rev
+        self.files.setdefault(path, []).append((rev, value))
+        change = (rev, path, value, flags)
+        self.log.append(change)
+        if self.history and len(self.log) > self.history:
+            del self.log[:len(self.log) - self.history]
+            self.trimmed = self.log[0][0] - 1
+
+        self._index(path, value is not None)
+
+        for waiter in list(self.waiters):
+            match, wait_rev, result = waiter
+            if wait_rev <= rev and match(path):
+                self.waiters.remove(waiter)
+                result.set(change)
+        head, self.head = self.head, gevent.event.AsyncResult()
+        head.set(rev)
+        return rev
+
+    def _index(self, path, exists):
+        while path != '/':
+            parent, name = path.rsplit('/', 1)
+            parent = parent or '/'
+            children = self.dirs.get(parent)
+            if exists:
+                if children is None:
+                    children = self.dirs[parent] = set()
+                elif name in children:
+                    break
+                children.add(name)
+            else:
+                children.discard(name)
+                if children or parent == '/':
+                    break
+                del self.dirs[parent]
+            path = parent
+
+    def _version(self, path, rev):
+        versions = self.files.get(path)
+        if not versions:
+            return None
+        i = bisect.bisect_left(versions, (rev + 1,))
+        return versions[i - 1] if i else None
+
+    def _value(self, path, rev):
+        version = self._version(path, rev)
+        return version and version[1]
+
+    def _file_rev(self, path, rev):
+        version = self._version(path, rev)
+        if version is None or version[1] is None:
+            return MISSING
+        return version[0]
+
+    def _children(self, path, rev):
+        key = ('getdir', path, rev)
+        children = self._listings.get(key)
+        if children is None and rev == self.rev:
+            children = sorted(self.dirs.get(path, ()))
+            self._cache_listing(key, children)
+        elif children is None:
+            prefix = path.rstrip('/') + '/'
+            names = set()
+            for name in self.files:
+                if name.startswith(prefix) and self._value(name, rev) is not None:
+                    names.add(name[len(prefix):].split('/', 1)[0])
+            children = sorted(names)
+            self._cache_listing(key, children)
+        return children
+
+    def _cache_listing(self, key, listing):
+        # The listing at a given rev never changes (a write creates a
+        # new rev), so clients walking offset by offset only pay for
+        # the scan once.
+        self._listings[key] = listing
+        if len(self._listings) > 64:
+            self._listings.popitem(last=False)
+
+
+class Node(object):
+    """
+    One doozerd stand-in listening on a local port.
+    """
+
+    def __init__(self, store, port=0, latency=0, drop_rate=0):
+        """
+        @param store: Store, tree to serve
+        @param port: int, port to listen on (default: any free port)
+        @param latency: float, seconds added before every response
+        @param drop_rate: float, chance that a request makes the node
+            close the connection instead of answering
+        """
+        self._logger = logging.getLogger('pydoozer.FakeNode')
+        self.store = store
+        self.port = port
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.connections = set()
+        self.requests = 0
+        self.server = None
+
+    @property
+    def address(self):
+        return '127.0.0.1:%d' % self.port
+
+    def start(self):
+        self.server = gevent.server.StreamServer(('127.0.0.1', self.port), self._handle)
+        self.server.start()
+        self.port = self.server.server_port
+
+    def stop(self):
+        """Stop listening and close every client connection"""
+        if self.server:
+            self.server.stop(timeout=0)
+            self.server = None
+        self.drop_connections()
+
+    def drop_connections(self):
+        for sock in list(self.connections):
+            self._close(sock)
+
+    def _close(self, sock):
+        self.connections.discard(sock)
+        try:
+            sock.close()
+        except IOError:
+            pass
+
+    def _handle(self, sock, address):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connections.add(sock)
+        lock = gevent.lock.Semaphore()
+        tags = set()
+        data = b''
+        try:
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+                while len(data) >= 4:
+                    length = struct.unpack('>I', data[:4])[0]
+                    if len(data) < 4 + length:
+                        break
+                    request = Request()
+                    request.ParseFromString(data[4:4 + length])
+                    data = data[4 + length:]
+                    gevent.spawn(self._serve, sock, lock, tags, request)
+        except IOError:
+            pass
+        finally:
+            self._close(sock)
+
+    def _serve(self, sock, lock, tags, request):
+        self.requests += 1
+        if self.drop_rate and random.random() < self.drop_rate:
+            self._close(sock)
+            return
+        if request.tag in tags:
+            response = Response(tag=request.tag, err_code=Response.TAG_IN_USE)
+        else:
+            tags.add(request.tag)
+            try:
+                response = self._dispatch(request)
+            finally:
+                tags.discard(request.tag)
+        if self.latency:
+            gevent.sleep(self.latency)
+
+        data = response.SerializeToString()
+        try:
+            with lock:
+                sock.sendall(struct.pack('>I', len(data)) + data)
+        except IOError:
+            self._close(sock)
+
+    def _dispatch(self, request):
+        store = self.store
+        response = Response(tag=request.tag)
+        rev = request.rev if request.HasField('rev') else None
+        try:
+            if request.verb == Request.GET:
+                response.rev, value = store.get(request.path, rev)
+                if value is not None:
+                    response.value = value
+            elif request.verb == Request.SET:
+                response.rev = store.set(request.path, request.value, request.rev)
+            elif request.verb == Request.DEL:
+                store.delete(request.path, request.rev)
+            elif request.verb == Request.REV:
+                response.rev = store.rev
+            elif request.verb == Request.WAIT:
+                response.rev, response.path, value, response.flags = \
+                    store.wait(request.path, request.rev)
+                if value is not None:
+                    response.value = value
+            elif request.verb == Request.WALK:
+                response.path, response.rev, response.value = \
+                    store.walk(request.path, request.offset, rev)
+            elif request.verb == Request.GETDIR:
+                response.path = store.getdir(request.path, request.offset, rev)
+            elif request.verb == Request.STAT:
+                response.rev, response.len = store.stat(request.path, rev)
+            elif request.verb in (Request.NOP, Request.ACCESS):
+                pass
+            else:
+                raise StoreError(Response.UNKNOWN_VERB)
+        except StoreError as e:
+            response = Response(tag=request.tag, err_code=e.code)
+            if e.detail:
+                response.err_detail = e.detail
+        return response
+
+
+class Cluster(object):
+    """
+    A set of Nodes serving one Store.
+    """
+
+    def __init__(self, nodes=3, history=None, **kwargs):
+        """
+        @param nodes: int, number of nodes
+        @param history: int|None, see Store
+        @param kwargs: further options for each Node
+        """
+        self.store = Store(history)
+        self.nodes = [Node(self.store, **kwargs) for i in range(nodes)]
+        for node in self.nodes:
+            node.start()
+
+    @property
+    def addrs(self):
+        return [node.address for node in self.nodes]
+
+    @property
+    def uri(self):
+        return "doozer:?%s" % "&".join(["ca=%s" % addr for addr in self.addrs])
+
+    def stop(self):
+        for node in self.nodes:
+            node.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a fake doozerd cluster')
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--history', type=int, default=None)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds added before every response')
+    args = parser.parse_args()
+
+    cluster = Cluster(args.nodes, args.history, latency=args.latency)
+    sys.stdout.write(cluster.uri + '\n')
+    sys.stdout.flush()
+    try:
+        gevent.wait()
+    except KeyboardInterrupt:
+        cluster.stop()
+
+
+if __name__ == '__main__':
+    main()
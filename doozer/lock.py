@@ -0,0 +1,253 @@
+import logging
+import time
+import uuid
+
+import gevent
+import gevent.event
+
+from .client import FLAG_DEL, NoEntity, RevMismatch, TooLate
+
+DEFAULT_LEASE_TTL = 10.0
+"""Default seconds a Lease survives without being renewed"""
+
+
+class Lock(object):
+    """
+    Distributed mutual exclusion on a doozer directory, with fair queuing.
+
+    Every contender creates a file of its own under the lock directory
+    with a rev-0 SET; the contenders are served in the order of the
+    revisions those files were created at. Each waits with a WAIT on
+    the file of the contender just ahead of it, so when a holder
+    releases (deletes its file) only the next one in line wakes up,
+    and the lock changes hands after one WAIT notification rather than
+    a poll interval.
+
+    A plain Lock stays held until release(), however long that takes;
+    see Lease for one that is given up when its holder stops renewing.
+    """
+
+    ttl = None
+
+    def __init__(self, client, path):
+        """
+        @param client: Client, client to lock through
+        @param path: str, lock directory
+        """
+        self._logger = logging.getLogger('pydoozer.Lock')
+
+        self.client = client
+        self.path = path.rstrip('/')
+        self.node = None
+        """Our file in the lock directory while acquiring or holding"""
+        self.created = None
+        """Revision our file was created at, our place in the queue"""
+        self.rev = None
+        """Current revision of our file"""
+        self.held = False
+
+    def acquire(self, blocking=True, timeout=None):
+        """
+        Wait until the lock is ours; returns whether it was acquired.
+
+        @param blocking: bool, give up straight away if it's held
+        @param timeout: float|None, seconds to wait at most
+        """
+        if self.held:
+            raise RuntimeError("lock %s is already held" % self.path)
+        deadline = None if timeout is None else time.time() + timeout
+        self._enqueue()
+        try:
+            rev = self.created
+            while True:
+                ahead = self._ahead(rev)
+                if ahead is None:
+                    self._enqueue()
+                    rev = self.created
+                    continue
+                if not ahead:
+                    self.held = True
+                    return True
+                if not blocking:
+                    self._dequeue()
+                    return False
+                rev = self._wait_for(ahead[-1], rev, deadline)
+                if rev is None:
+                    self._dequeue()
+                    return False
+        except BaseException:
+            self._dequeue()
+            raise
+
+    def release(self):
+        if not self.held:
+            raise RuntimeError("lock %s isn't held" % self.path)
+        self.held = False
+        self._dequeue()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.held:
+            self.release()
+
+    def _enqueue(self):
+        """Take a place at the back of the queue"""
+        self.node = '%s/%s' % (self.path, uuid.uuid4().hex)
+        self.created = self.rev = self.client.set(self.node, b'', 0).rev
+
+    def _dequeue(self):
+        node, self.node = self.node, None
+        if node is None:
+            return
+        try:
+            # Nobody else writes our file, so clobber whatever rev it's at
+            self.client.delete(node, -1)
+        except NoEntity:
+            pass
+
+    def _ahead(self, rev):
+        """
+        The files of the contenders ahead of us as of rev, in queue
+        order; None if ours is gone (a Lease that expired).
+        """
+        names = [entity.path for entity in self.client.getdir(self.path, rev=rev)]
+        paths = ['%s/%s' % (self.path, name) for name in names]
+        queue = []
+        for entity, path in zip(self.client.get_many(paths, rev=rev), paths):
+            if isinstance(entity, Exception) or not entity.rev:
+                continue
+            # A renewed file keeps its creation rev in its value
+            created = int(entity.value) if entity.value else entity.rev
+            queue.append((created, path, entity.rev))
+        queue.sort()
+        for i, (created, path, file_rev) in enumerate(queue):
+            if path == self.node:
+                return queue[:i]
+        return None
+
+    def _wait_for(self, contender, rev, deadline):
+        """
+        Wait for the file of the contender ahead of us to be deleted.
+
+        Returns the revision of the deletion (or of when it was found
+        stale and deleted), None past the deadline.
+        """
+        created, path, file_rev = contender
+        seen = time.time()
+        while True:
+            if self.node is None:
+                # Our Lease expired; back to acquire() to queue again
+                return rev
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time.time()
+            if self.ttl is not None:
+                # A contender that hasn't renewed for a whole ttl is gone
+                stale = seen + self.ttl - time.time()
+                timeout = stale if timeout is None else min(timeout, stale)
+            if timeout is not None and timeout <= 0:
+                if deadline is not None and time.time() >= deadline:
+                    return None
+                try:
+                    self.client.delete(path, file_rev)
+                except (RevMismatch, NoEntity):
+                    # Renewed or released after all; look again
+                    pass
+                return self.client.rev().rev
+
+            future = self.client.wait_async(path, rev + 1)
+            try:
+                # wait() rather than get(timeout=...): catching
+                # gevent.Timeout would swallow the caller's own timeout
+                future.wait(timeout)
+            finally:
+                future.discard()
+            if not future.ready():
+                continue
+            try:
+                change = future.get()
+            except TooLate:
+                return self.client.rev().rev
+            if change.flags & FLAG_DEL:
+                return change.rev
+            # Renewed
+            rev = file_rev = change.rev
+            seen = time.time()
+
+
+class Lease(Lock):
+    """
+    A Lock that is only held as long as it is renewed.
+
+    While acquiring or holding, a greenlet re-writes our file every
+    ttl/3 seconds. Contenders that see the file ahead of them go a
+    whole ttl without being renewed delete it, so a crashed holder
+    loses the lock after at most ttl. If ours is deleted like that
+    (we were partitioned away, say), `lost` is set; while acquiring,
+    we then queue up again at the back.
+    """
+
+    def __init__(self, client, path, ttl=DEFAULT_LEASE_TTL):
+        """
+        @param client: Client, client to lock through
+        @param path: str, lock directory
+        @param ttl: float, seconds the lease survives without renewal
+        """
+        Lock.__init__(self, client, path)
+        self._logger = logging.getLogger('pydoozer.Lease')
+        self.ttl = ttl
+        self.lost = gevent.event.Event()
+        self.renewer = None
+
+    def renew(self):
+        """
+        Re-write our file, restarting every contender's ttl countdown.
+
+        Returns False, and sets `lost`, if the file had been deleted as
+        stale in the meantime.
+        """
+        node, previous = self.node, self.rev
+        if node is None:
+            return False
+        try:
+            # doozerd takes a SET at any rev not older than the file,
+            # which a deleted one (rev 0) never is; so check that our
+            # last write is the one this SET replaced.
+            self.rev = self.client.set(node, b'%d' % self.created, previous).rev
+            intact = self.client.wait(node, previous + 1).rev == self.rev
+        except (RevMismatch, TooLate):
+            intact = False
+        if not intact:
+            self._logger.warning('Lease %s expired before it was renewed', self.path)
+            self.node = None
+            self.lost.set()
+            try:
+                self.client.delete(node, -1)
+            except NoEntity:
+                pass
+        return intact
+
+    def _enqueue(self):
+        Lock._enqueue(self)
+        self.lost.clear()
+        if self.renewer is None:
+            self.renewer = gevent.spawn(self._renew_loop)
+
+    def _dequeue(self):
+        if self.renewer is not None:
+            self.renewer.kill()
+            self.renewer = None
+        Lock._dequeue(self)
+
+    def _renew_loop(self):
+        while True:
+            gevent.sleep(self.ttl / 3.0)
+            try:
+                if not self.renew():
+                    self.renewer = None
+                    return
+            except Exception:
+                self._logger.exception('Error renewing lease %s', self.path)
@@ -0,0 +1,158 @@
+"""
+Request metrics for Connections.
+
+Pass a Metrics instance as Connection(metrics=...) (or through Client
+and connect()) to collect request counts, round-trip latency per verb
+and node, bytes in and out, errors, timeouts, retransmits and
+reconnects. Without one, the only cost on the hot path is an
+attribute check.
+"""
+import bisect
+import collections
+import weakref
+
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""Upper bounds (seconds) of the latency histogram buckets"""
+
+
+class Histogram(object):
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics(object):
+    def __init__(self, prefix='doozer'):
+        self.prefix = prefix
+        self.counters = collections.defaultdict(int)
+        """(name, labels) -> count"""
+        self.histograms = {}
+        """(name, labels) -> Histogram"""
+        self.gauges = collections.defaultdict(list)
+        """name -> callables whose results are summed on snapshot"""
+
+    def incr(self, name, value=1, **labels):
+        self.counters[_key(name, labels)] += value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name, function, owner=None):
+        """
+        Report the sum of function() over all registrations as name.
+
+        With an owner, function(owner) is reported instead, and only a
+        weak reference to owner is kept: the registration goes away
+        with it, so a long-lived Metrics doesn't keep every Connection
+        that ever reported to it alive.
+        """
+        if owner is not None:
+            function = _OwnedGauge(function, owner)
+        self.gauges[name].append(function)
+
+    def _gauge(self, name):
+        functions = self.gauges[name]
+        # Drop the registrations whose owner is gone
+        functions[:] = [function for function in functions
+                        if not isinstance(function, _OwnedGauge)
+                        or function.owner() is not None]
+        return sum(function() for function in functions)
+
+    def snapshot(self):
+        """Return the current metrics as plain dicts and lists"""
+        snapshot = {'counters': [], 'histograms': [], 'gauges': {}}
+        for (name, labels), value in sorted(self.counters.items()):
+            snapshot['counters'].append(
+                {'name': name, 'labels': dict(labels), 'value': value})
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            snapshot['histograms'].append({
+                'name': name, 'labels': dict(labels),
+                'count': histogram.count, 'sum': histogram.sum,
+                'p50': histogram.quantile(0.5), 'p99': histogram.quantile(0.99),
+                'p999': histogram.quantile(0.999),
+            })
+        for name in list(self.gauges):
+            snapshot['gauges'][name] = self._gauge(name)
+        return snapshot
+
+    def prometheus(self):
+        """Return the current metrics in the Prometheus text format"""
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE %s %s' % (name, kind))
+
+        for (name, labels), value in sorted(self.counters.items()):
+            metric = '%s_%s_total' % (self.prefix, name)
+            declare(metric, 'counter')
+            lines.append('%s%s %s' % (metric, _labels(labels), value))
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            metric = '%s_%s_seconds' % (self.prefix, name)
+            declare(metric, 'histogram')
+            cumulative = 0
+            for bound, count in zip(histogram.bounds + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (
+                    metric, _labels(labels + (('le', bound),)), cumulative))
+            lines.append('%s_sum%s %r' % (metric, _labels(labels), histogram.sum))
+            lines.append('%s_count%s %d' % (metric, _labels(labels), histogram.count))
+        for name in sorted(self.gauges):
+            metric = '%s_%s' % (self.prefix, name)
+            declare(metric, 'gauge')
+            lines.append('%s %s' % (metric, self._gauge(name)))
+        return '\n'.join(lines) + '\n'
+
+
+class _OwnedGauge(object):
+    __slots__ = ('function', 'owner')
+
+    def __init__(self, function, owner):
+        self.function = function
+        self.owner = weakref.ref(owner)
+
+    def __call__(self):
+        owner = self.owner()
+        return 0 if owner is None else self.function(owner)
+
+
+def _key(name, labels):
+    # Label values are kept as strings so keys always sort; a label
+    # that is None (the node while disconnected) is left out.
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()
+                              if value is not None))
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, value) for key, value in labels)
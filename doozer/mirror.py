@@ -0,0 +1,146 @@
+import logging
+
+import gevent
+
+from .client import DEFAULT_RETRY_WAIT, FLAG_DEL, TooLate, compile_glob, retry_wait
+
+
+class Mirror(object):
+    """
+    In-memory replica of a doozer subtree.
+
+    The subtree is loaded from a walk pinned to a single revision and
+    then kept current by applying the WAIT changefeed in order, so
+    get(), getdir() and walk() are answered locally and always reflect
+    the tree exactly as of `rev`.
+
+    If the changefeed fails, the mirror stays as of `rev` and `error`
+    says why, while the watcher retries from where it left off (or from
+    a new snapshot, if doozerd no longer has the changes it missed).
+    """
+
+    def __init__(self, client, glob='/**'):
+        """
+        @param client: Client, client to replicate through
+        @param glob: str, subtree to mirror, in the form '/path/**'
+        """
+        if not glob.endswith('/**'):
+            raise ValueError("mirror glob must cover a subtree ('/path/**')")
+        self._logger = logging.getLogger('pydoozer.Mirror')
+
+        self.client = client
+        self.glob = glob
+        self.files = {}
+        """path -> entry for every file in the subtree"""
+        self.dirs = {}
+        """path -> set of child names for every directory in the subtree"""
+        self.rev = None
+        """Revision the mirror currently reflects"""
+        self.error = None
+        """Why the mirror isn't being kept current, else None"""
+        self.watcher = None
+        self.future = None
+        """The watcher's pending WAIT"""
+        self.start()
+
+    def start(self):
+        self.stop()
+        self._snapshot()
+        self.error = None
+        self.watcher = gevent.spawn(self._watch_loop)
+
+    def stop(self):
+        if self.watcher:
+            self.watcher.kill()
+            self.watcher = None
+        if self.future:
+            self.future.discard()
+            self.future = None
+
+    def get(self, path):
+        """Return the entry for a file, or None if it doesn't exist"""
+        return self.files.get(path)
+
+    def getdir(self, path):
+        """Return the sorted names directly under a directory"""
+        try:
+            return sorted(self.dirs[path.rstrip('/') or '/'])
+        except KeyError:
+            raise KeyError(path)
+
+    def walk(self, glob=None):
+        """Return the entries of all files matching glob, in path order"""
+        if glob is None:
+            entries = self.files.values()
+        else:
+            match = compile_glob(glob).match
+            entries = [entry for path, entry in self.files.items() if match(path)]
+        return sorted(entries, key=lambda entry: entry.path.split('/'))
+
+    def _snapshot(self):
+        # Readers keep seeing the old tree until the new one is complete
+        files, dirs = {}, {}
+        rev = self.client.rev().rev
+        for entry in self.client.iwalk(self.glob, rev=rev):
+            _insert(files, dirs, entry)
+        self.files, self.dirs, self.rev = files, dirs, rev
+
+    def _set(self, entry):
+        _insert(self.files, self.dirs, entry)
+
+    def _delete(self, path):
+        self.files.pop(path, None)
+        # Directories are implicit; drop the ones left empty
+        while path != '/':
+            parent, name = path.rsplit('/', 1)
+            parent = parent or '/'
+            children = self.dirs.get(parent)
+            if children is None:
+                break
+            children.discard(name)
+            if children:
+                break
+            del self.dirs[parent]
+            path = parent
+
+    def _watch_loop(self):
+        wait = None
+        while True:
+            try:
+                self.future = self.client.wait_async(self.glob, self.rev + 1)
+                try:
+                    change = self.future.get()
+                except TooLate:
+                    self._logger.warning('Mirror fell behind, taking a new snapshot')
+                    self._snapshot()
+                    wait = self.error = None
+                    continue
+            except Exception as e:
+                self.error = e
+                base = self.client.connection.timeout or DEFAULT_RETRY_WAIT
+                wait = retry_wait(base, wait or base)
+                self._logger.warning('Error watching %s (%s), retrying in %.1fs',
+                                     self.glob, e, wait)
+                gevent.sleep(wait)
+                continue
+            wait = self.error = None
+            if change.flags & FLAG_DEL:
+                self._delete(change.path)
+            else:
+                self._set(change)
+            self.rev = change.rev
+
+
+def _insert(files, dirs, entry):
+    path = entry.path
+    files[path] = entry
+    while path != '/':
+        parent, name = path.rsplit('/', 1)
+        parent = parent or '/'
+        children = dirs.get(parent)
+        if children is None:
+            children = dirs[parent] = set()
+        elif name in children:
+            break
+        children.add(name)
+        path = parent
@@ -11,7 +11,8 @@ from google.protobuf import descriptor_pb2
 DESCRIPTOR = descriptor.FileDescriptor(
   name='msg.proto',
   package='server',
-  serialized_pb='\n\tmsg.proto\x12\x06server\"\xf2\x01\n\x07Request\x12\x0b\n\x03tag\x18\x01 \x01(\x05\x12\"\n\x04verb\x18\x02 \x01(\x0e\x32\x14.server.Request.Verb\x12\x0c\n\x04path\x18\x04 \x01(\t\x12\r\n\x05value\x18\x05 \x01(\x0c\x12\x11\n\tother_tag\x18\x06 \x01(\x05\x12\x0e\n\x06offset\x18\x07 \x01(\x05\x12\x0b\n\x03rev\x18\t \x01(\x03\"i\n\x04Verb\x12\x07\n\x03GET\x10\x01\x12\x07\n\x03SET\x10\x02\x12\x07\n\x03\x44\x45L\x10\x03\x12\x07\n\x03REV\x10\x05\x12\x08\n\x04WAIT\x10\x06\x12\x07\n\x03NOP\x10\x07\x12\x08\n\x04WALK\x10\t\x12\n\n\x06GETDIR\x10\x0e\x12\x08\n\x04STAT\x10\x10\x12\n\n\x06\x41\x43\x43\x45SS\x10\x63\"\xc8\x02\n\x08Response\x12\x0b\n\x03tag\x18\x01 \x01(\x05\x12\r\n\x05\x66lags\x18\x02 \x01(\x05\x12\x0b\n\x03rev\x18\x03 \x01(\x03\x12\x0c\n\x04path\x18\x05 \x01(\t\x12\r\n\x05value\x18\x06 \x01(\x0c\x12\x0b\n\x03len\x18\x08 \x01(\x05\x12&\n\x08\x65rr_code\x18\x64 \x01(\x0e\x32\x14.server.Response.Err\x12\x12\n\nerr_detail\x18\x65 \x01(\t\"\xac\x01\n\x03\x45rr\x12\t\n\x05OTHER\x10\x7f\x12\x0e\n\nTAG_IN_USE\x10\x01\x12\x10\n\x0cUNKNOWN_VERB\x10\x02\x12\x0c\n\x08READONLY\x10\x03\x12\x0c\n\x08TOO_LATE\x10\x04\x12\x10\n\x0cREV_MISMATCH\x10\x05\x12\x0c\n\x08\x42\x41\x44_PATH\x10\x06\x12\x0f\n\x0bMISSING_ARG\x10\x07\x12\t\n\x05RANGE\x10\x08\x12\n\n\x06NOTDIR\x10\x14\x12\t\n\x05ISDIR\x10\x15\x12\t\n\x05NOENT\x10\x16')
+  create_key=descriptor._internal_create_key,
+  serialized_pb=b'\n\tmsg.proto\x12\x06server\"\xf2\x01\n\x07Request\x12\x0b\n\x03tag\x18\x01 \x01(\x05\x12\"\n\x04verb\x18\x02 \x01(\x0e\x32\x14.server.Request.Verb\x12\x0c\n\x04path\x18\x04 \x01(\t\x12\r\n\x05value\x18\x05 \x01(\x0c\x12\x11\n\tother_tag\x18\x06 \x01(\x05\x12\x0e\n\x06offset\x18\x07 \x01(\x05\x12\x0b\n\x03rev\x18\t \x01(\x03\"i\n\x04Verb\x12\x07\n\x03GET\x10\x01\x12\x07\n\x03SET\x10\x02\x12\x07\n\x03\x44\x45L\x10\x03\x12\x07\n\x03REV\x10\x05\x12\x08\n\x04WAIT\x10\x06\x12\x07\n\x03NOP\x10\x07\x12\x08\n\x04WALK\x10\t\x12\n\n\x06GETDIR\x10\x0e\x12\x08\n\x04STAT\x10\x10\x12\n\n\x06\x41\x43\x43\x45SS\x10\x63\"\xc8\x02\n\x08Response\x12\x0b\n\x03tag\x18\x01 \x01(\x05\x12\r\n\x05\x66lags\x18\x02 \x01(\x05\x12\x0b\n\x03rev\x18\x03 \x01(\x03\x12\x0c\n\x04path\x18\x05 \x01(\t\x12\r\n\x05value\x18\x06 \x01(\x0c\x12\x0b\n\x03len\x18\x08 \x01(\x05\x12&\n\x08\x65rr_code\x18\x64 \x01(\x0e\x32\x14.server.Response.Err\x12\x12\n\nerr_detail\x18\x65 \x01(\t\"\xac\x01\n\x03\x45rr\x12\t\n\x05OTHER\x10\x7f\x12\x0e\n\nTAG_IN_USE\x10\x01\x12\x10\n\x0cUNKNOWN_VERB\x10\x02\x12\x0c\n\x08READONLY\x10\x03\x12\x0c\n\x08TOO_LATE\x10\x04\x12\x10\n\x0cREV_MISMATCH\x10\x05\x12\x0c\n\x08\x42\x41\x44_PATH\x10\x06\x12\x0f\n\x0bMISSING_ARG\x10\x07\x12\t\n\x05RANGE\x10\x08\x12\n\n\x06NOTDIR\x10\x14\x12\t\n\x05ISDIR\x10\x15\x12\t\n\x05NOENT\x10\x16')
 
 
 
@@ -24,48 +25,59 @@ _REQUEST_VERB = descriptor.EnumDescriptor(
     descriptor.EnumValueDescriptor(
       name='GET', index=0, number=1,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='SET', index=1, number=2,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='DEL', index=2, number=3,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='REV', index=3, number=5,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='WAIT', index=4, number=6,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='NOP', index=5, number=7,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='WALK', index=6, number=9,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='GETDIR', index=7, number=14,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='STAT', index=8, number=16,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='ACCESS', index=9, number=99,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
   ],
   containing_type=None,
   options=None,
   serialized_start=159,
   serialized_end=264,
+  create_key=descriptor._internal_create_key,
 )
 
 _RESPONSE_ERR = descriptor.EnumDescriptor(
@@ -77,56 +89,69 @@ _RESPONSE_ERR = descriptor.EnumDescriptor(
     descriptor.EnumValueDescriptor(
       name='OTHER', index=0, number=127,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='TAG_IN_USE', index=1, number=1,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='UNKNOWN_VERB', index=2, number=2,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='READONLY', index=3, number=3,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='TOO_LATE', index=4, number=4,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='REV_MISMATCH', index=5, number=5,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='BAD_PATH', index=6, number=6,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='MISSING_ARG', index=7, number=7,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='RANGE', index=8, number=8,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='NOTDIR', index=9, number=20,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='ISDIR', index=10, number=21,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
     descriptor.EnumValueDescriptor(
       name='NOENT', index=11, number=22,
       options=None,
-      type=None),
+      type=None,
+      create_key=descriptor._internal_create_key),
   ],
   containing_type=None,
   options=None,
   serialized_start=423,
   serialized_end=595,
+  create_key=descriptor._internal_create_key,
 )
 
 
@@ -143,49 +168,49 @@ _REQUEST = descriptor.Descriptor(
       has_default_value=False, default_value=0,
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
-      options=None),
+      options=None, create_key=descriptor._internal_create_key),
     descriptor.FieldDescriptor(
       name='verb', full_name='server.Request.verb', index=1,
       number=2, type=14, cpp_type=8, label=1,
       has_default_value=False, default_value=1,
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
-      options=None),
+      options=None, create_key=descriptor._internal_create_key),
     descriptor.FieldDescriptor(
       name='path', full_name='server.Request.path', index=2,
       number=4, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=unicode("", "utf-8"),
+      has_default_value=False, default_value=b"".decode('utf-8'),
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
-      options=None),
+      options=None, create_key=descriptor._internal_create_key),
     descriptor.FieldDescriptor(
       name='value', full_name='server.Request.value', index=3,
       number=5, type=12, cpp_type=9, label=1,
-      has_default_value=False, default_value="",
+      has_default_value=False, default_value=b"",
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
-      options=None),
+      options=None, create_key=descriptor._internal_create_key),
     descriptor.FieldDescriptor(
       name='other_tag', full_name='server.Request.other_tag', index=4,
       number=6, type=5, cpp_type=1, label=1,
       has_default_value=False, default_value=0,
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
-      options=None),
+      options=None, create_key=descriptor._internal_create_key),
     descriptor.FieldDescriptor(
       name='offset', full_name='server.Request.offset', index=5,
       number=7, type=5, cpp_type=1, label=1,
       has_default_value=False, default_value=0,
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
-      options=None),
+      options=None, create_key=descriptor._internal_create_key),
     descriptor.FieldDescriptor(
       name='rev', full_name='server.Request.rev', index=6,
       number=9, type=3, cpp_type=2, label=1,
       has_default_value=False, default_value=0,
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
-      options=None),
+      options=None, create_key=descriptor._internal_create_key),
   ],
   extensions=[
   ],
@@ -198,6 +223,7 @@ _REQUEST = descriptor.Descriptor(
   extension_ranges=[],
   serialized_start=22,
   serialized_end=264,
+  create_key=descriptor._internal_create_key,
 )
 
 
@@ -214,56 +240,56 @@ _RESPONSE = descriptor.Descriptor(
       has_default_value=False, default_value=0,
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
-      options=None),
+      options=None, create_key=descriptor._internal_create_key),
     descriptor.FieldDescriptor(
       name='flags', full_name='server.Response.flags', index=1,
       number=2, type=5, cpp_type=1, label=1,
       has_default_value=False, default_value=0,
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
-      options=None),
+      options=None, create_key=descriptor._internal_create_key),
     descriptor.FieldDescriptor(
       name='rev', full_name='server.Response.rev', index=2,
       number=3, type=3, cpp_type=2, label=1,
       has_default_value=False, default_value=0,
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
-      options=None),
+      options=None, create_key=descriptor._internal_create_key),
     descriptor.FieldDescriptor(
       name='path', full_name='server.Response.path', index=3,
       number=5, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=unicode("", "utf-8"),
+      has_default_value=False, default_value=b"".decode('utf-8'),
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
-      options=None),
+      options=None, create_key=descriptor._internal_create_key),
     descriptor.FieldDescriptor(
       name='value', full_name='server.Response.value', index=4,
       number=6, type=12, cpp_type=9, label=1,
-      has_default_value=False, default_value="",
+      has_default_value=False, default_value=b"",
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
-      options=None),
+      options=None, create_key=descriptor._internal_create_key),
     descriptor.FieldDescriptor(
       name='len', full_name='server.Response.len', index=5,
       number=8, type=5, cpp_type=1, label=1,
       has_default_value=False, default_value=0,
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
-      options=None),
+      options=None, create_key=descriptor._internal_create_key),
     descriptor.FieldDescriptor(
       name='err_code', full_name='server.Response.err_code', index=6,
       number=100, type=14, cpp_type=8, label=1,
       has_default_value=False, default_value=127,
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
-      options=None),
+      options=None, create_key=descriptor._internal_create_key),
     descriptor.FieldDescriptor(
       name='err_detail', full_name='server.Response.err_detail', index=7,
       number=101, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=unicode("", "utf-8"),
+      has_default_value=False, default_value=b"".decode('utf-8'),
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
-      options=None),
+      options=None, create_key=descriptor._internal_create_key),
   ],
   extensions=[
   ],
@@ -276,6 +302,7 @@ _RESPONSE = descriptor.Descriptor(
   extension_ranges=[],
   serialized_start=267,
   serialized_end=595,
+  create_key=descriptor._internal_create_key,
 )
 
 _REQUEST.fields_by_name['verb'].enum_type = _REQUEST_VERB
@@ -285,16 +312,16 @@ _RESPONSE_ERR.containing_type = _RESPONSE;
 DESCRIPTOR.message_types_by_name['Request'] = _REQUEST
 DESCRIPTOR.message_types_by_name['Response'] = _RESPONSE
 
-class Request(message.Message):
-  __metaclass__ = reflection.GeneratedProtocolMessageType
-  DESCRIPTOR = _REQUEST
-  
+Request = reflection.GeneratedProtocolMessageType('Request', (message.Message,), {
+  'DESCRIPTOR' : _REQUEST,
+  '__module__' : 'msg_pb2'
   # @@protoc_insertion_point(class_scope:server.Request)
+  })
 
-class Response(message.Message):
-  __metaclass__ = reflection.GeneratedProtocolMessageType
-  DESCRIPTOR = _RESPONSE
-  
+Response = reflection.GeneratedProtocolMessageType('Response', (message.Message,), {
+  'DESCRIPTOR' : _RESPONSE,
+  '__module__' : 'msg_pb2'
   # @@protoc_insertion_point(class_scope:server.Response)
+  })
 
 # @@protoc_insertion_point(module_scope)
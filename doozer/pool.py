@@ -0,0 +1,267 @@
+import collections
+import random
+import time
+
+import gevent
+import gevent.event
+
+from .client import REQUEST_TIMEOUT, Cancelled, Client, Connection, Request
+
+READ_VERBS = frozenset([Request.GET, Request.GETDIR, Request.WALK, Request.STAT, Request.REV])
+"""Verbs that may be answered by any node"""
+
+HEDGE_WINDOW = 1000
+"""Number of recent round trips per verb the hedge threshold is taken from"""
+
+HEDGE_MIN_SAMPLES = 64
+"""Round trips of a verb to see before hedging it"""
+
+HEDGE_BURST = 10
+"""Most hedges the budget can save up"""
+
+
+class LatencyWindow(object):
+    """
+    Recent round trips of one verb, and a quantile of them.
+
+    The quantile is recomputed every HEDGE_MIN_SAMPLES samples rather
+    than on every one, so adding a sample stays cheap.
+    """
+
+    def __init__(self, quantile, size=HEDGE_WINDOW):
+        self.quantile = quantile
+        self.samples = collections.deque(maxlen=size)
+        self.count = 0
+        self.threshold = None
+        """Latest quantile (seconds), None until there are enough samples"""
+
+    def add(self, latency):
+        self.samples.append(latency)
+        self.count += 1
+        if self.count % HEDGE_MIN_SAMPLES == 0:
+            samples = sorted(self.samples)
+            self.threshold = samples[min(len(samples) - 1,
+                                         int(len(samples) * self.quantile))]
+
+
+class HedgedRequest(gevent.event.AsyncResult):
+    """
+    Future for a read that may also be sent to a second node; resolves
+    with whichever answer arrives first.
+    """
+
+    def __init__(self, future, metrics=None):
+        gevent.event.AsyncResult.__init__(self)
+        self.connection = future.connection
+        self.request = future.request
+        self.retry = future.retry
+        self.timeout = future.timeout
+        self.futures = []
+        self.timer = None
+        self.metrics = metrics
+        self.add(future)
+
+    def add(self, future):
+        self.futures.append(future)
+        future.rawlink(self._answer)
+
+    def _answer(self, future):
+        if self.ready():
+            return
+        if isinstance(future.exception, gevent.Timeout) and \
+                not all(other.ready() for other in self.futures):
+            # The other node may still answer
+            return
+        if future.successful():
+            self.set(future.value)
+        else:
+            self.set_exception(future.exception)
+        if future is not self.futures[0] and self.metrics is not None:
+            self.metrics.incr('hedge_wins', node=future.connection.address)
+        self.discard()
+
+    def discard(self):
+        if self.timer is not None:
+            self.timer.stop()
+            self.timer = None
+        for future in self.futures:
+            future.discard()
+
+    def cancel(self):
+        if not self.ready():
+            self.discard()
+            self.set_exception(Cancelled(self.request))
+
+
+def _copy_request(request):
+    copy = Request()
+    for name in ('verb', 'path', 'value', 'offset', 'rev'):
+        if request.HasField(name):
+            setattr(copy, name, getattr(request, name))
+    return copy
+
+
+class PooledClient(Client):
+    """
+    Client holding a connection to each of several nodes.
+
+    Read-only verbs go to whichever connection has the fewest requests
+    in flight (any one of them, if several tie); everything else goes
+    to a single primary connection.
+    After a write, a read on a connection whose node hasn't yet been
+    seen at the write's revision is pinned to that revision, so a read
+    never observes the tree from before this client's own writes.
+
+    With hedging on, a read that hasn't been answered within the given
+    quantile of recent round trips for its verb is sent again to another
+    node, and the first answer wins. A budget caps the extra load: each
+    read earns hedge_budget of a hedge, and a hedge is only sent when a
+    whole one has been saved up.
+    """
+
+    def __init__(self, addrs=None, timeout=None, size=None, hedge_quantile=None,
+                 hedge_budget=0.05, **kwargs):
+        """
+        @param timeout: float|None, connection timeout in seconds (per address)
+        @param size: int|None, number of nodes to connect to (default: all)
+        @param hedge_quantile: float|None, hedge reads slower than this
+            quantile of recent ones, e.g. 0.95 (default: don't hedge)
+        @param hedge_budget: float, hedges allowed per read
+        @param kwargs: further options for each Connection
+        """
+        if addrs is None:
+            addrs = []
+        # Each connection prefers its own node but can fail over to the
+        # others; the first one (a random node) is the primary.
+        addrs = list(addrs)
+        random.shuffle(addrs)
+        kwargs['shuffle'] = False
+        self.connections = []
+        for i in range(min(size or len(addrs), len(addrs))):
+            self.connections.append(Connection(addrs[i:] + addrs[:i], timeout, **kwargs))
+        self.connection = self.connections[0]
+        self.seen_rev = {}
+        """Node address -> highest revision the node is known to have applied"""
+        self.write_rev = 0
+        """Revision of this client's latest write, None while it's unknown"""
+        self.hedge_quantile = hedge_quantile
+        self.hedge_budget = hedge_budget
+        self.hedge_tokens = 0.0
+        self.latencies = {}
+        """verb -> LatencyWindow"""
+        self.metrics = kwargs.get('metrics')
+        self.watches = {}
+        self.connect()
+
+    def connect(self):
+        for connection in self.connections:
+            connection.connect()
+
+    def disconnect(self):
+        for connection in self.connections:
+            connection.disconnect()
+
+    def access(self, secret, timeout=REQUEST_TIMEOUT):
+        request = Request(value=secret, verb=Request.ACCESS)
+        responses = [connection.send(request, timeout=timeout)
+                     for connection in self.connections]
+        return responses[0]
+
+    def _send(self, request, retry=True, timeout=REQUEST_TIMEOUT):
+        if request.verb not in READ_VERBS or self.write_rev is None:
+            return self._send_to(self.connection, request, retry, timeout)
+
+        future = self._send_to(self._pick(request), request, retry, timeout)
+        if self.hedge_quantile is None or len(self.connections) < 2:
+            return future
+
+        window = self.latencies.get(request.verb)
+        if window is None:
+            window = self.latencies[request.verb] = LatencyWindow(self.hedge_quantile)
+        sent = time.time()
+        self.hedge_tokens = min(HEDGE_BURST, self.hedge_tokens + self.hedge_budget)
+        if window.threshold is not None:
+            future = HedgedRequest(future, self.metrics)
+            future.timer = gevent.get_hub().loop.timer(window.threshold)
+            future.timer.start(self._hedge, future)
+        # Measured to the first answer: a hedged read's round trip is
+        # still at least the threshold, so hedging doesn't drag the
+        # threshold down.
+        future.rawlink(lambda future: window.add(time.time() - sent))
+        return future
+
+    def _hedge(self, hedged):
+        """Send a read that is taking too long to a second node"""
+        hedged.timer = None
+        if hedged.ready() or self.hedge_tokens < 1 or self.write_rev is None:
+            return
+        first = hedged.futures[0].connection
+        request = _copy_request(hedged.request)
+        connection = self._pick(request, exclude=first)
+        if connection is None:
+            return
+        self.hedge_tokens -= 1
+        if self.metrics is not None:
+            self.metrics.incr('hedges', node=connection.address)
+        hedged.add(self._send_to(connection, request, hedged.retry, hedged.timeout))
+
+    def _pick(self, request, exclude=None):
+        """
+        The connection with the fewest requests in flight (other than
+        exclude and any on its node), pinning request to this client's
+        latest write if that node might not have it yet. Ties are broken
+        at random, so sequential reads don't all land on the primary.
+        """
+        connections = [connection for connection in self.connections
+                       if exclude is None or (connection is not exclude
+                                              and connection.address != exclude.address)]
+        if not connections:
+            return None
+        fewest = min(len(c.pending) for c in connections)
+        connection = random.choice([c for c in connections if len(c.pending) == fewest])
+        # Keyed by node, not connection: a connection that failed over
+        # may now be talking to a node that lags behind the last one.
+        if self.seen_rev.get(connection.address, 0) < self.write_rev:
+            if request.verb == Request.REV:
+                # REV can't be pinned; ask a node known to be current
+                if exclude is not None:
+                    return None
+                connection = self.connection
+            elif not request.rev:
+                request.rev = self.write_rev
+        return connection
+
+    def _send_to(self, connection, request, retry, timeout):
+        future = connection.send_async(request, retry, timeout)
+        future.rawlink(self._observe)
+        return future
+
+    def _observe(self, future):
+        """Learn node and write revisions from a completed request"""
+        if not future.successful():
+            return
+        connection = future.connection
+        request = future.request
+        response = future.value
+        if request.verb in (Request.SET, Request.DEL):
+            if response.HasField('rev'):
+                self._wrote(connection, response.rev)
+            else:
+                # Until we know the revision of the delete, read from
+                # the primary, which applied it.
+                self.write_rev = None
+                self.connection.send_async(Request(verb=Request.REV)).rawlink(
+                    lambda rev: rev.successful() and self._wrote(connection, rev.value.rev))
+        else:
+            # A node that answered at (or with) a revision has applied it
+            self._seen(connection, max(request.rev or 0, response.rev))
+
+    def _wrote(self, connection, rev):
+        if self.write_rev is None or rev > self.write_rev:
+            self.write_rev = rev
+        self._seen(connection, rev)
+
+    def _seen(self, connection, rev):
+        address = connection.address
+        if address is not None and rev > self.seen_rev.get(address, 0):
+            self.seen_rev[address] = rev
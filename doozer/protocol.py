@@ -0,0 +1,980 @@
+"""
+The transport-independent parts of the doozer client: message classes,
+error mapping, URI and glob handling, the Entity result type and the
+halves of Connection and Client that don't do I/O, shared by the gevent
+client (doozer.client), the asyncio one (doozer.aio) and the threaded
+one (doozer.threaded).
+"""
+import collections
+import heapq
+import itertools
+import os
+import random
+import re
+import struct
+import time
+import types
+
+
+def _default_codec():
+    # The hand-written codec beats the pure-Python protobuf backend
+    # but not the C++ one; see benchmarks/codec.py.
+    try:
+        from google.protobuf.internal import api_implementation
+    except ImportError:
+        return "codec"
+    return "protobuf" if api_implementation.Type() == "cpp" else "codec"
+
+
+CODEC = os.environ.get("DOOZER_CODEC") or _default_codec()
+"""Message implementation: "codec" (doozer.codec) or "protobuf" (msg_pb2)"""
+
+if CODEC == "protobuf":
+    from google.protobuf.message import DecodeError
+    from .msg_pb2 import Response
+    from .msg_pb2 import Request
+else:
+    from .codec import DecodeError
+    from .codec import Response
+    from .codec import Request
+
+REQUEST_TIMEOUT = 2.0
+"""Default seconds to wait for a response (WAIT waits indefinitely)"""
+
+HEALTH_TIMEOUT = 5.0
+"""
+Seconds a connection may go without a response while requests are
+outstanding before it is pinged, and that the ping may then take
+before the connection is replaced
+"""
+
+RECV_BUFFER_SIZE = 64 * 1024
+"""Initial size of the receive buffer (bytes); grows to fit larger responses"""
+
+LIST_WINDOW = 64
+"""Default number of offsets walk() and getdir() keep in flight"""
+
+UPDATE_ATTEMPTS = 20
+"""Default number of conflicting SETs update() takes before giving up"""
+
+UPDATE_BACKOFF = 0.005
+"""Seconds update() backs off after its first conflict on an uncontended path"""
+
+UPDATE_BACKOFF_MAX = 0.5
+"""Longest update() ever backs off between attempts (seconds)"""
+
+CONTENTION_ALPHA = 0.2
+"""Weight of the latest update in a path's contention average"""
+
+DEFAULT_RETRY_WAIT = 2.0
+"""Default connection retry waiting time (seconds)"""
+
+RETRY_ROUNDS = 5
+"""Times every address is tried before reconnect() gives up"""
+
+DEFAULT_URI = "doozer:?%s" % "&".join([
+    "ca=127.0.0.1:8046",
+    "ca=127.0.0.1:8041",
+    "ca=127.0.0.1:8042",
+    "ca=127.0.0.1:8043",
+    ])
+
+VERB_NAMES = {
+    Request.GET: 'GET', Request.SET: 'SET', Request.DEL: 'DEL',
+    Request.REV: 'REV', Request.WAIT: 'WAIT', Request.NOP: 'NOP',
+    Request.WALK: 'WALK', Request.GETDIR: 'GETDIR', Request.STAT: 'STAT',
+    Request.ACCESS: 'ACCESS', }
+
+FLAG_SET = 4
+"""Response.flags bit on a WAIT response for a file that was set"""
+
+FLAG_DEL = 8
+"""Response.flags bit on a WAIT response for a file that was deleted"""
+
+
+class ConnectError(Exception): pass
+class RequestFailed(Exception):
+    def __init__(self, request):
+        self.request = request
+
+    def __str__(self):
+        return str(pb_dict(self.request))
+
+class ConnectionLost(RequestFailed):
+    """
+    The connection was lost while a request that isn't safe to resend
+    (a SET or DEL) was in flight; it may or may not have been applied.
+    """
+
+class Cancelled(RequestFailed):
+    """The request was cancelled before its response arrived"""
+
+class ResponseError(Exception):
+    def __init__(self, response, request):
+        self.code = response.err_code
+        self.detail = response.err_detail
+        self.response = response
+        self.request = request
+
+    def __str__(self):
+        return str(pb_dict(self.request))
+
+class TagInUse(ResponseError): pass
+class UnknownVerb(ResponseError): pass
+class Readonly(ResponseError): pass
+class TooLate(ResponseError): pass
+class RevMismatch(ResponseError): pass
+class BadPath(ResponseError): pass
+class MissingArg(ResponseError): pass
+class Range(ResponseError): pass
+class NotDirectory(ResponseError): pass
+class IsDirectory(ResponseError): pass
+class NoEntity(ResponseError): pass
+
+
+_EXCEPTIONS = {
+    Response.TAG_IN_USE: TagInUse, Response.UNKNOWN_VERB: UnknownVerb,
+    Response.READONLY: Readonly, Response.TOO_LATE: TooLate,
+    Response.REV_MISMATCH: RevMismatch, Response.BAD_PATH: BadPath,
+    Response.MISSING_ARG: MissingArg, Response.RANGE: Range,
+    Response.NOTDIR: NotDirectory, Response.ISDIR: IsDirectory,
+    Response.NOENT: NoEntity, }
+
+
+def response_exception(response):
+    """Takes a response, returns proper exception if it has an error code"""
+    if response.HasField('err_code'):
+        return _EXCEPTIONS.get(response.err_code, ResponseError)
+    else:
+        return None
+
+
+def pb_dict(message):
+    """Create dict representation of a protobuf message"""
+    if not hasattr(message, 'ListFields'):
+        fields = [name.lstrip('_') for name in message.__slots__ if name != '_present']
+        return dict([(name, getattr(message, name)) for name in fields
+                     if message.HasField(name)])
+    return dict([(field.name, value) for field, value in message.ListFields()])
+
+
+def parse_uri(uri):
+    """Parse the doozerd URI scheme to get node addresses"""
+    if uri.startswith("doozer:?"):
+        before, params = uri.split("?", 1)
+        addrs = []
+        for param in params.split("&"):
+            key, value = param.split("=", 1)
+            if key == "ca":
+                addrs.append(value)
+        return addrs
+    else:
+        raise ValueError("invalid doozerd uri")
+
+
+def split_addr(addr):
+    """Split a node address into host and port"""
+    parts = addr.split(':')
+    host = parts[0]
+    port = int(parts[1]) if len(parts) > 1 else 8046
+    return host, port
+
+
+
+def pack_request(request):
+    """Serialize a request into a length-prefixed frame"""
+    data = request.SerializeToString()
+    return struct.pack(">I", len(data)) + data
+
+
+def retry_wait(base, previous):
+    """
+    Seconds to wait before the next round of connection attempts.
+
+    Decorrelated jitter: spread out the clients that lost the same
+    node, so they don't all come back in lockstep.
+    """
+    return min(base * 2**(RETRY_ROUNDS - 1), random.uniform(base, previous * 3))
+
+
+def compile_glob(glob):
+    """
+    Compile a doozerd glob into a regular expression.
+
+    '?' matches one character and '*' any number of characters within a
+    path segment; '**' matches any number of characters including '/'.
+    """
+    pattern = []
+    i = 0
+    while i < len(glob):
+        if glob.startswith('**', i):
+            pattern.append('.*')
+            i += 2
+        elif glob[i] == '*':
+            pattern.append('[^/]*')
+            i += 1
+        elif glob[i] == '?':
+            pattern.append('[^/]')
+            i += 1
+        else:
+            pattern.append(re.escape(glob[i]))
+            i += 1
+    return re.compile(''.join(pattern) + '$')
+
+
+class Entity(object):
+    """
+    A file or directory entry, as returned by get(), walk(), getdir()
+    and wait().
+
+    With doozer.codec, the value is a memoryview into the response's
+    copy of the frame and only becomes bytes when first read.
+    """
+
+    __slots__ = ('path', 'rev', 'flags', '_value')
+
+    def __init__(self, path, rev=0, flags=0, value=b''):
+        self.path = path
+        self.rev = rev
+        self.flags = flags
+        self._value = value
+
+    @classmethod
+    def from_response(cls, response, request):
+        try:
+            # doozer.codec.Response, whose value is still a view
+            value = response._value
+        except AttributeError:
+            value = response.value
+        # A GET response doesn't name the file; the request does
+        path = request.path if request.verb == Request.GET else response.path
+        return cls(path, response.rev, response.flags, value)
+
+    @property
+    def value(self):
+        value = self._value
+        if type(value) is memoryview:
+            value = self._value = value.tobytes()
+        return value
+
+    def __repr__(self):
+        return 'Entity(path=%r, rev=%r, flags=%r, value=%r)' % (
+            self.path, self.rev, self.flags, self.value)
+
+
+ENTITY_VERBS = frozenset([Request.GET, Request.WALK, Request.GETDIR, Request.WAIT])
+"""Verbs whose responses are returned as Entity objects"""
+
+
+class Contention(object):
+    """
+    How contended compare-and-swap updates have been, per path: a moving
+    average of the conflicts each update ran into. The backoff after a
+    conflict grows with it, so the more writers fight over a path the
+    further apart their retries spread.
+    """
+
+    def __init__(self):
+        self.paths = {}
+        """path -> average conflicts per update; only contended paths"""
+
+    def backoff(self, path, conflicts):
+        """Seconds to wait after the given number of conflicts in a row"""
+        scale = 1 + self.paths.get(path, 0.0)
+        ceiling = min(UPDATE_BACKOFF_MAX, UPDATE_BACKOFF * scale * 2**(conflicts - 1))
+        return random.uniform(0, ceiling)
+
+    def record(self, path, conflicts):
+        """Record that an update of path ran into this many conflicts"""
+        level = (self.paths.get(path, 0.0) * (1 - CONTENTION_ALPHA)
+                 + conflicts * CONTENTION_ALPHA)
+        if level < 0.01:
+            self.paths.pop(path, None)
+        else:
+            self.paths[path] = level
+
+
+class Sleep(object):
+    """A step that pauses a step generator; see BaseClient._run()"""
+
+    __slots__ = ('seconds',)
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+
+class Return(Exception):
+    """
+    Raised by a step generator to finish with a value, which Python 2
+    generators can't return.
+    """
+
+    def __init__(self, value=None):
+        Exception.__init__(self, value)
+        self.value = value
+
+
+def flatten_steps(steps):
+    """
+    Run a step generator, and the step generators it yields in turn,
+    as one that only yields futures and Sleeps and raises Return with
+    the outer generator's result.
+    """
+    stack = [steps]
+    result = exception = None
+    while stack:
+        try:
+            if exception is None:
+                step = stack[-1].send(result)
+            else:
+                step = stack[-1].throw(exception)
+        except Return as e:
+            stack.pop()
+            result, exception = e.value, None
+            continue
+        except StopIteration:
+            stack.pop()
+            result = exception = None
+            continue
+        except BaseException as e:
+            stack.pop()
+            if not stack:
+                raise
+            result, exception = None, e
+            continue
+        if isinstance(step, types.GeneratorType):
+            stack.append(step)
+            result = exception = None
+            continue
+        try:
+            result, exception = (yield step), None
+        except BaseException as e:
+            result, exception = None, e
+    raise Return(result)
+
+
+class ResponseBuffer(object):
+    """
+    Receive buffer for a stream of length-prefixed responses.
+
+    Responses are read in large chunks into a reusable buffer and
+    parsed straight out of it, so a burst of small responses costs one
+    recv_into() rather than two recv() calls each.
+    """
+
+    def __init__(self, size=RECV_BUFFER_SIZE):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = self.end = 0
+
+    def recv_from(self, sock):
+        """Read what sock has into the buffer; IOError once it's closed"""
+        start, end = self.start, self.end
+        if start == end:
+            start = end = 0
+        elif end == len(self.buf):
+            # Move the partial frame to the front, growing the buffer
+            # if the frame is larger than all of it.
+            partial = self.buf[start:end]
+            if start == 0:
+                self.buf = bytearray(len(self.buf) * 2)
+                self.view = memoryview(self.buf)
+            self.buf[:len(partial)] = partial
+            start, end = 0, len(partial)
+        self.start = start
+        received = sock.recv_into(self.view[end:])
+        if not received:
+            raise IOError('connection closed by server')
+        self.end = end + received
+
+    def responses(self):
+        """
+        Parse every complete frame that is buffered; yields (Response,
+        frame length) pairs. Raises DecodeError on a bad frame.
+        """
+        buf, view = self.buf, self.view
+        start, end = self.start, self.end
+        while end - start >= 4:
+            length = struct.unpack_from(">I", buf, start)[0]
+            frame_end = start + 4 + length
+            if frame_end > end:
+                break
+            response = Response()
+            response.ParseFromString(view[start + 4:frame_end])
+            self.start = start = frame_end
+            yield response, 4 + length
+
+
+class BaseConnection(object):
+    """
+    The parts of a Connection that don't depend on how it does I/O:
+    the order to try the nodes in, request tags, deadlines and which
+    requests a new connection sends again. Subclasses set self._logger
+    and own the socket.
+    """
+
+    def __init__(self, addrs=None, timeout=None, metrics=None, shuffle=True,
+                 health_timeout=HEALTH_TIMEOUT):
+        """
+        @param timeout: float|None, connection timeout in seconds (per address)
+        @param metrics: doozer.metrics.Metrics|None, where to record metrics
+        @param shuffle: bool, randomize the order addrs are tried in
+        @param health_timeout: float|None, see HEALTH_TIMEOUT; None never
+            gives up on a connection that is still open
+        """
+        if addrs is None:
+            addrs = []
+        self.addrs = addrs
+        self.addrs_index = 0
+        """Next address to connect to in self.addrs"""
+        self.rtt = {}
+        """Round-trip estimates (seconds) by "host:port"; inf if unreachable"""
+        self.address = None
+        self.timeout = timeout
+        self.metrics = metrics
+        self.health_timeout = health_timeout
+        self.received = time.time()
+        """When data last arrived on the current connection"""
+        self.ping = None
+        """REV sent to check the connection, while it's unanswered"""
+        self.ping_sent = None
+
+        self.pending = {}
+        """In-flight requests: tag -> PendingRequest"""
+        self.next_tag = 0
+        """Next tag to hand out; advances monotonically, wrapping at 2**31"""
+        self.outgoing = []
+        """Packets queued for the next write"""
+        self.deadlines = []
+        """Heap of (deadline, sequence, PendingRequest) for requests with a timeout"""
+        self.sequence = itertools.count()
+
+        # Shuffle the addresses so all clients don't connect to the
+        # same node in the cluster.
+        if shuffle:
+            random.shuffle(addrs)
+
+    def _allocate_tag(self):
+        """
+        Hand out the next free tag.
+
+        Tags advance monotonically instead of restarting at 0, so
+        allocation is O(1) no matter how many requests are in flight,
+        and a tag is only reused after 2**31 others, which keeps a late
+        reply to a discarded request from being matched to a new one.
+        """
+        tag = self.next_tag
+        while tag in self.pending:
+            tag = (tag + 1) % 2**31
+        self.next_tag = (tag + 1) % 2**31
+        return tag
+
+    def _candidates(self, failed=None):
+        """
+        Addresses in the order to try them.
+
+        Once nodes have been probed, the fastest healthy node comes first
+        and nodes that failed come last; until then the addresses are
+        tried round-robin. The node we just lost is always tried last.
+        """
+        if self.rtt:
+            unknown = min(self.rtt.values())
+            order = sorted(self.addrs, key=lambda addr: self.rtt.get(
+                "%s:%s" % split_addr(addr), unknown))
+        else:
+            index = self.addrs_index
+            self.addrs_index = (index + 1) % len(self.addrs)
+            order = self.addrs[index:] + self.addrs[:index]
+        if failed:
+            order.sort(key=lambda addr: "%s:%s" % split_addr(addr) == failed)
+        return order
+
+    def _attempts(self, failed=None, default_wait=None):
+        """
+        Yield (wait, addr) for every connection attempt a reconnect
+        makes: the address to try, after sleeping `wait` seconds.
+        Raises ConnectError once all of them have failed.
+
+        @param failed: str|None, the node we just lost
+        @param default_wait: float|None, base backoff when the
+            connection has no timeout of its own
+        """
+        base_wait = self.timeout or default_wait or DEFAULT_RETRY_WAIT
+        wait = base_wait
+        for retry in range(RETRY_ROUNDS):
+            if retry:
+                wait = retry_wait(base_wait, wait)
+                self._logger.debug('Waiting %.1f seconds to reconnect', wait)
+            # Every other node is tried straight away; only when none
+            # of them answers do we back off.
+            for i, addr in enumerate(self._candidates(failed)):
+                yield (wait if retry and not i else 0), addr
+
+        self._logger.error('Could not connect to any of the defined addresses')
+        raise ConnectError("Can't connect to any of the addresses: %s" % self.addrs)
+
+    def _push_deadline(self, future, deadline):
+        """
+        Time a request out at deadline; returns whether it is now the
+        earliest one.
+
+        All of a connection's deadlines share one heap, so only the
+        earliest needs a timer; answered requests are dropped from the
+        heap lazily, so thousands in flight stay cheap.
+        """
+        deadlines = self.deadlines
+        heapq.heappush(deadlines, (deadline, next(self.sequence), future))
+        if len(deadlines) > 2 * len(self.pending) + 64:
+            # Mostly answered requests; don't let them pile up
+            deadlines[:] = [entry for entry in deadlines
+                            if self.pending.get(entry[2].request.tag) is entry[2]]
+            heapq.heapify(deadlines)
+        return deadlines[0][2] is future
+
+    def _pop_expired(self, now):
+        """
+        Drop every request past its deadline from pending and return
+        them, for the caller to fail.
+
+        A deadline belongs to whoever sent the request and fails only
+        that request; it says nothing about the connection, which other
+        requests share (see _check_health()).
+        """
+        expired = []
+        deadlines = self.deadlines
+        while deadlines:
+            deadline, _, future = deadlines[0]
+            if self.pending.get(future.request.tag) is not future:
+                # Answered, discarded or cancelled
+                heapq.heappop(deadlines)
+                continue
+            if deadline > now:
+                break
+            heapq.heappop(deadlines)
+            del self.pending[future.request.tag]
+            expired.append(future)
+        return expired
+
+    def _check_health(self, now):
+        """
+        Returns whether the connection still works; transports call it
+        about every health_timeout/2 seconds while connected, and
+        replace the connection when it returns False.
+
+        A connection is only suspect when requests other than WAITs
+        (which can legitimately go unanswered for ever) have been
+        outstanding for health_timeout without anything arriving. It is
+        then pinged with a REV, and given up on if that goes unanswered
+        for another health_timeout. Only single dict operations are
+        made on pending, so the threaded transport can call this
+        without holding its lock.
+        """
+        ping = self.ping
+        if ping is not None:
+            if self.pending.get(ping.request.tag) is ping:
+                if now - self.ping_sent < self.health_timeout:
+                    return True
+                self.pending.pop(ping.request.tag, None)
+                self.ping = None
+                return False
+            self.ping = None
+        if not any(future.request.verb != Request.WAIT
+                   for future in list(self.pending.values())):
+            # Nothing is owed, so silence means nothing
+            self.received = now
+        elif now - self.received >= self.health_timeout:
+            self.ping_sent = now
+            self.ping = self.send_async(Request(verb=Request.REV))
+        return True
+
+    def _retransmit_pending(self):
+        """
+        Queue every pending request again for the new connection, as
+        nothing that was in transit on the old one is getting a reply.
+
+        Returns the ones that can't be: a request sent with retry=False
+        (SET and DEL) that may have reached the old node may already
+        have been applied, so it is dropped, for the caller to fail with
+        ConnectionLost. One that was still queued here is sent as usual.
+        """
+        # Anything still queued is pending as well, and the new
+        # connection must not see the same tag twice.
+        unsent = set(id(packet) for packet in self.outgoing)
+        self.outgoing = []
+        lost = []
+        for tag, future in list(self.pending.items()):
+            if future.retry or id(future.packet) in unsent:
+                self.outgoing.append(future.packet)
+            else:
+                del self.pending[tag]
+                lost.append(future)
+                if self.metrics is not None:
+                    self.metrics.incr('lost', verb=VERB_NAMES.get(future.request.verb))
+        if self.outgoing:
+            self._logger.debug('Retransmitting %d packets', len(self.outgoing))
+            if self.metrics is not None:
+                self.metrics.incr('retransmits', len(self.outgoing))
+        return lost
+
+
+class BaseClient(object):
+    """
+    The verbs of a doozer client, on top of two methods a transport
+    provides: _send(request, retry, timeout), which sends a request and
+    returns a future for it, and _result(future), which waits for it.
+    The futures need a discard() method.
+
+    Verbs that take several round trips are written once, as step
+    generators: they yield the futures they need answered (and Sleeps),
+    and _run() carries them out, so a transport whose verbs return
+    awaitables only has to override _run().
+    """
+
+    metrics = None
+    """doozer.metrics.Metrics|None, where update() records its retries"""
+
+    # Every verb takes a timeout in seconds (None to wait indefinitely);
+    # the futures the *_async verbs return can also be cancel()ed.
+
+    def rev(self, timeout=REQUEST_TIMEOUT):
+        return self._result(self.rev_async(timeout))
+
+    def rev_async(self, timeout=REQUEST_TIMEOUT):
+        request = Request(verb=Request.REV)
+        return self._send(request, timeout=timeout)
+
+    def set(self, path, value, rev, timeout=REQUEST_TIMEOUT):
+        return self._result(self.set_async(path, value, rev, timeout))
+
+    def set_async(self, path, value, rev, timeout=REQUEST_TIMEOUT):
+        request = Request(path=path, value=value, rev=rev, verb=Request.SET)
+        return self._send(request, retry=False, timeout=timeout)
+
+    def get(self, path, rev=None, timeout=REQUEST_TIMEOUT):
+        return self._result(self.get_async(path, rev, timeout))
+
+    def get_async(self, path, rev=None, timeout=REQUEST_TIMEOUT):
+        request = Request(path=path, verb=Request.GET)
+        if rev:
+            request.rev = rev
+        return self._send(request, timeout=timeout)
+
+    def delete(self, path, rev, timeout=REQUEST_TIMEOUT):
+        return self._result(self.delete_async(path, rev, timeout))
+
+    def delete_async(self, path, rev, timeout=REQUEST_TIMEOUT):
+        request = Request(path=path, rev=rev, verb=Request.DEL)
+        return self._send(request, retry=False, timeout=timeout)
+
+    def wait(self, path, rev, timeout=None):
+        return self._result(self.wait_async(path, rev, timeout))
+
+    def wait_async(self, path, rev, timeout=None):
+        request = Request(path=path, rev=rev, verb=Request.WAIT)
+        return self._send(request, timeout=timeout)
+
+    def stat(self, path, rev, timeout=REQUEST_TIMEOUT):
+        return self._result(self.stat_async(path, rev, timeout))
+
+    def stat_async(self, path, rev, timeout=REQUEST_TIMEOUT):
+        request = Request(path=path, rev=rev, verb=Request.STAT)
+        return self._send(request, timeout=timeout)
+
+    def access(self, secret, timeout=REQUEST_TIMEOUT):
+        return self._result(self.access_async(secret, timeout))
+
+    def access_async(self, secret, timeout=REQUEST_TIMEOUT):
+        request = Request(value=secret, verb=Request.ACCESS)
+        return self._send(request, timeout=timeout)
+
+    def get_many(self, paths, rev=None, timeout=REQUEST_TIMEOUT):
+        """
+        Get many files at one revision (the current one by default),
+        with every GET in flight at once.
+
+        Returns a list in the order of paths holding the Entity for
+        each, or the ResponseError it got (e.g. TooLate).
+        """
+        return self._run(self._get_many(paths, rev, timeout))
+
+    def _get_many(self, paths, rev, timeout):
+        if not rev:
+            rev = (yield self.rev_async(timeout)).rev
+        results = yield self._gather([self.get_async(path, rev, timeout) for path in paths])
+        raise Return(results)
+
+    def set_many(self, items, timeout=REQUEST_TIMEOUT):
+        """
+        Set many files, with every SET in flight at once.
+
+        @param items: iterable of (path, value, rev)
+        Returns a list in the order of items holding the new rev of
+        each file, or the error its SET got (e.g. RevMismatch); one
+        failing doesn't stop the others.
+        """
+        return self._run(self._set_many(items, timeout))
+
+    def _set_many(self, items, timeout):
+        futures = [self.set_async(path, value, rev, timeout) for path, value, rev in items]
+        results = yield self._gather(futures)
+        raise Return([getattr(result, 'rev', result) for result in results])
+
+    def delete_many(self, items, timeout=REQUEST_TIMEOUT):
+        """
+        Delete many files, with every DEL in flight at once.
+
+        @param items: iterable of (path, rev)
+        Returns a list in the order of items holding None for each file
+        deleted, or the error its DEL got (e.g. RevMismatch); one
+        failing doesn't stop the others.
+        """
+        return self._run(self._delete_many(items, timeout))
+
+    def _delete_many(self, items, timeout):
+        futures = [self.delete_async(path, rev, timeout) for path, rev in items]
+        results = yield self._gather(futures)
+        raise Return([result if isinstance(result, Exception) else None
+                      for result in results])
+
+    def update(self, path, fn, entity=None, attempts=UPDATE_ATTEMPTS,
+               timeout=REQUEST_TIMEOUT):
+        """
+        Replace the value of a file with fn(value), by compare-and-swap.
+
+        fn gets the current value (None if there is no such file) and
+        returns the new one; it is called again, with the value that
+        won, every time another writer gets in first. After each such
+        conflict, update() backs off for a jittered time that grows with
+        the conflicts in a row and with how contended the path has been
+        lately.
+
+        @param entity: Entity|None, the file as already read (e.g. from
+            a Cache or Mirror); the first attempt uses it instead of a GET
+        @param attempts: int, conflicts to take before raising RevMismatch
+        Returns the rev of the write.
+        """
+        return self._run(self._update(path, fn, entity, attempts, timeout))
+
+    def _update(self, path, fn, entity, attempts, timeout):
+        contention = getattr(self, 'contention', None)
+        if contention is None:
+            contention = self.contention = Contention()
+        conflicts = 0
+        while True:
+            if entity is None:
+                entity = yield self.get_async(path, timeout=timeout)
+            value = entity.value if entity.rev else None
+            try:
+                rev = (yield self.set_async(path, fn(value), entity.rev, timeout)).rev
+                break
+            except RevMismatch:
+                conflicts += 1
+                if conflicts >= attempts:
+                    contention.record(path, conflicts)
+                    if self.metrics is not None:
+                        self.metrics.incr('update_retries', conflicts - 1)
+                        self.metrics.incr('update_failures')
+                    raise
+                wait = contention.backoff(path, conflicts)
+                if self.metrics is not None:
+                    self.metrics.observe('update_backoff', wait)
+                yield Sleep(wait)
+                entity = None
+
+        contention.record(path, conflicts)
+        if self.metrics is not None:
+            self.metrics.incr('updates')
+            self.metrics.incr('update_retries', conflicts)
+        raise Return(rev)
+
+    def _sleep(self, seconds):
+        time.sleep(seconds)
+
+    def _run(self, steps):
+        """
+        Carry out a step generator: wait for every future it yields
+        with _result() and sleep for every Sleep, sending it the outcome
+        of each; returns what it finishes with (see Return).
+        """
+        steps = flatten_steps(steps)
+        result = exception = None
+        while True:
+            try:
+                if exception is None:
+                    step = steps.send(result)
+                else:
+                    step = steps.throw(exception)
+            except Return as e:
+                return e.value
+            result = exception = None
+            try:
+                if isinstance(step, Sleep):
+                    self._sleep(step.seconds)
+                else:
+                    result = self._result(step)
+            except BaseException as e:
+                # Into the generator, so it can clean up (or handle it)
+                exception = e
+
+    def _gather(self, futures):
+        """
+        Step generator waiting for every future in turn, keeping the
+        ResponseError or RequestFailed of one in place of its result;
+        anything else (a timeout, ConnectError) is raised.
+        """
+        results = []
+        try:
+            for future in futures:
+                try:
+                    results.append((yield future))
+                except (ResponseError, RequestFailed) as e:
+                    results.append(e)
+        finally:
+            for future in futures[len(results):]:
+                future.discard()
+        raise Return(results)
+
+    def _getdir(self, path, offset=0, rev=None, timeout=REQUEST_TIMEOUT):
+        return self._result(self._getdir_async(path, offset, rev, timeout))
+
+    def _getdir_async(self, path, offset=0, rev=None, timeout=REQUEST_TIMEOUT):
+        request = Request(path=path, offset=offset, verb=Request.GETDIR)
+        if rev:
+            request.rev = rev
+        return self._send(request, timeout=timeout)
+
+    def _walk(self, path, offset=0, rev=None, timeout=REQUEST_TIMEOUT):
+        return self._result(self._walk_async(path, offset, rev, timeout))
+
+    def _walk_async(self, path, offset=0, rev=None, timeout=REQUEST_TIMEOUT):
+        request = Request(path=path, offset=offset, verb=Request.WALK)
+        if rev:
+            request.rev = rev
+        return self._send(request, timeout=timeout)
+
+    def _ilist(self, method, path, offset=None, rev=None, window=LIST_WINDOW,
+               timeout=REQUEST_TIMEOUT):
+        offset = offset or 0
+        if not rev:
+            # Pin every offset to one revision, so the listing is
+            # consistent even though it spans many requests.
+            rev = self.rev(timeout).rev
+        send = getattr(self, method + '_async')
+
+        # Keep a window of offsets in flight instead of paying a round
+        # trip per entry; whatever is still in flight past the end of
+        # the listing (or when the caller stops early) is discarded.
+        # The window starts at one and grows by one per entry, doubling
+        # every round trip up to `window`, so a short listing doesn't
+        # pay for a full window of requests past its end.
+        pending = collections.deque([send(path, offset, rev, timeout)])
+        offset += 1
+        size = 1
+
+        try:
+            while True:
+                try:
+                    response = self._result(pending.popleft())
+                except ResponseError as e:
+                    if e.code == Response.RANGE:
+                        return
+                    else:
+                        raise e
+                size = min(size + 1, window)
+                while len(pending) < size:
+                    pending.append(send(path, offset, rev, timeout))
+                    offset += 1
+                yield response
+        finally:
+            for future in pending:
+                future.discard()
+
+    def iwalk(self, path, offset=None, rev=None, window=LIST_WINDOW,
+              timeout=REQUEST_TIMEOUT):
+        """
+        Like walk(), but yields entries as they arrive with at most
+        `window` requests read ahead.
+        """
+        return self._ilist('_walk', path, offset, rev, window, timeout)
+
+    def igetdir(self, path, offset=None, rev=None, window=LIST_WINDOW,
+                timeout=REQUEST_TIMEOUT):
+        """
+        Like getdir(), but yields entries as they arrive with at most
+        `window` requests read ahead.
+        """
+        return self._ilist('_getdir', path, offset, rev, window, timeout)
+
+    def walk(self, path, offset=None, rev=None, timeout=REQUEST_TIMEOUT):
+        return list(self.iwalk(path, offset, rev, timeout=timeout))
+
+    def getdir(self, path, offset=None, rev=None, timeout=REQUEST_TIMEOUT):
+        return list(self.igetdir(path, offset, rev, timeout=timeout))
+
+
+class Subscription(object):
+    def __init__(self, watch, rev, callback, errback=None):
+        self.watch = watch
+        self.rev = rev
+        self.callback = callback
+        self.errback = errback
+
+    def cancel(self):
+        self.watch.unsubscribe(self)
+
+
+class BaseWatch(object):
+    """
+    A WAIT chain on one glob, fanned out to its subscribers. This is
+    the part that doesn't depend on how the chain is driven; subclasses
+    set self._logger, run the chain and provide stop(), which must also
+    take the Watch out of client.watches.
+    """
+
+    def __init__(self, client, glob, rev):
+        self.client = client
+        self.glob = glob
+        self.rev = rev
+        """Next revision to wait for"""
+        self.subscribers = []
+        self.future = None
+
+    def unsubscribe(self, subscription):
+        if subscription in self.subscribers:
+            self.subscribers.remove(subscription)
+        if not self.subscribers:
+            self.stop()
+
+    def _unregister(self):
+        if self.client.watches.get(self.glob) is self:
+            del self.client.watches[self.glob]
+
+    def _deliver(self, change):
+        """Hand a change to every subscriber that asked for its rev"""
+        self.rev = change.rev + 1
+        for subscription in list(self.subscribers):
+            if change.rev < subscription.rev:
+                continue
+            try:
+                subscription.callback(change)
+            except Exception:
+                self._logger.exception('Error in watch callback for %s', self.glob)
+
+    def _skipped(self, error, rev):
+        """
+        Go on from rev after the changes at self.rev were found to be
+        gone from doozerd's history, telling the subscribers' errbacks.
+
+        @param error: TooLate, what the WAIT got
+        @param rev: int, the current revision
+        """
+        self._logger.warning('Changes to %s before rev %d are gone, '
+                             'skipping ahead', self.glob, self.rev)
+        self.rev = rev + 1
+        for subscription in list(self.subscribers):
+            if subscription.errback is None:
+                continue
+            try:
+                subscription.errback(error)
+            except Exception:
+                self._logger.exception('Error in watch errback for %s', self.glob)
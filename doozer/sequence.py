@@ -0,0 +1,128 @@
+import time
+
+import gevent
+
+DEFAULT_BLOCK = 1000
+"""IDs reserved by a Sequence's first CAS"""
+
+MIN_BLOCK = 100
+MAX_BLOCK = 1000000
+
+BLOCK_SECONDS = 10.0
+"""A block is sized to last about this long at the observed rate"""
+
+RATE_ALPHA = 0.5
+"""Weight of the latest block in the moving average of the ID rate"""
+
+
+class Sequence(object):
+    """
+    Increasing integer IDs from a counter file, reserved a block at a time.
+
+    The counter holds the last ID handed out by anyone. Each block is
+    reserved with a single Client.update() that advances the counter by
+    the block's size, after which next() hands its IDs out locally.
+    Once `prefetch` of a block is used, the next one is reserved in the
+    background, so next() only waits on doozerd when IDs are used up
+    faster than one round trip. Blocks are sized to last about
+    `block_seconds` at the rate IDs have been used, growing at most
+    twofold from one reservation to the next.
+
+    IDs are unique across every process sharing the counter, and
+    increase within each; the IDs left in a block when the process
+    exits are never handed out.
+    """
+
+    def __init__(self, client, path, block=DEFAULT_BLOCK, min_block=MIN_BLOCK,
+                 max_block=MAX_BLOCK, block_seconds=BLOCK_SECONDS, prefetch=0.5):
+        """
+        @param client: Client, client to reserve blocks through
+        @param path: str, counter file
+        @param block: int, size of the first block
+        @param min_block, max_block: int, bounds of the block size
+        @param block_seconds: float, how long a block should last
+        @param prefetch: float, fraction of a block used before the
+            next one is reserved
+        """
+        self.client = client
+        self.path = path
+        self.block = block
+        self.min_block = min_block
+        self.max_block = max_block
+        self.block_seconds = block_seconds
+        self.prefetch = prefetch
+
+        self.next_id = 0
+        self.end = 0
+        """The current block is [next_id, end)"""
+        self.low_water = 0
+        """Reserve the next block once only this many IDs are left"""
+        self.refill = None
+        """Greenlet reserving the next block, if any"""
+        self.rate = None
+        """Moving average of IDs used per second"""
+        self.issued = 0
+        self.issued_since = None
+        """IDs handed out, and when the rate was last measured"""
+        self.reservations = 0
+
+    def next(self):
+        """Return the next ID"""
+        while self.next_id >= self.end:
+            if self.refill is None:
+                self.refill = gevent.spawn(self._reserve, self.block)
+            refill = self.refill
+            try:
+                start, end = refill.get()
+            finally:
+                # Every waiter wakes up with the same block; the first
+                # takes it.
+                if self.refill is refill:
+                    self.refill = None
+                    if refill.successful():
+                        self._take(start, end)
+
+        id = self.next_id
+        self.next_id += 1
+        self.issued += 1
+        if self.end - self.next_id <= self.low_water and self.refill is None:
+            self.refill = gevent.spawn(self._reserve, self.block)
+        return id
+
+    __next__ = next
+
+    def __iter__(self):
+        return self
+
+    def _reserve(self, size):
+        """Advance the counter by size; returns the block of IDs it reserved"""
+        reserved = []
+
+        def advance(value):
+            last = int(value) if value else 0
+            reserved[:] = [last + 1]
+            return ('%d' % (last + size)).encode('ascii')
+
+        self.client.update(self.path, advance)
+        self.reservations += 1
+        return reserved[0], reserved[0] + size
+
+    def _take(self, start, end):
+        """Start handing out IDs from a new block, and size the next one"""
+        now = time.time()
+        if self.issued_since is not None:
+            elapsed = max(now - self.issued_since, 1e-3)
+            rate = self.issued / elapsed
+            if self.rate is None:
+                self.rate = rate
+            else:
+                self.rate = self.rate * (1 - RATE_ALPHA) + rate * RATE_ALPHA
+            # A burst measured over a few milliseconds says little about
+            # the sustained rate, so let a block at most double.
+            block = min(int(self.rate * self.block_seconds), 2 * self.block)
+            self.block = max(self.min_block, min(self.max_block, block))
+        self.issued = 0
+        self.issued_since = now
+
+        self.next_id, self.end = start, end
+        self.low_water = int((end - start) * (1 - self.prefetch))
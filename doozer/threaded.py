@@ -0,0 +1,526 @@
+"""
+Thread-safe blocking client for doozerd, for processes that don't run
+gevent (Python 3).
+
+Any number of threads can share one Client and its single socket:
+requests are tagged and multiplexed exactly as in doozer.client, a
+reader thread per connection parses responses and enforces deadlines,
+and the thread that finds the write queue idle writes everything queued
+behind it in one go. The verbs are the same as doozer.client.Client's;
+the *_async ones return concurrent.futures.Future subclasses.
+"""
+import concurrent.futures
+import logging
+import os
+import select
+import selectors
+import socket
+import threading
+import time
+
+from .protocol import (
+    DEFAULT_RETRY_WAIT, DEFAULT_URI, ENTITY_VERBS, HEALTH_TIMEOUT, REQUEST_TIMEOUT,
+    BaseClient, BaseConnection, BaseWatch, ConnectError, ConnectionLost,
+    DecodeError, Entity, ResponseBuffer, Subscription, TooLate, pack_request,
+    parse_uri, response_exception, retry_wait, split_addr)
+
+
+def connect(uri=None, timeout=None, **kwargs):
+    """
+    Start a Doozer client connection
+
+    @param uri: str|None, Doozer URI
+    @param timeout: float|None, connection timeout in seconds (per address)
+    @param kwargs: further options for the Connection
+    """
+    uri = uri or os.environ.get("DOOZER_URI", DEFAULT_URI)
+    addrs = parse_uri(uri)
+    if not addrs:
+        raise ValueError("there were no addrs supplied in the uri (%s)" % uri)
+    return Client(addrs, timeout, **kwargs)
+
+
+class PendingRequest(concurrent.futures.Future):
+    """
+    The concurrent.futures counterpart of doozer.client.PendingRequest.
+
+    result() returns the Response (an Entity for ENTITY_VERBS), or
+    raises the ResponseError matching its err_code.
+    """
+
+    def __init__(self, connection, request, packet, retry=True, timeout=None):
+        concurrent.futures.Future.__init__(self)
+        self.connection = connection
+        self.request = request
+        self.packet = packet
+        self.retry = retry
+        """Whether to resend the request if the connection is replaced"""
+        self.timeout = timeout
+
+    def resolve(self, response):
+        exception = response_exception(response)
+        try:
+            if exception:
+                self.set_exception(exception(response, self.request))
+            elif self.request.verb in ENTITY_VERBS:
+                self.set_result(Entity.from_response(response, self.request))
+            else:
+                self.set_result(response)
+        except concurrent.futures.InvalidStateError:
+            # Cancelled by another thread meanwhile
+            pass
+
+    def discard(self):
+        """Stop waiting for the response; a late one is ignored"""
+        self.connection.discard(self)
+
+    def cancel(self):
+        """
+        Stop waiting for the response and make result() raise
+        CancelledError. doozerd still carries the request out.
+        """
+        self.discard()
+        return concurrent.futures.Future.cancel(self)
+
+
+class Connection(BaseConnection):
+    def __init__(self, addrs=None, timeout=None, metrics=None, shuffle=True,
+                 health_timeout=HEALTH_TIMEOUT):
+        """
+        @param timeout: float|None, connection timeout in seconds (per address)
+        @param metrics: doozer.metrics.Metrics|None, where to record
+            retransmits, lost requests and update() retries
+        @param shuffle: bool, randomize the order addrs are tried in
+        @param health_timeout: float|None, as for doozer.client.Connection
+        """
+        self._logger = logging.getLogger('pydoozer.threaded.Connection')
+        BaseConnection.__init__(self, addrs, timeout, metrics, shuffle, health_timeout)
+
+        self.lock = threading.Lock()
+        """Guards pending, next_tag, outgoing, deadlines, sock and address"""
+        self.writing = False
+        """Whether a thread is writing the queue out"""
+        self.sock = None
+
+        self.reader = None
+        self.closed = False
+        # Written to wake the reader up, e.g. for an earlier deadline;
+        # made by connect() and closed by disconnect()
+        self.wakeup = self.waker = None
+
+    def connect(self):
+        self.closed = False
+        if self.wakeup is None:
+            self.wakeup, self.waker = socket.socketpair()
+            self.wakeup.setblocking(False)
+        try:
+            sock = self._connect()
+        except ConnectError:
+            self._close_wakeup()
+            raise
+        self.reader = threading.Thread(target=self._read_loop, args=(sock,),
+                                       name='doozer-reader')
+        self.reader.daemon = True
+        self.reader.start()
+
+    def disconnect(self):
+        """
+        Close the connection and stop the reader; requests still in
+        flight fail with ConnectError.
+        """
+        self.closed = True
+        self._wake()
+        if self.reader and self.reader is not threading.current_thread():
+            self.reader.join()
+        self.reader = None
+        with self.lock:
+            sock, self.sock = self.sock, None
+            pending, self.pending = self.pending, {}
+            self.deadlines = []
+            self.address = None
+        if sock:
+            sock.close()
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectError("disconnected"))
+        self._close_wakeup()
+
+    def _close_wakeup(self):
+        wakeup, waker = self.wakeup, self.waker
+        self.wakeup = self.waker = None
+        for end in (wakeup, waker):
+            if end is not None:
+                end.close()
+
+    def _connect(self, failed=None):
+        """Connect to the first node that answers, backing off between rounds"""
+        for wait, addr in self._attempts(failed):
+            if wait:
+                if self.closed:
+                    break
+                self._sleep(wait)
+            host, port = split_addr(addr)
+            try:
+                sock = socket.create_connection((host, port), timeout=self.timeout)
+            except (OSError, socket.timeout) as e:
+                self._logger.info('Failed to connect to %s:%s (%s)', host, port, e)
+                continue
+            sock.settimeout(None)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.lock:
+                self.sock = sock
+                self.address = "%s:%s" % (host, port)
+                self.received = time.time()
+                lost = self._retransmit_pending()
+            for future in lost:
+                future.set_exception(ConnectionLost(future.request))
+            self._write()
+            return sock
+        raise ConnectError("disconnected")
+
+    def _sleep(self, seconds):
+        """Sleep in the reader, still timing requests out meanwhile"""
+        until = time.time() + seconds
+        while not self.closed:
+            now = time.time()
+            if now >= until:
+                return
+            timeout = self._expire()
+            wait = until - now if timeout is None else min(timeout, until - now)
+            select.select([self.wakeup], [], [], wait)
+            self._drain_wakeup()
+
+    def _read_loop(self, sock):
+        """Read responses until disconnect(), reconnecting as needed"""
+        while not self.closed:
+            if sock is not None:
+                self._read(sock)
+            if self.closed:
+                break
+            with self.lock:
+                failed = self.address
+                if self.sock is sock:
+                    self.sock = None
+            if sock is not None:
+                sock.close()
+            try:
+                sock = self._connect(failed)
+            except ConnectError as e:
+                self._logger.error('Could not reconnect (%s)', e)
+                # Nothing in flight will be answered now; keep trying
+                # for whatever is sent next.
+                with self.lock:
+                    pending, self.pending = self.pending, {}
+                for future in pending.values():
+                    future.set_exception(e)
+                sock = None
+                self._sleep(self.timeout or DEFAULT_RETRY_WAIT)
+
+    def _read(self, sock):
+        """
+        Dispatch responses from sock until it fails or must be replaced.
+        Reads are buffered the same way as doozer.client's _recv_loop().
+        """
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ)
+        selector.register(self.wakeup, selectors.EVENT_READ)
+        buffer = ResponseBuffer()
+        check_at = time.time() + (self.health_timeout or 0) / 2.0
+        try:
+            while not self.closed:
+                timeout = self._expire()
+                if self.health_timeout:
+                    now = time.time()
+                    if now >= check_at:
+                        check_at = now + self.health_timeout / 2.0
+                        if not self._check_health(now):
+                            self._logger.warning('%s stopped responding, reconnecting',
+                                                 self.address)
+                            return
+                    timeout = check_at - now if timeout is None else min(timeout, check_at - now)
+                for key, events in selector.select(timeout):
+                    if key.fileobj is self.wakeup:
+                        self._drain_wakeup()
+                        continue
+
+                    buffer.recv_from(sock)
+                    self.received = time.time()
+                    for response, length in buffer.responses():
+                        with self.lock:
+                            future = self.pending.pop(response.tag, None)
+                        if future is not None:
+                            future.resolve(response)
+        except DecodeError as e:
+            self._logger.warning('Got invalid packet from server (%s)', e)
+        except OSError as e:
+            if not self.closed:
+                self._logger.warning('Lost connection? (%s)', e)
+        finally:
+            selector.close()
+
+    def _wake(self):
+        waker = self.waker
+        if waker is None:
+            return
+        try:
+            waker.send(b'\0')
+        except OSError:
+            pass
+
+    def _drain_wakeup(self):
+        wakeup = self.wakeup
+        if wakeup is None:
+            return
+        try:
+            while wakeup.recv(4096):
+                pass
+        except OSError:
+            pass
+
+    def send(self, request, retry=True, timeout=REQUEST_TIMEOUT):
+        """
+        Send a request and block until its response arrives.
+
+        @param request: Request, request to send
+        @param retry: bool, resend the request if the connection is
+            replaced before it's answered
+        @param timeout: float|None, seconds to wait for the response
+        """
+        return self.result(self.send_async(request, retry, timeout))
+
+    def send_async(self, request, retry=True, timeout=None):
+        """
+        Send a request without waiting for its response; safe to call
+        from any thread.
+
+        Returns a PendingRequest. If no response has arrived after
+        `timeout` seconds it fails with concurrent.futures.TimeoutError,
+        leaving the connection alone; see
+        doozer.client.Connection.send_async().
+
+        @param request: Request, request to send
+        @param retry: bool, resend the request if the connection is
+            replaced before it's answered
+        @param timeout: float|None, seconds to wait for the response
+            (default: no limit)
+        """
+        with self.lock:
+            request.tag = self._allocate_tag()
+            packet = pack_request(request)
+            future = self.pending[request.tag] = PendingRequest(self, request, packet,
+                                                                retry, timeout)
+            wake = False
+            if timeout is not None:
+                # The reader needs waking for a new earliest deadline
+                wake = self._push_deadline(future, time.time() + timeout)
+            self.outgoing.append(packet)
+            write = not self.writing
+            if write:
+                self.writing = True
+        if wake:
+            self._wake()
+        if write:
+            self._write(claimed=True)
+        return future
+
+    def _expire(self):
+        """
+        Time out every request past its deadline; returns the seconds
+        until the next deadline, None if there is none.
+        """
+        now = time.time()
+        with self.lock:
+            expired = self._pop_expired(now)
+            deadlines = self.deadlines
+            timeout = max(0, deadlines[0][0] - now) if deadlines else None
+        for future in expired:
+            try:
+                future.set_exception(concurrent.futures.TimeoutError())
+            except concurrent.futures.InvalidStateError:
+                pass
+        return timeout
+
+    def result(self, future):
+        """
+        Wait for the response to a request sent with send_async().
+
+        @param future: PendingRequest, as returned by send_async()
+        """
+        try:
+            # Timeouts are enforced by the reader's deadlines
+            return future.result()
+        finally:
+            future.discard()
+
+    def discard(self, future):
+        """
+        As doozer.client.Connection.discard().
+
+        @param future: PendingRequest, as returned by send_async()
+        """
+        with self.lock:
+            if self.pending.get(future.request.tag) is future:
+                del self.pending[future.request.tag]
+
+    def _write(self, claimed=False):
+        """
+        Write out the queue until it's empty.
+
+        Only one thread writes at a time; requests queued while it does
+        go out with its next write, so a burst from many threads costs
+        a few syscalls rather than one each.
+
+        @param claimed: bool, the caller already set self.writing
+        """
+        with self.lock:
+            if not claimed:
+                if self.writing:
+                    return
+                self.writing = True
+        try:
+            while True:
+                with self.lock:
+                    sock = self.sock
+                    if not self.outgoing or sock is None:
+                        self.writing = False
+                        return
+                    packets, self.outgoing = self.outgoing, []
+                try:
+                    sock.sendall(b''.join(packets))
+                except OSError as e:
+                    self._logger.warning('Error sending packets (%s)', e)
+                    # The reader notices and reconnects, which resends
+                    # everything pending, including these packets.
+                    with self.lock:
+                        if self.sock is sock:
+                            self.sock = None
+                    try:
+                        sock.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+        except BaseException:
+            with self.lock:
+                self.writing = False
+            raise
+
+
+class Watch(BaseWatch):
+    """
+    A WAIT chain on one glob, fanned out to its subscribers by a thread
+    of its own; see doozer.client.Watch.
+    """
+
+    def __init__(self, client, glob, rev):
+        self._logger = logging.getLogger('pydoozer.threaded.Watch')
+        BaseWatch.__init__(self, client, glob, rev)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._loop, name='doozer-watch')
+        self.thread.daemon = True
+
+    def unsubscribe(self, subscription):
+        with self.client.lock:
+            BaseWatch.unsubscribe(self, subscription)
+
+    def stop(self):
+        with self.client.lock:
+            self._unregister()
+        self.stopped.set()
+        future = self.future
+        if future is not None:
+            future.cancel()
+
+    def _loop(self):
+        wait = None
+        try:
+            while self.subscribers and not self.stopped.is_set():
+                try:
+                    change = self._next()
+                except Exception as e:
+                    if self.stopped.is_set():
+                        break
+                    # Sent again from the same rev, as in doozer.client.Watch
+                    base = self.client.connection.timeout or DEFAULT_RETRY_WAIT
+                    wait = retry_wait(base, wait or base)
+                    self._logger.warning('Error watching %s (%s), retrying in %.1fs',
+                                         self.glob, e, wait)
+                    self.stopped.wait(wait)
+                    continue
+                wait = None
+                if change is not None:
+                    self._deliver(change)
+        finally:
+            self.stop()
+
+    def _next(self):
+        """As doozer.client.Watch._next()"""
+        future = self.future = self.client.wait_async(self.glob, self.rev)
+        if self.stopped.is_set():
+            # stop() may have missed it
+            future.cancel()
+        try:
+            return self.client._result(future)
+        except TooLate as e:
+            self._skipped(e, self.client.rev().rev)
+            return None
+
+
+class Client(BaseClient):
+    """
+    The verbs of doozer.client.Client, callable from any thread.
+    """
+
+    def __init__(self, addrs=None, timeout=None, **kwargs):
+        """
+        @param timeout: float|None, connection timeout in seconds (per address)
+        @param kwargs: further options for the Connection
+        """
+        if addrs is None:
+            addrs = []
+        self.connection = Connection(addrs, timeout, **kwargs)
+        self.metrics = self.connection.metrics
+        self.watches = {}
+        """Shared WAIT chains: glob -> Watch"""
+        self.lock = threading.RLock()
+        """Guards watches and their subscribers"""
+        self.connect()
+
+    def _send(self, request, retry=True, timeout=REQUEST_TIMEOUT):
+        return self.connection.send_async(request, retry, timeout)
+
+    def _result(self, future):
+        return future.connection.result(future)
+
+    def watch(self, path, rev=None, callback=None, errback=None):
+        """
+        Subscribe to changes matching a glob, as doozer.client.Client.watch().
+
+        The callbacks run on the Watch's own thread, one change at a
+        time in revision order.
+
+        @return: Subscription, call cancel() on it to unsubscribe
+        """
+        if rev is None:
+            rev = self.rev().rev + 1
+        with self.lock:
+            watch = self.watches.get(path)
+            if watch is None:
+                watch = self.watches[path] = Watch(self, path, rev)
+            elif rev < watch.rev:
+                # Replays the backlog on a chain of its own
+                watch = Watch(self, path, rev)
+            subscription = Subscription(watch, rev, callback, errback)
+            watch.subscribers.append(subscription)
+            if watch.thread.ident is None:
+                watch.thread.start()
+        return subscription
+
+    def disconnect(self):
+        """Close the connection; every watch stops"""
+        with self.lock:
+            watches = list(self.watches.values())
+        for watch in watches:
+            watch.stop()
+        self.connection.disconnect()
+
+    def connect(self):
+        self.connection.connect()
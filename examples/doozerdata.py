@@ -6,7 +6,6 @@ import doozer
 import gevent
 
 from doozer.client import RevMismatch, TooLate, NoEntity, BadPath
-from gevent import Timeout
 
 class DoozerData():
     """
@@ -30,7 +29,7 @@ class DoozerData():
         self.callback = callback
 
         #load existing values.
-        walk = client.walk('%s/**' % path)
+        walk = client.iwalk('%s/**' % path)
         for file in walk:
             self.revisions[self.key_path(file.path)] = file.rev
 
@@ -50,18 +49,10 @@ class DoozerData():
         rev =  self.client.rev().rev
 
         def watchjob(rev):
-            change = None
-
             while True:
-                try:
-                    change = self.client.wait("%s/**" % self._folder, rev)
-                except Timeout:
-                    rev = self.client.rev().rev
-                    change = None
-
-                if change:
-                    self._handle_change(change)
-                    rev = change.rev+1
+                change = self.client.wait("%s/**" % self._folder, rev)
+                self._handle_change(change)
+                rev = change.rev+1
                 #print '.....', rev
 
         self.watchjob = gevent.spawn(watchjob, rev)
@@ -173,16 +164,19 @@ class DoozerData():
     def delete_all(self):
         """ clear all data.
         """
-        for path, rev, value in self.items():
-            try:
-                item = self.client.delete(self.folder(path), rev)
-            except RevMismatch:
-                item = self.client.delete(self.folder(path))
-                print 'value changed meanwhile!!', item.path, item.value
-            except TooLate:
+        items = list(self.items())
+        errors = self.client.delete_many(
+            [(self.folder(path), rev) for path, rev, value in items])
+        retry = []
+        for (path, rev, value), error in zip(items, errors):
+            if isinstance(error, RevMismatch):
+                print 'value changed meanwhile!!', path
+                retry.append((self.folder(path), -1))
+            elif isinstance(error, TooLate):
                 print 'too late..'
-                rev = self.client.rev().rev
-                item = self.client.delete(self.folder(path), rev)
+                retry.append((self.folder(path), -1))
+        if retry:
+            self.client.delete_many(retry)
 
     def items(self):
         """
@@ -195,9 +189,10 @@ class DoozerData():
             print 'we are empty'
             folder = []
 
-        for thing in folder:
-            item = self.client.get(self.folder(thing.path))
-            yield (thing.path, item.rev, item.value)
+        paths = [thing.path for thing in folder]
+        items = self.client.get_many([self.folder(path) for path in paths])
+        for path, item in zip(paths, items):
+            yield (path, item.rev, item.value)
 
 
 def print_change(change, path=None, destroy=True):
@@ -6,23 +6,13 @@ sys.path.append(os.path.dirname(__file__) + "/..")
 import gevent
 import doozer
 
-from gevent import Timeout
-
 client = doozer.connect()
 rev = client.rev().rev
 
-def watch_test(rev):
-    while True:
-        try:
-            change = client.wait("/watch", rev)
-            print change.rev, change.value
-            rev = change.rev+1
-        except Timeout, t:
-            print t
-            rev = client.rev().rev
-            change = None
+def print_change(change):
+    print change.rev, change.value
 
-watch_job = gevent.spawn(watch_test, rev+1)
+subscription = client.watch("/watch", rev+1, print_change)
 
 for i in range(10):
     gevent.sleep(1)
@@ -40,5 +30,5 @@ print "Deleted /watch"
 foo = client.get("/watch")
 print foo
 
+subscription.cancel()
 client.disconnect()
-watch_job.kill()
@@ -7,8 +7,6 @@ import gevent
 import doozer
 import simplejson
 
-from gevent import Timeout
-
 client = doozer.connect()
 
 #clean out the foo dir.
@@ -20,15 +18,9 @@ rev = client.set("/foo/bar", "test", 0).rev
 
 def watch_test(rev):
     while True:
-        try:
-            change = client.wait("/foo/**", rev )
-            print "saw change at %s with %s" % ( change.rev, change.value)
-            rev = change.rev+1
-        except Timeout, t:
-            change = None
-            print t
-            rev = client.rev().rev
-            #rev =+1
+        change = client.wait("/foo/**", rev )
+        print "saw change at %s with %s" % ( change.rev, change.value)
+        rev = change.rev+1
 
 #spawn the process that watches the foo dir for changes.
 watch_job = gevent.spawn(watch_test, rev+1)
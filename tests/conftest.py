@@ -0,0 +1,88 @@
+import queue
+import threading
+
+import gevent
+import pytest
+
+from doozer import client, fakeserver
+
+
+class ClusterThread(object):
+    """
+    A fakeserver.Cluster served from a thread of its own, for clients
+    that don't run on gevent. call() runs a function on the cluster's
+    thread, e.g. to stop or start its nodes.
+    """
+
+    def __init__(self, nodes=3, **kwargs):
+        self.calls = queue.Queue()
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self._serve, args=(nodes, kwargs))
+        self.thread.daemon = True
+        self.thread.start()
+        self.ready.wait()
+
+    @property
+    def addrs(self):
+        return self.cluster.addrs
+
+    def call(self, fn, *args):
+        done = threading.Event()
+        result = []
+        self.calls.put((fn, args, result, done))
+        done.wait()
+        if isinstance(result[0], BaseException):
+            raise result[0]
+        return result[0]
+
+    def stop(self):
+        self.calls.put(None)
+        self.thread.join()
+
+    def _serve(self, nodes, kwargs):
+        self.cluster = fakeserver.Cluster(nodes, **kwargs)
+        self.ready.set()
+        while True:
+            try:
+                call = self.calls.get_nowait()
+            except queue.Empty:
+                gevent.sleep(0.002)
+                continue
+            if call is None:
+                break
+            fn, args, result, done = call
+            try:
+                result.append(fn(*args))
+            except BaseException as e:
+                result.append(e)
+            done.set()
+        self.cluster.stop()
+
+
+def restart(cluster):
+    """Stop every node of a Cluster, then start them on the same ports"""
+    for node in cluster.nodes:
+        node.stop()
+    for node in cluster.nodes:
+        node.start()
+
+
+@pytest.fixture
+def cluster():
+    cluster = fakeserver.Cluster(3)
+    yield cluster
+    cluster.stop()
+
+
+@pytest.fixture
+def cluster_thread():
+    cluster = ClusterThread(3)
+    yield cluster
+    cluster.stop()
+
+
+@pytest.fixture
+def doozer(cluster):
+    c = client.Client(cluster.addrs)
+    yield c
+    c.disconnect()
@@ -0,0 +1,169 @@
+import asyncio
+
+import pytest
+
+from doozer import aio
+from doozer.protocol import NoEntity, RevMismatch
+
+from conftest import restart
+
+
+def run(cluster_thread, test, **kwargs):
+    async def main():
+        c = aio.Client(list(cluster_thread.addrs), **kwargs)
+        await c.connect()
+        try:
+            await test(c)
+        finally:
+            c.disconnect()
+    asyncio.run(main())
+
+
+def node(cluster_thread, address):
+    return [n for n in cluster_thread.cluster.nodes if n.address == address][0]
+
+
+def test_verbs(cluster_thread):
+    async def test(c):
+        rev = (await c.set('/a/b', b'1', 0)).rev
+        entity = await c.get('/a/b')
+        assert (entity.value, entity.rev) == (b'1', rev)
+        with pytest.raises(RevMismatch):
+            await c.set('/a/b', b'2', 0)
+        await c.set('/a/c', b'3', 0)
+        assert sorted(e.path for e in await c.getdir('/a')) == ['b', 'c']
+        assert [e.path for e in await c.walk('/a/*')] == ['/a/b', '/a/c']
+        assert [e.path async for e in c.iwalk('/a/*', window=1)] == ['/a/b', '/a/c']
+        assert (await c.stat('/a', None)).rev == -2
+        await c.delete('/a/b', rev)
+        with pytest.raises(NoEntity):
+            await c.getdir('/missing')
+
+    run(cluster_thread, test)
+
+
+def test_pipelined(cluster_thread):
+    async def test(c):
+        revs = await asyncio.gather(*[c.set('/t/%03d' % i, b'%d' % i, 0)
+                                      for i in range(200)])
+        assert len(set(r.rev for r in revs)) == 200
+        assert len(await c.walk('/t/*')) == 200
+        entities = await c.get_many(['/t/%03d' % i for i in range(200)])
+        assert [e.value for e in entities] == [b'%d' % i for i in range(200)]
+        assert len(await c.set_many([('/t/%03d' % i, b'x', -1) for i in range(10)])) == 10
+        await c.delete_many([('/t/%03d' % i, -1) for i in range(200)])
+        assert not c.connection.pending
+
+    run(cluster_thread, test)
+
+
+def test_timeout_and_cancel(cluster_thread):
+    async def test(c):
+        rev = (await c.rev()).rev
+        address = c.connection.address
+        with pytest.raises(asyncio.TimeoutError):
+            await c.wait('/never', rev + 1, timeout=0.05)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(c.wait('/never', rev + 1), 0.05)
+        future = c.wait('/never', rev + 1)
+        future.cancel()
+        assert not c.connection.pending
+        # A request's own timeout leaves the connection alone
+        assert c.connection.address == address
+
+        waiting = c.wait('/w', rev + 1)
+        await c.set('/w', b'z', 0)
+        assert (await waiting).value == b'z'
+
+    run(cluster_thread, test)
+
+
+def test_update(cluster_thread):
+    async def test(c):
+        async def bump():
+            for i in range(10):
+                await c.update('/n', lambda value: b'%d' % (int(value or 0) + 1))
+        await asyncio.gather(*[bump() for i in range(5)])
+        assert (await c.get('/n')).value == b'50'
+
+    run(cluster_thread, test)
+
+
+def test_failover(cluster_thread):
+    async def test(c):
+        await c.set('/a', b'1', 0)
+        current = node(cluster_thread, c.connection.address)
+        cluster_thread.call(setattr, current, 'latency', 0.1)
+        gets = [c.get('/a') for i in range(5)]
+        sets = [c.set('/s%d' % i, b'x', 0) for i in range(5)]
+        await asyncio.sleep(0.02)
+        cluster_thread.call(current.stop)
+
+        assert [e.value for e in await asyncio.gather(*gets)] == [b'1'] * 5
+        results = await asyncio.gather(*sets, return_exceptions=True)
+        assert all(isinstance(r, aio.ConnectionLost) for r in results)
+        assert c.connection.address != current.address
+
+    run(cluster_thread, test)
+
+
+def test_recovers_after_failed_reconnect(cluster_thread):
+    async def test(c):
+        await c.set('/a', b'1', 0)
+        cluster_thread.call(lambda: [node.stop() for node in cluster_thread.cluster.nodes])
+        c.connection.timeout = 0.01
+        with pytest.raises(aio.ConnectError):
+            await c.get('/a')
+
+        # Nothing is connected now; the next request reconnects
+        cluster_thread.call(restart, cluster_thread.cluster)
+        assert (await c.get('/a', timeout=3)).value == b'1'
+
+    run(cluster_thread, test)
+
+
+def test_watch(cluster_thread):
+    async def test(c):
+        rev = (await c.rev()).rev
+        first, second = [], []
+        one = await c.watch('/w/*', rev + 1, first.append)
+        two = await c.watch('/w/*', rev + 1, second.append)
+        assert len(c.watches) == 1
+        for i in range(5):
+            await c.set('/w/%d' % i, b'%d' % i, 0)
+        await asyncio.sleep(0.05)
+        assert [ch.path for ch in first] == ['/w/%d' % i for i in range(5)]
+        assert [ch.rev for ch in second] == [ch.rev for ch in first]
+
+        # A subscriber from an earlier rev replays the backlog
+        replay = []
+        three = await c.watch('/w/*', rev + 1, replay.append)
+        await asyncio.sleep(0.05)
+        assert [ch.rev for ch in replay] == [ch.rev for ch in first]
+
+        for subscription in (one, two, three):
+            subscription.cancel()
+        assert not c.watches
+        await asyncio.sleep(0.01)
+        assert not c.connection.pending
+
+    run(cluster_thread, test)
+
+
+def test_watch_survives_restart(cluster_thread):
+    async def test(c):
+        changes = []
+        await c.watch('/w', None, changes.append)
+        watch = c.watches['/w']
+        c.connection.timeout = 0.01
+        cluster_thread.call(lambda: [n.stop() for n in cluster_thread.cluster.nodes])
+        await asyncio.sleep(0.3)
+
+        cluster_thread.call(restart, cluster_thread.cluster)
+        rev = (await c.set('/w', b'1', 0, timeout=3)).rev
+        await asyncio.sleep(0.3)
+        assert [ch.rev for ch in changes] == [rev]
+        assert c.watches['/w'] is watch
+        assert not watch.task.done()
+
+    run(cluster_thread, test)
@@ -0,0 +1,92 @@
+import gevent
+import pytest
+
+from doozer import client, fakeserver
+from doozer.metrics import Metrics
+
+from conftest import restart
+
+
+def test_verbs(doozer):
+    rev = doozer.set('/a/b', b'1', 0).rev
+    assert doozer.get('/a/b').value == b'1'
+    assert doozer.get('/a/b').rev == rev
+    with pytest.raises(client.RevMismatch):
+        doozer.set('/a/b', b'2', 0)
+    doozer.set('/a/c', b'3', rev)
+    assert sorted(e.path for e in doozer.getdir('/a')) == ['b', 'c']
+    assert [e.path for e in doozer.walk('/a/*')] == ['/a/b', '/a/c']
+    doozer.delete('/a/b', rev)
+    with pytest.raises(client.NoEntity):
+        doozer.getdir('/missing')
+    assert doozer.get('/a/b').rev == 0
+
+
+def test_many(doozer):
+    revs = doozer.set_many([('/m/%d' % i, b'%d' % i, 0) for i in range(20)])
+    entities = doozer.get_many(['/m/%d' % i for i in range(20)])
+    assert [e.value for e in entities] == [b'%d' % i for i in range(20)]
+    assert [e.rev for e in entities] == revs
+
+
+def test_failover():
+    cluster = fakeserver.Cluster(3, latency=0.05)
+    metrics = Metrics()
+    c = client.Client(cluster.addrs, metrics=metrics)
+    try:
+        c.set('/a', b'1', 0)
+        node = [n for n in cluster.nodes if n.address == c.connection.address][0]
+        gets = [gevent.spawn(c.get, '/a') for i in range(5)]
+        sets = [gevent.spawn(c.set, '/s%d' % i, b'x', 0) for i in range(5)]
+        gevent.sleep(0.01)
+        node.stop()
+        gevent.joinall(gets + sets)
+
+        # Reads are retransmitted to another node
+        assert [g.value.value for g in gets] == [b'1'] * 5
+        assert c.connection.address != node.address
+        # A write that may have been applied isn't resent
+        assert all(isinstance(g.exception, client.ConnectionLost) for g in sets)
+        counters = dict((x['name'], x['value']) for x in metrics.snapshot()['counters'])
+        assert counters['retransmits'] >= 5
+        assert counters['lost'] == 5
+
+        assert c.get('/a').value == b'1'
+    finally:
+        c.disconnect()
+        cluster.stop()
+
+
+def test_own_deadline_keeps_connection(doozer, cluster):
+    doozer.set('/a', b'1', 0)
+    address = doozer.connection.address
+    for node in cluster.nodes:
+        node.latency = 0.1
+    write = gevent.spawn(doozer.set, '/b', b'2', 0)
+    with pytest.raises(gevent.Timeout):
+        doozer.get('/a', timeout=0.01)
+    # The deadline failed only the GET; the connection and the SET in
+    # flight on it are untouched
+    assert write.get().rev
+    assert doozer.connection.address == address
+
+
+def test_all_nodes_down(doozer, cluster):
+    cluster.stop()
+    doozer.connection.timeout = 0.01
+    with pytest.raises(client.ConnectError):
+        doozer.get('/a')
+
+
+def test_recovers_after_failed_reconnect(doozer, cluster):
+    doozer.set('/a', b'1', 0)
+    for node in cluster.nodes:
+        node.stop()
+    doozer.connection.timeout = 0.01
+    with pytest.raises(client.ConnectError):
+        doozer.get('/a')
+
+    # Nothing is connected now; the next request reconnects
+    restart(cluster)
+    assert doozer.get('/a', timeout=3).value == b'1'
+    assert doozer.set('/b', b'2', 0).rev
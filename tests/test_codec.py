@@ -0,0 +1,60 @@
+import pytest
+
+from doozer import codec
+from doozer.protocol import FLAG_SET
+
+
+def roundtrip(message):
+    parsed = type(message)()
+    parsed.ParseFromString(message.SerializeToString())
+    return parsed
+
+
+@pytest.mark.parametrize('fields', [
+    dict(tag=0, verb=codec.Request.REV),
+    dict(tag=7, verb=codec.Request.SET, path=u'/a/b', value=b'x' * 300, rev=0),
+    dict(tag=2 ** 31 - 1, verb=codec.Request.WALK, path=u'/**', offset=12, rev=2 ** 40),
+    dict(tag=3, verb=codec.Request.GET, path=u'/caf\xe9'),
+])
+def test_request_roundtrip(fields):
+    request = roundtrip(codec.Request(**fields))
+    for name in codec.Request.__slots__:
+        assert getattr(request, name) == fields.get(name)
+
+
+@pytest.mark.parametrize('fields', [
+    dict(tag=1, flags=FLAG_SET, rev=42, path=u'/a', value=b'v'),
+    dict(tag=2, rev=-2),
+    dict(tag=3, value=b'\x00' * 4096, len=4096),
+    dict(tag=4, err_code=codec.Response.NOENT, err_detail=u'/missing'),
+])
+def test_response_roundtrip(fields):
+    response = roundtrip(codec.Response(**fields))
+    for name, value in fields.items():
+        assert getattr(response, name) == value
+        assert response.HasField(name)
+    assert not response.HasField('len') or 'len' in fields
+
+
+def test_response_defaults():
+    response = roundtrip(codec.Response(tag=5))
+    assert (response.rev, response.value, response.err_code) == (0, b'', None)
+    assert not response.HasField('value')
+
+
+def test_truncated():
+    data = codec.Response(tag=1, value=b'abcdef').SerializeToString()
+    with pytest.raises(codec.DecodeError):
+        codec.Response().ParseFromString(data[:-2])
+
+
+def test_matches_protobuf():
+    from doozer import msg_pb2
+    request = codec.Request(tag=9, verb=codec.Request.SET, path=u'/p', value=b'v', rev=3)
+    expected = msg_pb2.Request(tag=9, verb=msg_pb2.Request.SET, path=u'/p', value=b'v', rev=3)
+    assert request.SerializeToString() == expected.SerializeToString()
+
+    pb = msg_pb2.Response(tag=9, flags=FLAG_SET, rev=3, path=u'/p', value=b'v')
+    response = codec.Response()
+    response.ParseFromString(pb.SerializeToString())
+    assert (response.tag, response.flags, response.rev, response.value) == (9, FLAG_SET, 3, b'v')
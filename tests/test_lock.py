@@ -0,0 +1,98 @@
+import time
+
+import gevent
+import pytest
+
+from doozer import client
+from doozer.lock import Lease, Lock
+
+
+def test_mutual_exclusion(cluster):
+    clients = [client.Client(cluster.addrs) for i in range(4)]
+    inside = []
+    overlaps = []
+
+    def work(c):
+        for i in range(3):
+            with Lock(c, '/locks/a'):
+                inside.append(c)
+                if len(inside) > 1:
+                    overlaps.append(list(inside))
+                gevent.sleep(0.005)
+                inside.remove(c)
+
+    try:
+        gevent.joinall([gevent.spawn(work, c) for c in clients], raise_error=True)
+        assert not overlaps
+    finally:
+        for c in clients:
+            c.disconnect()
+
+
+def test_fifo(doozer):
+    holder = Lock(doozer, '/locks/a')
+    holder.acquire()
+    order = []
+
+    def contend(i):
+        with Lock(doozer, '/locks/a'):
+            order.append(i)
+
+    waiters = []
+    for i in range(5):
+        waiters.append(gevent.spawn(contend, i))
+        gevent.sleep(0.01)
+    holder.release()
+    gevent.joinall(waiters, raise_error=True)
+    assert order == list(range(5))
+
+
+def test_timeout(doozer):
+    holder = Lock(doozer, '/locks/a')
+    holder.acquire()
+    other = Lock(doozer, '/locks/a')
+    assert not other.acquire(blocking=False)
+    start = time.time()
+    assert not other.acquire(timeout=0.1)
+    assert 0.1 <= time.time() - start < 1
+    # Giving up leaves nothing behind in the queue
+    assert len(doozer.getdir('/locks/a')) == 1
+    holder.release()
+    assert other.acquire(timeout=1)
+    other.release()
+
+
+def test_caller_timeout(doozer):
+    holder = Lock(doozer, '/locks/a')
+    holder.acquire()
+    with pytest.raises(gevent.Timeout):
+        with gevent.Timeout(0.1):
+            Lock(doozer, '/locks/a').acquire()
+    assert len(doozer.getdir('/locks/a')) == 1
+    holder.release()
+
+
+def test_lease_expires(doozer):
+    crashed = Lease(doozer, '/locks/a', ttl=0.3)
+    crashed.acquire()
+    # Stop renewing without releasing, as if the holder had died
+    crashed.renewer.kill()
+    crashed.renewer = None
+
+    lease = Lease(doozer, '/locks/a', ttl=0.3)
+    start = time.time()
+    assert lease.acquire(timeout=2)
+    assert 0.2 <= time.time() - start < 1
+    assert not crashed.renew()
+    assert crashed.lost.is_set()
+    lease.release()
+
+
+def test_lease_renewed(doozer):
+    holder = Lease(doozer, '/locks/a', ttl=0.2)
+    holder.acquire()
+    other = Lease(doozer, '/locks/a', ttl=0.2)
+    # Several ttls pass, but the holder keeps renewing
+    assert not other.acquire(timeout=0.6)
+    assert not holder.lost.is_set()
+    holder.release()
@@ -0,0 +1,85 @@
+import gc
+
+import gevent
+import pytest
+
+from doozer import client
+from doozer.metrics import Metrics
+
+
+def counters(metrics):
+    return dict(((c['name'], tuple(sorted(c['labels'].items()))), c['value'])
+                for c in metrics.snapshot()['counters'])
+
+
+def test_requests(cluster):
+    metrics = Metrics()
+    c = client.Client(cluster.addrs, metrics=metrics)
+    try:
+        c.set('/a', b'1', 0)
+        for i in range(10):
+            c.get('/a')
+        with pytest.raises(client.NoEntity):
+            c.getdir('/missing')
+        with pytest.raises(gevent.Timeout):
+            c.wait('/never', c.rev().rev + 1, timeout=0.01)
+        node = c.connection.address
+
+        seen = counters(metrics)
+        assert seen[('requests', (('node', node), ('verb', 'GET')))] == 10
+        assert seen[('requests', (('node', node), ('verb', 'SET')))] == 1
+        assert seen[('errors', (('error', 'NoEntity'), ('verb', 'GETDIR')))] == 1
+        assert seen[('timeouts', (('node', node), ('verb', 'WAIT')))] == 1
+        assert seen[('bytes_out', ())] > seen[('bytes_in', ())] > 0
+
+        latency = [h for h in metrics.snapshot()['histograms']
+                   if h['name'] == 'latency' and h['labels']['verb'] == 'GET']
+        assert latency[0]['count'] == 10
+        assert latency[0]['p50'] <= latency[0]['p99']
+    finally:
+        c.disconnect()
+
+
+def test_in_flight(cluster):
+    metrics = Metrics()
+    c = client.Client(cluster.addrs, metrics=metrics)
+    try:
+        futures = [c.wait_async('/never', c.rev().rev + 1) for i in range(3)]
+        assert metrics.snapshot()['gauges']['in_flight'] == 3
+        for future in futures:
+            future.cancel()
+        assert metrics.snapshot()['gauges']['in_flight'] == 0
+    finally:
+        c.disconnect()
+
+
+def test_connection_not_kept_alive(cluster):
+    metrics = Metrics()
+    for i in range(3):
+        c = client.Client(cluster.addrs, metrics=metrics)
+        # No timeout, so no deadline timer refers to the connection
+        c.get('/a', timeout=None)
+        c.disconnect()
+        del c
+        gevent.sleep(0)
+    gc.collect()
+    assert metrics.snapshot()['gauges']['in_flight'] == 0
+    assert metrics.gauges['in_flight'] == []
+
+
+def test_labels():
+    metrics = Metrics(prefix='test')
+    metrics.incr('requests', verb='GET', node=None)
+    metrics.incr('requests', verb='GET', node='127.0.0.1:1')
+    metrics.observe('latency', 0.003, verb='GET')
+    metrics.gauge('in_flight', lambda: 2)
+    # A None label is left out rather than breaking the sort
+    assert [c['labels'] for c in metrics.snapshot()['counters']] == [
+        {'node': '127.0.0.1:1', 'verb': 'GET'}, {'verb': 'GET'}]
+
+    text = metrics.prometheus()
+    assert '# TYPE test_requests_total counter' in text
+    assert 'test_requests_total{node="127.0.0.1:1",verb="GET"} 1' in text
+    assert 'test_latency_seconds_bucket{verb="GET",le="0.005"} 1' in text
+    assert 'test_latency_seconds_count{verb="GET"} 1' in text
+    assert 'test_in_flight 2' in text
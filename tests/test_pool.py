@@ -0,0 +1,122 @@
+import time
+
+import gevent
+import pytest
+
+from doozer import client
+from doozer.metrics import Metrics
+from doozer.pool import HEDGE_MIN_SAMPLES, LatencyWindow, PooledClient
+
+
+@pytest.fixture
+def pool(cluster):
+    c = PooledClient(cluster.addrs)
+    yield c
+    c.disconnect()
+
+
+def test_reads_spread(pool, cluster):
+    pool.set('/p', b'v', 0)
+    before = dict((node.address, node.requests) for node in cluster.nodes)
+    for i in range(90):
+        assert pool.get('/p').value == b'v'
+    reads = [node.requests - before[node.address] for node in cluster.nodes]
+    # Sequential reads tie on requests in flight; they mustn't all
+    # go to the primary
+    assert all(count >= 10 for count in reads), reads
+
+
+def test_slow_primary(pool, cluster):
+    pool.set('/p', b'v', 0)
+    primary = [n for n in cluster.nodes if n.address == pool.connection.address][0]
+    primary.latency = 0.05
+    latencies = []
+    for i in range(90):
+        start = time.time()
+        pool.get('/p')
+        latencies.append(time.time() - start)
+    # About a third of the reads go to the primary
+    assert sum(latencies) / len(latencies) < 0.03
+
+
+def test_read_your_writes(pool):
+    rev = pool.set('/p', b'1', 0).rev
+    assert pool.write_rev == rev
+    for i in range(10):
+        entity = pool.get('/p')
+        assert (entity.value, entity.rev) == (b'1', rev)
+
+    # A node not yet seen at the write's revision is read at it
+    pool.seen_rev.clear()
+    request = client.Request(verb=client.Request.GET, path='/p')
+    pool._pick(request)
+    assert request.rev == rev
+
+    pool.delete('/p', rev)
+    gevent.sleep(0.01)
+    assert pool.write_rev > rev
+    for i in range(10):
+        assert pool.get('/p').rev == 0
+
+
+def test_writes_go_to_primary(pool, cluster):
+    primary = [n for n in cluster.nodes if n.address == pool.connection.address][0]
+    before = primary.requests
+    revs = [pool.set('/w/%d' % i, b'x', 0).rev for i in range(10)]
+    assert revs == sorted(revs)
+    assert primary.requests - before >= 10
+
+
+def test_node_down(pool, cluster):
+    pool.set('/p', b'v', 0)
+    replica = [n for n in cluster.nodes if n.address != pool.connection.address][0]
+    replica.stop()
+    for i in range(20):
+        assert pool.get('/p').value == b'v'
+
+
+def test_latency_window():
+    window = LatencyWindow(0.9, size=HEDGE_MIN_SAMPLES)
+    for i in range(HEDGE_MIN_SAMPLES - 1):
+        window.add(i * 0.001)
+    assert window.threshold is None
+    window.add(0.5)
+    assert window.threshold == int(HEDGE_MIN_SAMPLES * 0.9) * 0.001
+
+
+def hedged_reads(cluster, budget):
+    metrics = Metrics()
+    pool = PooledClient(cluster.addrs, hedge_quantile=0.9, hedge_budget=budget,
+                        metrics=metrics)
+    try:
+        pool.set('/h', b'v', 0)
+        for i in range(2 * HEDGE_MIN_SAMPLES):
+            pool.get('/h')
+        replica = [n for n in cluster.nodes if n.address != pool.connection.address][0]
+        replica.latency = 0.2
+        latencies = []
+        for i in range(20):
+            start = time.time()
+            assert pool.get('/h').value == b'v'
+            latencies.append(time.time() - start)
+        counters = {}
+        for counter in metrics.snapshot()['counters']:
+            if counter['name'].startswith('hedge'):
+                # Summed over the nodes
+                counters[counter['name']] = counters.get(counter['name'], 0) + counter['value']
+        return max(latencies), counters
+    finally:
+        pool.disconnect()
+
+
+def test_hedging(cluster):
+    slowest, counters = hedged_reads(cluster, budget=1)
+    # Every read that went to the slow node was answered by another
+    assert slowest < 0.15
+    assert counters['hedges'] >= counters['hedge_wins'] > 0
+
+
+def test_hedge_budget(cluster):
+    slowest, counters = hedged_reads(cluster, budget=0)
+    assert slowest >= 0.2
+    assert not counters
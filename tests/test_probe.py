@@ -0,0 +1,65 @@
+import time
+
+import gevent
+
+from doozer import client, fakeserver
+
+
+def node(cluster, address):
+    return [n for n in cluster.nodes if n.address == address][0]
+
+
+def test_connects_to_fastest():
+    cluster = fakeserver.Cluster(3, latency=0.05)
+    fast = cluster.nodes[1]
+    fast.latency = 0
+    c = client.Client(cluster.addrs, probe_interval=10)
+    try:
+        assert c.connection.address == fast.address
+        assert c.connection.rtt[fast.address] < 0.05
+        assert all(rtt >= 0.05 for addr, rtt in c.connection.rtt.items()
+                   if addr != fast.address)
+    finally:
+        c.disconnect()
+        cluster.stop()
+
+
+def test_unreachable_node_last(cluster):
+    down = cluster.nodes[0]
+    down.stop()
+    c = client.Client(cluster.addrs, probe_interval=10)
+    try:
+        assert c.connection.rtt[down.address] == float('inf')
+        assert c.connection.address != down.address
+    finally:
+        c.disconnect()
+
+
+def test_migrates_off_slow_node(cluster):
+    c = client.Client(cluster.addrs, probe_interval=0.05, migrate_factor=3)
+    try:
+        c.set('/a', b'1', 0)
+        slow = node(cluster, c.connection.address)
+        slow.latency = 0.05
+        deadline = time.time() + 2
+        while c.connection.address in (slow.address, None):
+            assert time.time() < deadline, 'never moved off the slow node'
+            gevent.sleep(0.02)
+        assert c.get('/a').value == b'1'
+    finally:
+        c.disconnect()
+
+
+def test_no_migration_with_writes_in_flight(cluster):
+    c = client.Client(cluster.addrs, probe_interval=0.05, migrate_factor=3)
+    try:
+        slow = node(cluster, c.connection.address)
+        slow.latency = 0.3
+        # A SET in flight can't be resent, so the connection stays put
+        # until it has been answered
+        write = gevent.spawn(c.set, '/a', b'1', 0)
+        gevent.sleep(0.2)
+        assert c.connection.address == slow.address
+        assert write.get().rev
+    finally:
+        c.disconnect()
@@ -0,0 +1,142 @@
+import time
+
+import gevent
+
+from doozer import client, fakeserver
+from doozer.cache import Cache
+from doozer.mirror import Mirror
+
+from conftest import restart
+
+
+def caught_up(replica, rev, timeout=1):
+    deadline = time.time() + timeout
+    while replica.rev is None or replica.rev < rev:
+        assert time.time() < deadline, 'replica stuck at %s' % replica.rev
+        gevent.sleep(0.005)
+
+
+def test_cache_invalidation(doozer, cluster):
+    rev = doozer.set('/c/a', b'1', 0).rev
+    cache = Cache(doozer, '/c/**')
+    try:
+        assert cache.get('/c/a').value == b'1'
+        assert cache.get('/c/a').value == b'1'
+        assert cache.hits == 1
+        assert [e.path for e in cache.getdir('/c')] == ['a']
+
+        other = client.Client(cluster.addrs)
+        rev = other.set('/c/a', b'2', rev).rev
+        new = other.set('/c/b', b'3', 0).rev
+        other.disconnect()
+        caught_up(cache, new)
+        assert cache.get('/c/a').value == b'2'
+        assert cache.get('/c/a').rev == rev
+        assert sorted(e.path for e in cache.getdir('/c')) == ['a', 'b']
+    finally:
+        cache.stop()
+
+
+def test_cache_stop_discards_wait(doozer):
+    cache = Cache(doozer, '/c/**')
+    gevent.sleep(0.01)
+    cache.start()
+    cache.stop()
+    gevent.sleep(0.01)
+    assert not [f for f in doozer.connection.pending.values()]
+
+
+def test_mirror(doozer, cluster):
+    doozer.set('/m/a', b'1', 0)
+    doozer.set('/m/d/b', b'2', 0)
+    doozer.set('/other', b'x', 0)
+    mirror = Mirror(doozer, '/m/**')
+    try:
+        assert mirror.get('/m/a').value == b'1'
+        assert mirror.getdir('/m') == ['a', 'd']
+        assert mirror.get('/other') is None
+
+        other = client.Client(cluster.addrs)
+        other.delete('/m/a', -1)
+        rev = other.set('/m/d/c', b'3', 0).rev
+        other.disconnect()
+        caught_up(mirror, rev)
+        assert mirror.get('/m/a') is None
+        assert mirror.getdir('/m') == ['d']
+        assert [e.path for e in mirror.walk('/m/d/*')] == ['/m/d/b', '/m/d/c']
+    finally:
+        mirror.stop()
+    gevent.sleep(0.01)
+    assert not [f for f in doozer.connection.pending.values()]
+
+
+def test_cache_bypassed_while_watch_fails(doozer, cluster):
+    doozer.set('/c/a', b'1', 0)
+    cache = Cache(doozer, '/c/**')
+    try:
+        assert cache.get('/c/a').value == b'1'
+        doozer.connection.timeout = 0.01
+        for node in cluster.nodes:
+            node.stop()
+        deadline = time.time() + 2
+        while cache.rev is not None:
+            assert time.time() < deadline
+            gevent.sleep(0.01)
+        assert not cache.entries
+
+        restart(cluster)
+        other = client.Client(cluster.addrs)
+        rev = other.set('/c/a', b'2', -1).rev
+        other.disconnect()
+        # Read through rather than from the stale entry
+        assert cache.get('/c/a').value == b'2'
+        caught_up(cache, rev)
+        assert not cache.watcher.dead
+        hits = cache.hits
+        assert cache.get('/c/a').value == b'2'
+        assert cache.get('/c/a').value == b'2'
+        assert cache.hits == hits + 1
+    finally:
+        cache.stop()
+
+
+def test_mirror_survives_watch_errors(doozer, cluster):
+    doozer.set('/m/a', b'1', 0)
+    mirror = Mirror(doozer, '/m/**')
+    try:
+        doozer.connection.timeout = 0.01
+        for node in cluster.nodes:
+            node.stop()
+        deadline = time.time() + 2
+        while mirror.error is None:
+            assert time.time() < deadline
+            gevent.sleep(0.01)
+        assert mirror.get('/m/a').value == b'1'
+
+        restart(cluster)
+        rev = doozer.set('/m/b', b'2', 0).rev
+        caught_up(mirror, rev)
+        assert mirror.error is None
+        assert mirror.getdir('/m') == ['a', 'b']
+    finally:
+        mirror.stop()
+
+
+def test_mirror_resnapshots_when_too_late():
+    cluster = fakeserver.Cluster(1, history=3)
+    c = client.Client(cluster.addrs)
+    mirror = Mirror(c, '/m/**')
+    try:
+        c.set('/m/a', b'1', 0)
+        mirror.watcher.kill()
+        # Changes the mirror misses, until they are out of history
+        for i in range(10):
+            c.set('/m/n%d' % i, b'x', 0)
+        mirror.watcher = gevent.spawn(mirror._watch_loop)
+        rev = c.set('/m/z', b'z', 0).rev
+        caught_up(mirror, rev)
+        assert len(mirror.getdir('/m')) == 12
+    finally:
+        mirror.stop()
+        c.disconnect()
+        cluster.stop()
@@ -0,0 +1,43 @@
+import gevent
+
+from doozer import client
+from doozer.sequence import Sequence
+
+
+def test_unique(cluster):
+    clients = [client.Client(cluster.addrs) for i in range(3)]
+    sequences = [Sequence(c, '/seq', block=10, min_block=10) for c in clients for i in range(2)]
+
+    def draw(sequence):
+        ids = []
+        for i in range(200):
+            ids.append(next(sequence))
+            if i % 20 == 0:
+                gevent.sleep(0)
+        return ids
+
+    try:
+        drawn = [gevent.spawn(draw, s) for s in sequences]
+        gevent.joinall(drawn, raise_error=True)
+        ids = []
+        for greenlet in drawn:
+            # Increasing within each Sequence
+            assert greenlet.value == sorted(greenlet.value)
+            ids.extend(greenlet.value)
+        assert len(set(ids)) == len(ids) == 1200
+        assert min(ids) == 1
+    finally:
+        for c in clients:
+            c.disconnect()
+
+
+def test_block_growth(doozer):
+    sequence = Sequence(doozer, '/seq', block=100, min_block=100)
+    blocks = []
+    for i in range(5000):
+        next(sequence)
+        if sequence.block not in blocks:
+            blocks.append(sequence.block)
+    # A burst grows the block, but at most twofold per reservation
+    assert blocks[-1] > 100
+    assert all(b <= 2 * a for a, b in zip(blocks, blocks[1:]))
@@ -0,0 +1,160 @@
+import concurrent.futures
+import os
+import threading
+import time
+
+import pytest
+
+from doozer import threaded
+from doozer.protocol import NoEntity, RevMismatch, TooLate
+
+from conftest import ClusterThread, restart
+
+
+@pytest.fixture
+def c(cluster_thread):
+    c = threaded.Client(list(cluster_thread.addrs))
+    yield c
+    c.disconnect()
+
+
+def node(cluster_thread, address):
+    return [n for n in cluster_thread.cluster.nodes if n.address == address][0]
+
+
+def eventually(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def open_fds():
+    return len(os.listdir('/proc/self/fd'))
+
+
+def test_verbs(c):
+    rev = c.set('/a/b', b'1', 0).rev
+    entity = c.get('/a/b')
+    assert (entity.value, entity.rev) == (b'1', rev)
+    with pytest.raises(RevMismatch):
+        c.set('/a/b', b'2', 0)
+    c.set('/a/c', b'3', 0)
+    assert sorted(e.path for e in c.getdir('/a')) == ['b', 'c']
+    assert [e.path for e in c.walk('/a/*')] == ['/a/b', '/a/c']
+    assert c.stat('/a', None).rev == -2
+    c.delete('/a/b', rev)
+    with pytest.raises(NoEntity):
+        c.getdir('/missing')
+
+
+def test_threads(c):
+    def bump():
+        for i in range(10):
+            c.update('/n', lambda value: b'%d' % (int(value or 0) + 1))
+    threads = [threading.Thread(target=bump) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert c.get('/n').value == b'50'
+    assert not c.connection.pending
+
+
+def test_timeout_and_cancel(c):
+    rev = c.rev().rev
+    address = c.connection.address
+    with pytest.raises(concurrent.futures.TimeoutError):
+        c.wait('/never', rev + 1, timeout=0.05)
+    future = c.wait_async('/never', rev + 1)
+    future.cancel()
+    assert not c.connection.pending
+    # A request's own timeout leaves the connection alone
+    assert c.connection.address == address
+
+
+def test_failover(cluster_thread, c):
+    c.set('/a', b'1', 0)
+    current = node(cluster_thread, c.connection.address)
+    cluster_thread.call(setattr, current, 'latency', 0.1)
+    gets = [c.get_async('/a') for i in range(5)]
+    sets = [c.set_async('/s%d' % i, b'x', 0) for i in range(5)]
+    time.sleep(0.02)
+    cluster_thread.call(current.stop)
+
+    assert [c._result(f).value for f in gets] == [b'1'] * 5
+    for future in sets:
+        with pytest.raises(threaded.ConnectionLost):
+            c._result(future)
+    assert c.connection.address != current.address
+
+
+def test_watch(c):
+    rev = c.rev().rev
+    first, second = [], []
+    one = c.watch('/w/*', rev + 1, first.append)
+    two = c.watch('/w/*', rev + 1, second.append)
+    assert len(c.watches) == 1
+    for i in range(5):
+        c.set('/w/%d' % i, b'%d' % i, 0)
+    eventually(lambda: len(first) == 5 and len(second) == 5)
+    assert [ch.path for ch in first] == ['/w/%d' % i for i in range(5)]
+
+    watch = one.watch
+    one.cancel()
+    two.cancel()
+    assert not c.watches
+    watch.thread.join(1)
+    assert not watch.thread.is_alive()
+    assert not c.connection.pending
+
+
+def test_watch_survives_restart(cluster_thread, c):
+    changes = []
+    c.watch('/w', None, changes.append)
+    watch = c.watches['/w']
+    c.connection.timeout = 0.01
+    cluster_thread.call(lambda: [n.stop() for n in cluster_thread.cluster.nodes])
+    time.sleep(0.3)
+
+    cluster_thread.call(restart, cluster_thread.cluster)
+    eventually(lambda: c.connection.address is not None)
+    rev = c.set('/w', b'1', 0).rev
+    eventually(lambda: changes)
+    assert [ch.rev for ch in changes] == [rev]
+    assert c.watches['/w'] is watch
+
+
+def test_watch_gap_reported():
+    cluster = ClusterThread(1, history=5)
+    c = threaded.Client(list(cluster.addrs))
+    try:
+        start = c.set('/w', b'0', 0).rev
+        for i in range(10):
+            c.set('/x', b'%d' % i, -1)
+        changes, errors = [], []
+        c.watch('/w', start, changes.append, errors.append)
+        eventually(lambda: errors)
+        assert [type(e) for e in errors] == [TooLate]
+
+        rev = c.set('/w', b'1', start).rev
+        eventually(lambda: changes)
+        assert [ch.rev for ch in changes] == [rev]
+    finally:
+        c.disconnect()
+        cluster.stop()
+
+
+def test_disconnect_closes_sockets(cluster_thread):
+    c = threaded.Client(list(cluster_thread.addrs))
+    c.disconnect()
+    before = open_fds()
+    clients = []
+    for i in range(5):
+        c = threaded.Client(list(cluster_thread.addrs))
+        c.watch('/w', None, lambda change: None)
+        c.set('/a', b'%d' % i, -1)
+        c.disconnect()
+        clients.append(c)
+    # The fake nodes close their ends of the connections meanwhile
+    eventually(lambda: open_fds() <= before)
@@ -0,0 +1,105 @@
+import gevent
+import pytest
+
+from doozer import client
+from doozer.metrics import Metrics
+from doozer.protocol import UPDATE_BACKOFF, UPDATE_BACKOFF_MAX, Contention
+
+
+def counters(metrics):
+    return dict((c['name'], c['value']) for c in metrics.snapshot()['counters']
+                if not c['labels'])
+
+
+def increment(value):
+    return b'%d' % (int(value or 0) + 1)
+
+
+def test_creates(doozer):
+    seen = []
+
+    def fn(value):
+        seen.append(value)
+        return b'1'
+
+    rev = doozer.update('/n', fn)
+    assert seen == [None]
+    assert doozer.get('/n').rev == rev
+
+
+def test_contention(cluster):
+    metrics = Metrics()
+    c = client.Client(cluster.addrs, metrics=metrics)
+    try:
+        def bump():
+            for i in range(10):
+                c.update('/n', increment)
+        gevent.joinall([gevent.spawn(bump) for i in range(10)], raise_error=True)
+        assert c.get('/n').value == b'100'
+
+        seen = counters(metrics)
+        assert seen['updates'] == 100
+        assert seen['update_retries'] > 0
+        assert 'update_failures' not in seen
+        assert c.contention.paths['/n'] > 0
+    finally:
+        c.disconnect()
+
+
+def test_attempts_exhausted(cluster):
+    metrics = Metrics()
+    c = client.Client(cluster.addrs, metrics=metrics)
+    try:
+        c.set('/n', b'0', 0)
+        calls = []
+
+        def fn(value):
+            # Another writer gets in first every time
+            calls.append(value)
+            c.set('/n', b'other', -1)
+            return b'mine'
+
+        with pytest.raises(client.RevMismatch):
+            c.update('/n', fn, attempts=3)
+        assert len(calls) == 3
+        assert c.get('/n').value == b'other'
+
+        seen = counters(metrics)
+        assert seen['update_failures'] == 1
+        assert seen['update_retries'] == 2
+        assert 'updates' not in seen
+    finally:
+        c.disconnect()
+
+
+def test_stale_entity(doozer):
+    doozer.set('/n', b'1', 0)
+    stale = doozer.get('/n')
+    doozer.set('/n', b'5', stale.rev)
+    seen = []
+
+    def fn(value):
+        seen.append(value)
+        return increment(value)
+
+    doozer.update('/n', fn, entity=stale)
+    # The entity saves the first GET; the conflict makes it read again
+    assert seen == [b'1', b'5']
+    assert doozer.get('/n').value == b'6'
+
+
+def test_backoff_scales_with_contention():
+    contention = Contention()
+    for i in range(100):
+        assert 0 <= contention.backoff('/n', 1) <= UPDATE_BACKOFF
+        assert contention.backoff('/n', 30) <= UPDATE_BACKOFF_MAX
+
+    for i in range(20):
+        contention.record('/n', 4)
+    assert contention.paths['/n'] > 3
+    assert max(contention.backoff('/n', 1) for i in range(100)) > UPDATE_BACKOFF
+
+    # Uncontended updates bring it back down, then forget the path
+    for i in range(50):
+        contention.record('/n', 0)
+    assert '/n' not in contention.paths
@@ -0,0 +1,87 @@
+import gevent
+import pytest
+
+from doozer import client, fakeserver
+
+from conftest import restart
+
+
+def test_delivery(doozer):
+    rev = doozer.rev().rev
+    first, second = [], []
+    one = doozer.watch('/w/*', rev + 1, first.append)
+    two = doozer.watch('/w/*', rev + 1, second.append)
+    assert len(doozer.watches) == 1
+    for i in range(5):
+        doozer.set('/w/%d' % i, b'%d' % i, 0)
+    doozer.set('/other', b'x', 0)
+    gevent.sleep(0.05)
+    assert [c.path for c in first] == ['/w/%d' % i for i in range(5)]
+    assert [c.rev for c in second] == [c.rev for c in first]
+
+    one.cancel()
+    two.cancel()
+    assert not doozer.watches
+    gevent.sleep(0.01)
+    assert not doozer.connection.pending
+
+
+def test_replay(doozer):
+    first = doozer.set('/w/a', b'1', 0).rev
+    doozer.set('/w/a', b'2', first)
+    changes = []
+    doozer.watch('/w/a', first, changes.append)
+    gevent.sleep(0.05)
+    assert [c.value for c in changes] == [b'1', b'2']
+
+
+def test_survives_connect_error(doozer, cluster):
+    changes = []
+    doozer.watch('/w', None, changes.append)
+    watch = doozer.watches['/w']
+    doozer.connection.timeout = 0.01
+    for node in cluster.nodes:
+        node.stop()
+    gevent.sleep(0.3)
+
+    restart(cluster)
+    rev = doozer.set('/w', b'1', 0).rev
+    gevent.sleep(0.3)
+    assert [c.rev for c in changes] == [rev]
+    assert doozer.watches['/w'] is watch
+    assert not watch.loop.dead
+
+
+def test_dead_watch_unregistered(doozer):
+    doozer.watch('/w', None, lambda change: None)
+    watch = doozer.watches['/w']
+    gevent.sleep(0.01)
+    watch.loop.kill()
+    assert '/w' not in doozer.watches
+    changes = []
+    doozer.watch('/w', None, changes.append)
+    rev = doozer.set('/w', b'1', 0).rev
+    gevent.sleep(0.05)
+    assert [c.rev for c in changes] == [rev]
+
+
+def test_gap_reported():
+    cluster = fakeserver.Cluster(1, history=5)
+    c = client.Client(cluster.addrs)
+    try:
+        start = c.set('/w', b'0', 0).rev
+        for i in range(10):
+            c.set('/x', b'%d' % i, -1)
+        changes, errors = [], []
+        c.watch('/w', start, changes.append, errors.append)
+        gevent.sleep(0.05)
+        assert [type(e) for e in errors] == [client.TooLate]
+        assert not changes
+
+        # The chain goes on from the current revision
+        rev = c.set('/w', b'1', start).rev
+        gevent.sleep(0.05)
+        assert [ch.rev for ch in changes] == [rev]
+    finally:
+        c.disconnect()
+        cluster.stop()